@@ -7,11 +7,9 @@
 import requests       # I use this library to interact with Foldseek's web API and download files from RCSB or UniProt.
 import json           # I use this to process any API responses returned as JSON.
 import os             # I use this to check file paths and manipulate local directories.
-import sys            # I use sys.exit() to cleanly stop the script if anything goes wrong.
-from time import sleep  # I use sleep to wait between polling intervals during Foldseek job processing.
-import tarfile        # I use this to extract the Foldseek result archive.
-import tempfile       # I use this to safely extract Foldseek results without cluttering the working directory.
-import re             # I use this to extract UniProt accessions using regular expressions.
+from structure_cache import StructureCache, rcsb_url  # I reuse structures that any script already downloaded.
+from foldseek_archive import UNCHARACTERIZED, iter_archive_hits  # I use this to read hits straight from the archive.
+from foldseek_api import DEFAULT_DATABASES, FOLDSEEK_API_URL, FoldseekJobManager  # I use this to run the web API jobs.
 
 def download_pdb(pdb_id):
     # If the user inputs a UniProt ID instead of a PDB ID, I try to convert it.
@@ -24,110 +22,104 @@ def download_pdb(pdb_id):
                 pdb_id = data[pdb_id][0]['pdb_id']
                 print(f"Found associated PDB ID: {pdb_id}")
             else:
-                sys.exit(f"No PDB structure found for UniProt accession {pdb_id}.")
+                raise ValueError(f"No PDB structure found for UniProt accession {pdb_id}.")
         else:
-            sys.exit(f"Failed to retrieve PDB ID for UniProt accession {pdb_id}.")
-
-    # I download the actual PDB structure file from RCSB.
-    url = f'https://files.rcsb.org/download/{pdb_id}.pdb'
-    response = requests.get(url)
-    if response.status_code == 200:
-        pdb_filename = f'{pdb_id}.pdb'
-        with open(pdb_filename, 'w') as file:
-            file.write(response.text)
-        print(f"Downloaded PDB file: {pdb_filename}")
-        return pdb_filename
-    else:
-        sys.exit(f"Failed to download PDB file for {pdb_id}. Check if the ID is correct.")
-
-def extract_uncharacterized_entries(tar_path):
-    filtered_results = []  # I’ll collect uncharacterized protein lines here.
-    accessions = []        # I’ll also track the accession IDs for use as seeds.
-    with tempfile.TemporaryDirectory() as tempdir:
-        with tarfile.open(tar_path, 'r:gz') as tar:
-            tar.extractall(path=tempdir)  # I extract the entire archive into a safe temporary folder.
-            for root, dirs, files in os.walk(tempdir):
-                for name in files:
-                    if name.endswith(".m8"):
-                        filepath = os.path.join(root, name)
-                        with open(filepath, 'r') as f:
-                            for line in f:
-                                if "uncharacterized protein" in line.lower():
-                                    filtered_results.append(line.strip())
-                                    # I extract the UniProt accession from hits like AF-A0A0E9XQA6-F1-model_v4
-                                    match = re.search(r"AF-([A-Z0-9]+)-", line)
-                                    if match:
-                                        accessions.append(match.group(1))
-
-    output_txt = "uncharacterized_hits.txt"
+            raise ValueError(f"Failed to retrieve PDB ID for UniProt accession {pdb_id}.")
+
+    # I download the actual PDB structure file from RCSB, going through the shared structure cache.
+    cache = StructureCache()
+    try:
+        _, downloaded = cache.fetch(pdb_id.lower(), url=rcsb_url(pdb_id))
+    except requests.HTTPError:
+        raise ValueError(f"Failed to download PDB file for {pdb_id}. Check if the ID is correct.")
+    pdb_filename = f'{pdb_id}.pdb'
+    cache.materialize(pdb_id.lower(), pdb_filename)
+    print(f"{'Downloaded' if downloaded else 'Loaded cached'} PDB file: {pdb_filename}")
+    return pdb_filename
+
+def extract_uncharacterized_entries(tar_path, output_txt="uncharacterized_hits.txt",
+                                    seed_file="query_seed_accession.txt"):
+    # I stream the .m8 members straight out of the archive (no temp folder) and write each
+    # "uncharacterized protein" hit as soon as I see it. The seed is the first AlphaFold accession,
+    # from hits like AF-A0A0E9XQA6-F1-model_v4.
+    found = 0
+    seed_accession = None
     with open(output_txt, 'w') as out:
-        for hit in filtered_results:
-            out.write(hit + '\n')
+        for hit in iter_archive_hits(tar_path, UNCHARACTERIZED):
+            out.write(hit.line.strip() + '\n')
+            found += 1
+            if seed_accession is None and hit.accession:
+                seed_accession = hit.accession
     print(f"Filtered uncharacterized entries saved to {output_txt}")
-    print(f"Number of uncharacterized entries found: {len(filtered_results)}")
+    print(f"Number of uncharacterized entries found: {found}")
 
     # === Save the first accession ID to query_seed_accession.txt ===
-    if accessions:
-        seed_accession = accessions[0]
-        with open("query_seed_accession.txt", 'w') as seedfile:
+    if seed_accession:
+        with open(seed_file, 'w') as seedfile:
             seedfile.write(seed_accession)
-        print(f"✅ Seed UniProt accession saved to query_seed_accession.txt: {seed_accession}")
+        print(f"✅ Seed UniProt accession saved to {seed_file}: {seed_accession}")
     else:
         print("⚠️  Warning: No UniProt accessions extracted for seed.")
 
-def foldseek_apiquery(input_file, output_file):
-    # I scan all available databases, not just the defaults.
-    databases = ['afdb50', 'afdb-swissprot', 'afdb-proteome', 'mgnify_esm30', 'pdb100', 'gmgcl_id']
-
+def prepare_query(input_file, output_file):
     # If the input doesn't already end in .pdb, I assume it's a UniProt ID or PDB ID and try to download it.
     if not input_file.endswith('.pdb'):
         print(f"Detected PDB ID or UniProt Accession: {input_file}. Downloading from RCSB or UniProt...")
         input_file = download_pdb(input_file)
 
     if not os.path.exists(input_file):
-        sys.exit(f'File {input_file} not found.')
+        raise ValueError(f'File {input_file} not found.')
 
     # I make sure the output file ends with .tar.gz
     if not output_file.endswith('.tar.gz'):
         output_file += '.tar.gz'
+    return input_file, output_file
+
+def hit_files(output_file):
+    # Per-query names for batch runs: results_1ABC.tar.gz -> results_1ABC_uncharacterized_hits.txt, ...
+    base = output_file[:-len('.tar.gz')] if output_file.endswith('.tar.gz') else output_file
+    return f"{base}_uncharacterized_hits.txt", f"{base}_query_seed_accession.txt"
+
+def foldseek_batch_query(queries, mode="3diaa", state_path="foldseek_tickets.json", max_in_flight=4,
+                         base_url=FOLDSEEK_API_URL):
+    # queries maps an input (PDB ID, UniProt accession or .pdb path) to its output .tar.gz name.
+    # I scan all available databases, not just the defaults. Tickets are saved in state_path,
+    # so if I restart the script it keeps polling the jobs that are still running instead of resubmitting.
+    # A query that cannot be prepared (unknown ID, missing file, network error) is marked ERROR on its own.
+    jobs, results = {}, {}
+    for query, output_file in queries.items():
+        try:
+            jobs[query] = prepare_query(query, output_file)
+        except (ValueError, requests.RequestException) as error:
+            print(f"❌ {query}: {error}")
+            results[query] = {"status": "ERROR", "error": str(error)}
+    manager = FoldseekJobManager(base_url=base_url, databases=DEFAULT_DATABASES, mode=mode,
+                                 state_path=state_path, max_in_flight=max_in_flight)
+    results.update(manager.run(jobs))
+
+    # I extract uncharacterized entries from every archive that finished. A single query keeps the fixed
+    # uncharacterized_hits.txt / query_seed_accession.txt names; in a batch every query gets its own pair.
+    for query, job in results.items():
+        if job.get("status") == "DOWNLOADED":
+            if len(queries) == 1:
+                extract_uncharacterized_entries(job["output"])
+            else:
+                extract_uncharacterized_entries(job["output"], *hit_files(job["output"]))
+        else:
+            print(f"⚠️ {query}: job ended with status {job.get('status')}")
+    return results
 
-    # I read the input PDB contents into memory.
-    with open(input_file, 'r') as file:
-        pdb_data = file.read()
-
-    # I prompt the user for a Foldseek alignment mode (default is 3diaa).
-    mode = input("Enter alignment mode (3diaa or tmalign, default is 3diaa): ") or "3diaa"
-
-    # I submit the Foldseek search job.
-    response = requests.post('https://search.foldseek.com/api/ticket',
-                             data={'q': pdb_data, 'database[]': databases, 'mode': mode})
-    response_json = response.json()
-
-    if 'id' not in response_json:
-        sys.exit(f'Error submitting job: {response_json}')
-    ticket_id = response_json['id']
-
-    # I poll the server until the job is marked COMPLETE.
-    for _ in range(10):
-        status = requests.get(f'https://search.foldseek.com/api/ticket/{ticket_id}').json()
-        if status['status'] == "COMPLETE":
-            break
-        elif status['status'] == "ERROR":
-            sys.exit('Foldseek API returned an error.')
-        sleep(30)  # I wait 30 seconds between polls.
-
-    # I download the result archive once complete.
-    download = requests.get(f'https://search.foldseek.com/api/result/download/{ticket_id}', stream=True)
-    with open(output_file, 'wb') as fd:
-        for chunk in download.iter_content(chunk_size=128):
-            fd.write(chunk)
-    print(f'Results saved to {output_file}')
-
-    # I extract uncharacterized entries from the .tar.gz archive.
-    extract_uncharacterized_entries(output_file)
+def foldseek_apiquery(input_file, output_file, mode="3diaa"):
+    # Single-structure version of foldseek_batch_query (the alignment mode is 3diaa or tmalign).
+    return foldseek_batch_query({input_file: output_file}, mode=mode)
 
-# If this file is being run directly (not imported), I prompt the user for inputs and launch the pipeline.
+# If this file is being run directly (not imported), I read the inputs from the command line and launch the
+# pipeline, so it can run unattended (e.g. python 01_Working_FoldSeek_Search.py 1ABC results --mode tmalign).
 if __name__ == "__main__":
-    input_id = input("Enter a PDB ID, UniProt accession, or a local PDB file path: ")
-    output_file = input("Enter the output file name (will be saved as .tar.gz): ")
-    foldseek_apiquery(input_id, output_file)
+    import argparse
+    parser = argparse.ArgumentParser(description="Search the Foldseek web API and extract uncharacterized hits.")
+    parser.add_argument("input_id", help="a PDB ID, UniProt accession, or a local PDB file path")
+    parser.add_argument("output_file", help="the output file name (will be saved as .tar.gz)")
+    parser.add_argument("--mode", choices=["3diaa", "tmalign"], default="3diaa", help="alignment mode")
+    args = parser.parse_args()
+    foldseek_apiquery(args.input_id, args.output_file, mode=args.mode)
@@ -0,0 +1,195 @@
+# Script: af_downloader.py
+# Purpose: Download many AlphaFold / RCSB models in parallel, streaming straight to disk.
+
+# ======================= OVERVIEW ==========================
+# download.py used to walk the top hits one by one, keep each whole PDB in memory (response.text)
+# and collect results in a module-level list. This engine does the same job with a bounded pool
+# of worker threads:
+# - Bodies are streamed to "<model>.pdb.part" in 1 MiB chunks.
+# - If a .part file is left over from an interrupted run, I resume it with an HTTP Range request.
+# - A download only counts as finished when the byte count matches Content-Length (when the server
+#   sends one) and the file ends with an END/ENDMDL record. Otherwise I retry from where it stopped.
+#   I ask for unencoded bodies; a server that compresses anyway (Content-Encoding) reports the
+#   compressed length and ranges, so then only the END record counts and a partial file starts over.
+# - Finished files are moved into place with a rename and stored in the shared StructureCache,
+#   so models that are already cached never touch the network.
+# - download_models() returns one row per model (status, bytes, seconds, error) as a DataFrame.
+
+import os         # I use this for file sizes, renames and paths.
+import time       # I use this to time each download.
+from concurrent.futures import ThreadPoolExecutor  # I use this for the bounded worker pool.
+
+import pandas as pd  # I use this to return the per-model result table.
+import requests      # I use this for the HTTP downloads.
+
+from structure_cache import StructureCache, structure_url
+from uniprot_fetcher import make_session  # Same pooled keep-alive session setup as the UniProt fetcher.
+from instrumentation import count, event, timer  # Per-model results, bytes and retries go to the run log.
+
+CHUNK_SIZE = 1024 * 1024  # I write 1 MiB at a time.
+OK_STATUSES = {"downloaded", "cached", "exists"}
+RESULT_COLUMNS = ["model_id", "status", "path", "bytes", "seconds", "http_status", "attempts", "error"]
+
+
+def pdb_is_complete(path):
+    # A complete PDB/AlphaFold file ends with an END (or ENDMDL) record. I only read the tail.
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - 4096))
+            tail = f.read().decode('ascii', errors='ignore')
+    except FileNotFoundError:
+        return False
+    lines = [line for line in tail.splitlines() if line.strip()]
+    return bool(lines) and lines[-1].startswith(("END", "ENDMDL"))
+
+
+def expected_size(response, offset):
+    # I work out the final file size from Content-Range (206) or Content-Length (200), if given.
+    content_range = response.headers.get("Content-Range", "")
+    if response.status_code == 206 and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    if length is None or not length.isdigit():
+        return None
+    return int(length) + (offset if response.status_code == 206 else 0)
+
+
+def is_encoded(response):
+    # iter_content decodes gzip / deflate bodies, so their sizes no longer match the headers.
+    return response.headers.get("Content-Encoding", "identity").strip().lower() not in ("", "identity")
+
+
+def stream_to_part(session, url, part_path, chunk_size=CHUNK_SIZE, timeout=60):
+    # I download url into part_path, resuming from whatever is already there.
+    # Returns (http_status, expected_total_or_None).
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Accept-Encoding": "identity"}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 416:
+            # The server has nothing past our offset, so the .part file is already whole.
+            return 416, offset
+        response.raise_for_status()
+        encoded = is_encoded(response)
+        if encoded and response.status_code == 206:
+            # The range counts compressed bytes, so its decoded tail does not continue my file: start over.
+            response.close()
+            os.remove(part_path)
+            return stream_to_part(session, url, part_path, chunk_size, timeout)
+        total = None if encoded else expected_size(response, offset)
+        # If the server ignored the Range header it sends the whole body again, so I start over.
+        mode = 'ab' if response.status_code == 206 else 'wb'
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    f.write(chunk)
+        return response.status_code, total
+
+
+def download_model(session, model_id, output_folder, cache=None, url=None, max_attempts=3,
+                   chunk_size=CHUNK_SIZE, timeout=60):
+    # I make sure output_folder/<model_id>.pdb exists and is complete, and report how it got there.
+    start = time.perf_counter()
+    dest = os.path.join(output_folder, f"{model_id}.pdb")
+    part_path = dest + ".part"
+    result = {"model_id": model_id, "status": "failed", "path": dest, "bytes": 0, "seconds": 0.0,
+              "http_status": None, "attempts": 0, "error": ""}
+
+    def finish(status, error=""):
+        result["status"] = status
+        result["error"] = error
+        result["seconds"] = round(time.perf_counter() - start, 4)
+        if os.path.exists(dest):
+            result["bytes"] = os.path.getsize(dest)
+        count(f"alphafold.{status}")
+        if status == "downloaded":
+            count("alphafold.bytes", result["bytes"])
+        if result["attempts"] > 1:
+            count("alphafold.retries", result["attempts"] - 1)
+        event("download", **result)
+        return result
+
+    # 1) A complete plain file is already there: I just make sure the cache has it too.
+    if pdb_is_complete(dest):
+        if cache is not None and not cache.has(model_id):
+            cache.put_file(model_id, dest)
+        return finish("exists")
+
+    # 2) The cache already has it: no network needed.
+    if cache is not None and cache.has(model_id):
+        cache.materialize(model_id, dest)
+        return finish("cached")
+
+    url = url or structure_url(model_id)
+    if url is None:
+        return finish("failed", f"no download URL for {model_id}")
+
+    # 3) Stream it, resuming the .part file on every retry.
+    error = ""
+    for attempt in range(1, max_attempts + 1):
+        result["attempts"] = attempt
+        try:
+            status, total = stream_to_part(session, url, part_path, chunk_size, timeout)
+            result["http_status"] = status
+        except requests.HTTPError as e:
+            result["http_status"] = e.response.status_code
+            if e.response.status_code in (404, 410):
+                return finish("failed", f"HTTP {e.response.status_code}")
+            error = f"HTTP {e.response.status_code}"
+            continue
+        except requests.RequestException as e:
+            error = str(e)
+            continue
+
+        size = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if total is not None and size != total:
+            error = f"got {size} of {total} bytes"
+            continue
+        if not pdb_is_complete(part_path):
+            error = "missing END record"
+            if total is not None:
+                # The byte count matched but the file still looks truncated, so I start from scratch.
+                os.remove(part_path)
+            continue
+
+        os.replace(part_path, dest)
+        if cache is not None:
+            cache.put_file(model_id, dest)
+        return finish("downloaded")
+
+    return finish("incomplete" if os.path.exists(part_path) else "failed", error)
+
+
+def download_models(model_ids, output_folder, workers=16, cache=None, session=None, urls=None,
+                    max_attempts=3, chunk_size=CHUNK_SIZE):
+    # I download every model in model_ids with at most `workers` transfers at a time and return
+    # a DataFrame with one row per model, in the same order as model_ids.
+    os.makedirs(output_folder, exist_ok=True)
+    model_ids = list(dict.fromkeys(model_ids))
+    urls = urls or {}
+    cache = cache if cache is not None else StructureCache()
+    owns_session = session is None
+    if owns_session:
+        session = make_session(pool_size=workers)
+
+    try:
+        with timer("alphafold.download_models", models=len(model_ids)), ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(download_model, session, model_id, output_folder, cache,
+                                   urls.get(model_id), max_attempts, chunk_size)
+                       for model_id in model_ids]
+            rows = []
+            for future in futures:
+                row = future.result()
+                icon = "✅" if row["status"] in OK_STATUSES else "❌"
+                print(f"{icon} {row['model_id']}: {row['status']}"
+                      + (f" ({row['error']})" if row["error"] else ""))
+                rows.append(row)
+    finally:
+        if owns_session:
+            session.close()
+
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
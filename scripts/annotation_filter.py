@@ -0,0 +1,207 @@
+# Script: annotation_filter.py
+# Purpose: Screen hit descriptions and FASTA headers against many include / exclude terms in one pass.
+
+# ======================= OVERVIEW ==========================
+# Screening was spread over the scripts as one-off tests: "uncharacterized protein" in the web-server hits
+# (01_Working_FoldSeek_Search.py), "uncharacterized" in FASTA headers (filter.py), "AF-" target prefixes
+# (download.py). Every new term meant another pass over every line. Here a filter is built once from a list
+# of rules and compiled per side (include and exclude):
+# - a rule is a keyword (case-insensitive literal, optionally whole-word), a prefix (anchored at the start
+#   of the text) or a regex, and every rule has a name that ends up in the output,
+# - every rule also carries a lowercase literal that must occur in any text it matches. All literals of a
+#   side go into one Aho-Corasick automaton (pyahocorasick, if installed) or a tuple of substring tests,
+#   so most lines are rejected after one lowercase copy and a single scan, without touching the regex,
+# - lines that pass that screen are confirmed by one combined pattern with a named group per rule, and
+#   match.lastgroup tells me which rule it was, without trying the rules one by one,
+# - text passes when an include rule matches (or there are none) and no exclude rule does,
+# - the same filter runs over streamed lines (optionally on one tab-separated column), over pandas string
+#   columns (vectorized str.contains / str.extract), or as a FASTA header rule for fasta_partition.py.
+# Python's re is slow on long alternations of terms, which is why the literal screen runs first; a regex rule
+# without a literal simply turns the screen off for its side.
+
+import re  # I use this to compile the rules.
+from typing import NamedTuple
+
+import pandas as pd
+
+try:
+    import ahocorasick  # pyahocorasick: one pass over the text for any number of literals
+except ImportError:
+    ahocorasick = None
+
+
+class Rule(NamedTuple):
+    name: str
+    pattern: str   # a regex fragment; keyword() and prefix() build it from plain text
+    literal: str   # lowercase text every match contains, or None if there is none
+
+
+def keyword(text, name=None, whole_word=False, case_sensitive=False):
+    fragment = re.escape(text)
+    if whole_word:
+        fragment = rf"\b{fragment}\b"
+    if not case_sensitive:
+        fragment = f"(?i:{fragment})"
+    return Rule(name or text, fragment, text.lower())
+
+
+def prefix(text, name=None):
+    # Anchored at the start of the text (e.g. the target column of an .m8 line).
+    return Rule(name or f"{text}*", rf"\A{re.escape(text)}", text.lower())
+
+
+def non_capturing(pattern):
+    # I turn every plain "(" group into "(?:", so a rule adds no groups of its own: pandas warns about
+    # match groups in str.contains, and str.extract would return them as extra columns next to the
+    # named group of each rule. Escapes and character classes are copied as they are.
+    out, i, in_class = [], 0, False
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            out.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if in_class:
+            in_class = char != "]" or out[-1] == "[" or out[-1] == "[^"
+        elif char == "[":
+            in_class = True
+            if pattern[i + 1:i + 2] == "^":
+                char, i = "[^", i + 1
+        elif char == "(" and pattern[i + 1:i + 2] != "?":
+            char = "(?:"
+        out.append(char)
+        i += 1
+    return "".join(out)
+
+
+def regex(pattern, name=None, flags="", literal=None):
+    # flags are inline regex flags such as "i"; the pattern may not use named groups or backreferences,
+    # and its plain groups are made non-capturing.
+    # literal is text that every match contains (any case), which lets the fast screen skip the regex.
+    pattern = non_capturing(pattern)
+    return Rule(name or pattern, f"(?{flags}:{pattern})" if flags else f"(?:{pattern})",
+                literal.lower() if literal else None)
+
+
+def as_rule(item):
+    # Plain strings are case-insensitive keywords.
+    return item if isinstance(item, Rule) else keyword(item)
+
+
+def group_name(i):
+    return f"r{i}"
+
+
+def compile_rules(rules, named=True):
+    # One pattern with a named group per rule (or plain groups for yes / no tests), None when there are no rules.
+    if not rules:
+        return None
+    if not named:
+        return re.compile("|".join(f"(?:{rule.pattern})" for rule in rules))
+    return re.compile("|".join(f"(?P<{group_name(i)}>{rule.pattern})" for i, rule in enumerate(rules)))
+
+
+def literal_screen(rules):
+    # A function of the lowercased text that is False only when no rule can match, or None when some rule
+    # has no literal (then every text has to go to the regex).
+    if not rules or any(rule.literal is None for rule in rules):
+        return None
+    literals = tuple(dict.fromkeys(rule.literal for rule in rules))
+    if ahocorasick is not None and len(literals) > 4:
+        automaton = ahocorasick.Automaton()
+        for literal in literals:
+            automaton.add_word(literal, literal)
+        automaton.make_automaton()
+        return lambda low: next(automaton.iter(low), None) is not None
+
+    def screen(low):
+        for literal in literals:  # a plain loop is several times faster than any() over a generator here
+            if literal in low:
+                return True
+        return False
+    return screen
+
+
+class AnnotationFilter:
+    def __init__(self, include=(), exclude=()):
+        self.include = [as_rule(item) for item in include]
+        self.exclude = [as_rule(item) for item in exclude]
+        self.include_pattern = compile_rules(self.include)
+        self.exclude_pattern = compile_rules(self.exclude)
+        self.include_names = {group_name(i): rule.name for i, rule in enumerate(self.include)}
+        self.include_screen = literal_screen(self.include)
+        self.exclude_screen = literal_screen(self.exclude)
+
+    # === Single texts and streams ===
+    def match(self, text):
+        # The name of the include rule that matched (leftmost match), "" for a pass without include
+        # rules, or None when the text is filtered out.
+        low = text.lower() if self.include_screen or self.exclude_screen else None
+        if self.exclude_pattern is not None and (self.exclude_screen is None or self.exclude_screen(low)):
+            if self.exclude_pattern.search(text):
+                return None
+        if self.include_pattern is None:
+            return ""
+        if self.include_screen is not None and not self.include_screen(low):
+            return None
+        found = self.include_pattern.search(text)
+        return self.include_names[found.lastgroup] if found else None
+
+    def search(self, text):
+        # Same contract as a compiled pattern's .search, so a filter can stand in for one.
+        return True if self.match(text) is not None else None
+
+    def __call__(self, record):
+        # As a fasta_partition rule: screen the record's header.
+        return self.match(record.header) is not None
+
+    def filter_lines(self, lines, column=None, sep='\t'):
+        # I yield (rule name, line) for every passing line; column screens one field of each line only.
+        match = self.match
+        for line in lines:
+            if column is None:
+                text = line
+            else:
+                fields = line.split(sep, column + 1)
+                text = fields[column] if len(fields) > column else ""
+            rule = match(text)
+            if rule is not None:
+                yield rule, line
+
+    # === pandas ===
+    def mask(self, series):
+        # Vectorized: a boolean mask of the passing rows.
+        text = series.astype("string").fillna("")
+        keep = pd.Series(True, index=series.index)
+        if self.include:
+            keep &= text.str.contains(compile_rules(self.include, named=False), regex=True).astype(bool)
+        if self.exclude:
+            keep &= ~text.str.contains(compile_rules(self.exclude, named=False), regex=True).astype(bool)
+        return keep
+
+    def rules(self, series):
+        # Vectorized: the matching include rule per row (leftmost match), NA for rows filtered out.
+        keep = self.mask(series)
+        if self.include_pattern is None:
+            return pd.Series("", index=series.index, dtype="string").where(keep)
+        groups = series.astype("string").fillna("").str.extract(self.include_pattern)
+        matched = groups.notna()
+        names = matched.idxmax(axis=1).map(self.include_names)
+        return names.where(keep & matched.any(axis=1)).astype("string")
+
+
+# === Shared rule sets ===
+# What 01_Working_FoldSeek_Search.py and filter.py have always screened for.
+UNCHARACTERIZED_HIT = AnnotationFilter(include=["uncharacterized protein"])
+UNCHARACTERIZED_HEADER = AnnotationFilter(include=["uncharacterized"])
+# A wider net for proteins without a known function.
+UNKNOWN_FUNCTION_RULES = [
+    keyword("uncharacterized"),
+    keyword("hypothetical protein"),
+    keyword("putative", whole_word=True),
+    regex(r"\bDUF\d+", name="DUF", literal="DUF"),
+    keyword("domain of unknown function"),
+    keyword("unknown function"),
+]
+UNKNOWN_FUNCTION = AnnotationFilter(include=UNKNOWN_FUNCTION_RULES)
+ALPHAFOLD_TARGET = AnnotationFilter(include=[prefix("AF-", name="alphafold")])
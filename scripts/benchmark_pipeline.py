@@ -0,0 +1,360 @@
+# Script: benchmark_pipeline.py
+# Purpose: Time every pipeline stage on synthetic data at a chosen scale and keep a history of the results.
+
+# ======================= OVERVIEW ==========================
+# None of the pipeline scripts measured anything, so there was no way to tell which stage would break first
+# as the data grows. This harness runs the building blocks those scripts use on synthetic inputs
+# (synthetic_data.py) at any scale from 10^3 to 10^7 hits:
+# - m8_parse / m8_cached   reading .m8 tables (summarize.py), without and with the Parquet cache
+# - top_hits               streaming top-hit selection (download.py)
+# - hit_router             routing hits into category files (fasta_to_foldseek.py)
+# - results_store          loading the SQLite store and running the summary queries (summarize.py)
+# - fasta_partition        splitting a FASTA by header (filter.py)
+# - fasta_index            indexing a FASTA and pulling 10% of the records (download_fasta_from_uniprot.py)
+# - archive_scan           scanning a Foldseek web result archive (01_Working_FoldSeek_Search.py)
+# - structure_store        parsing PDB models into arrays (download.py)
+# - rerank                 Kabsch / TM-score re-ranking (download.py)
+# - af_download            AlphaFold downloads against the local mock server (download.py)
+# - uniprot_fetch          UniProt FASTA batches against the local mock server (download_fasta_from_uniprot.py)
+# Every stage runs in its own fresh process, so its peak RSS is its own. Each run appends one JSON line
+# per stage (wall time, items, throughput, peak RSS, commit) to benchmark_work/benchmark_history.jsonl,
+# and the table at the end compares each stage with its recent history at the same scale, so regressions
+# stand out.
+# foldseek createdb / easy-search need the real binary and databases, so they are not part of the suite.
+#
+# Example:  python benchmark_pipeline.py --scale 1000 100000 --stages m8_parse top_hits
+
+import argparse     # I use this for the command line.
+import contextlib   # I use this to silence the stages' progress prints.
+import datetime     # I use this to timestamp runs.
+import json         # I use this for the history file.
+import multiprocessing
+import os           # I use this for paths and sizes.
+import platform     # I use this to record where a run happened.
+import shutil       # I use this to give every stage a clean output folder.
+import statistics   # I use this to compare against the recent history.
+import subprocess   # I use this to record the git commit.
+import sys
+import time         # I use this to time the stages.
+import uuid         # I use this for run IDs.
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource  # Peak RSS; not available on Windows.
+except ImportError:
+    resource = None
+
+import numpy as np
+import pandas as pd
+
+import synthetic_data
+
+DEFAULT_WORKDIR = "benchmark_work"
+DEFAULT_HISTORY = os.path.join(DEFAULT_WORKDIR, "benchmark_history.jsonl")  # next to the data, out of git
+REGRESSION_TOLERANCE = 0.25  # 25% slower than the recent median counts as a regression
+HISTORY_WINDOW = 5
+
+
+# === Inputs ===
+def stage_sizes(scale):
+    # How big each kind of input is for a given number of hits.
+    return {
+        "hits": scale,
+        "fasta_records": max(100, scale // 10),
+        "archive_hits": max(100, scale // 5),
+        "models": min(500, max(10, scale // 1000)),
+        "downloads": min(500, max(10, scale // 1000)),
+        "accessions": min(5000, max(100, scale // 100)),
+    }
+
+
+def prepare_inputs(workdir, scale, seed=0):
+    # I generate the inputs for one scale once and reuse them on later runs with the same scale and seed.
+    sizes = stage_sizes(scale)
+    folder = os.path.join(workdir, f"data_{scale}_{seed}")
+    done_marker = os.path.join(folder, ".complete")
+    inputs = {
+        "folder": folder,
+        "m8_files": [os.path.join(folder, f"results_synthetic_{i}.m8") for i in range(3)],
+        "fasta": os.path.join(folder, "synthetic_proteins.fasta"),
+        "archive": os.path.join(folder, "synthetic_result.tar.gz"),
+        "pdb_folder": os.path.join(folder, "top_hit_structures"),
+        "store": os.path.join(folder, "structure_store"),
+        "rerank_hits": os.path.join(folder, "rerank_hits.csv"),
+        "download_ids": [synthetic_data.alphafold_model(acc)
+                         for acc in synthetic_data.make_accessions(sizes["downloads"], seed + 20)],
+        "accessions": synthetic_data.make_accessions(sizes["accessions"], seed + 30),
+        "sizes": sizes,
+    }
+    if os.path.exists(done_marker):
+        return inputs
+
+    print(f"🧪 Generating inputs for scale {scale} in {folder} ...")
+    os.makedirs(folder, exist_ok=True)
+    # Three .m8 files sharing the same queries, like the three AlphaFold databases in download.py.
+    n_queries = max(1, scale // 100)
+    for i, path in enumerate(inputs["m8_files"]):
+        synthetic_data.write_m8(path, scale // 3 + (1 if i < scale % 3 else 0), n_queries=n_queries, seed=seed)
+    synthetic_data.write_accession_lists(folder, synthetic_data.make_accessions(n_queries, seed), seed)
+    synthetic_data.write_fasta(inputs["fasta"], sizes["fasta_records"], seed=seed + 10)
+    synthetic_data.write_foldseek_archive(inputs["archive"], sizes["archive_hits"] // 5, seed=seed)
+
+    # Models for the structure stages, plus a hit table that pairs each model with a few others.
+    model_ids = [synthetic_data.alphafold_model(acc) for acc in synthetic_data.make_accessions(sizes["models"], seed + 40)]
+    synthetic_data.write_pdb_models(inputs["pdb_folder"], model_ids)
+    from structure_store import StructureStore
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        StructureStore(inputs["store"]).add_folder(inputs["pdb_folder"], workers=1)
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i, query in enumerate(model_ids):
+        for j in rng.choice(len(model_ids), min(5, len(model_ids)), replace=False):
+            length = int(rng.integers(40, 80))
+            rows.append((query, model_ids[j], float(rng.integers(50, 900)), 1, length, 1, length))
+    pd.DataFrame(rows, columns=["query", "target", "bitscore", "q_start", "q_end", "t_start", "t_end"]) \
+        .to_csv(inputs["rerank_hits"], index=False)
+
+    # The cached stage measures reading from a warm Parquet cache, so I build the caches now.
+    from m8_reader import read_m8
+    for path in inputs["m8_files"]:
+        read_m8(path)
+    open(done_marker, 'w').close()
+    return inputs
+
+
+def category_files(inputs):
+    folder = inputs["folder"]
+    return {"upregulated": os.path.join(folder, "upregulated_accessions.txt"),
+            "downregulated": os.path.join(folder, "downregulated_accessions.txt"),
+            "significant": os.path.join(folder, "all_significant_accessions.txt")}
+
+
+# === Stages ===
+# Each stage gets the inputs, a clean output folder and the mock server URL, and returns how many items it handled.
+def stage_m8_parse(inputs, out, base_url):
+    from m8_reader import read_m8_files
+    return len(read_m8_files(inputs["m8_files"], use_cache=False))
+
+
+def stage_m8_cached(inputs, out, base_url):
+    from m8_reader import read_m8_files
+    return len(read_m8_files(inputs["m8_files"], use_cache=True))
+
+
+def stage_top_hits(inputs, out, base_url):
+    from top_hits import select_top_hits
+    select_top_hits(inputs["m8_files"], k=1, evalue_cutoff=1e-2, target_prefix="AF-")
+    return inputs["sizes"]["hits"]
+
+
+def stage_hit_router(inputs, out, base_url):
+    from hit_router import HitRouter, load_categories
+    with HitRouter(out, load_categories(category_files(inputs))) as router:
+        for path in inputs["m8_files"]:
+            router.route_file(path)
+        return router.counts["all"]
+
+
+def stage_results_store(inputs, out, base_url):
+    from hit_router import load_categories
+    from results_store import ResultsStore
+    with ResultsStore(os.path.join(out, "results.sqlite")) as store:
+        store.load_categories(load_categories(category_files(inputs)))
+        loaded = sum(store.load_m8_files(inputs["m8_files"]).values())
+        store.load_structures(inputs["pdb_folder"])
+        store.top_hits_summary()
+        store.top_hits_per_database()
+    return loaded
+
+
+def stage_fasta_partition(inputs, out, base_url):
+    from fasta_partition import HeaderContains, Not, partition_fasta
+    uncharacterized = HeaderContains("uncharacterized")
+    counts = partition_fasta(inputs["fasta"], [
+        ("characterized", os.path.join(out, "characterized.fasta"), Not(uncharacterized)),
+        ("uncharacterized", os.path.join(out, "uncharacterized.fasta"), uncharacterized),
+    ], report=False)
+    return sum(c["records"] for c in counts.values())
+
+
+def stage_fasta_index(inputs, out, base_url):
+    from fasta_index import FastaIndex
+    fasta = os.path.join(out, "proteome.fasta")
+    shutil.copyfile(inputs["fasta"], fasta)
+    with FastaIndex(fasta) as index:
+        wanted = index.accessions()[::10]
+        index.write_fasta(wanted, os.path.join(out, "subset.fasta"))
+        return len(index)
+
+
+def stage_archive_scan(inputs, out, base_url):
+    from foldseek_archive import iter_archive_hits
+    return sum(1 for _ in iter_archive_hits(inputs["archive"], matcher=None))
+
+
+def stage_structure_store(inputs, out, base_url):
+    from structure_store import StructureStore
+    return len(StructureStore(os.path.join(out, "store")).add_folder(inputs["pdb_folder"]))
+
+
+def stage_rerank(inputs, out, base_url):
+    from rerank import rerank_hits
+    hits = pd.read_csv(inputs["rerank_hits"])
+    hits["query"] = "sp|" + hits["query"] + "|X"  # rerank reads the accession from the header
+    rerank_hits(hits, store_root=inputs["store"], query_model=lambda model_id: model_id)
+    return len(hits)
+
+
+def stage_af_download(inputs, out, base_url):
+    from af_downloader import download_models
+    from structure_cache import StructureCache
+    ids = inputs["download_ids"]
+    urls = {model_id: f"{base_url}/files/{model_id}.pdb" for model_id in ids}
+    results = download_models(ids, os.path.join(out, "models"), workers=16,
+                              cache=StructureCache(os.path.join(out, "cache")), urls=urls)
+    return int((results["status"] == "downloaded").sum())
+
+
+def stage_uniprot_fetch(inputs, out, base_url):
+    from uniprot_fetcher import fetch_fasta
+    result = fetch_fasta(inputs["accessions"], os.path.join(out, "sequences.fasta"), base_url=base_url, resume=False)
+    return len(result["written"])
+
+
+STAGES = {
+    "m8_parse": stage_m8_parse,
+    "m8_cached": stage_m8_cached,
+    "top_hits": stage_top_hits,
+    "hit_router": stage_hit_router,
+    "results_store": stage_results_store,
+    "fasta_partition": stage_fasta_partition,
+    "fasta_index": stage_fasta_index,
+    "archive_scan": stage_archive_scan,
+    "structure_store": stage_structure_store,
+    "rerank": stage_rerank,
+    "af_download": stage_af_download,
+    "uniprot_fetch": stage_uniprot_fetch,
+}
+
+
+# === Measuring ===
+def peak_rss_mb():
+    # Peak resident memory of this process and of any worker processes it started, in MiB.
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in KiB on Linux.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_stage(name, inputs, out, base_url):
+    # Runs in a fresh process: I time the stage with its progress prints silenced and report peak memory.
+    shutil.rmtree(out, ignore_errors=True)
+    os.makedirs(out, exist_ok=True)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        items = STAGES[name](inputs, out, base_url)
+        seconds = time.perf_counter() - start
+    return {"items": int(items), "seconds": round(seconds, 4), "peak_rss_mb": peak_rss_mb()}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(record, history):
+    # Relative change of this run's wall time against the median of the last few good runs.
+    previous = [r["seconds"] for r in history
+                if r["stage"] == record["stage"] and r["scale"] == record["scale"] and r["status"] == "ok"
+                and r["run_id"] != record["run_id"]][-HISTORY_WINDOW:]
+    if not previous or record["status"] != "ok":
+        return None
+    baseline = statistics.median(previous)
+    return (record["seconds"] - baseline) / baseline if baseline > 0 else None
+
+
+def run_benchmarks(scales, stages=None, workdir=DEFAULT_WORKDIR, history_path=DEFAULT_HISTORY, seed=0):
+    from mock_servers import MockServer
+
+    stages = stages or list(STAGES)
+    run_id = uuid.uuid4().hex[:12]
+    context = {
+        "run_id": run_id,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+    }
+    history = load_history(history_path)
+    os.makedirs(os.path.dirname(history_path) or ".", exist_ok=True)
+    records = []
+    spawn = multiprocessing.get_context("spawn")
+
+    with MockServer() as server:
+        for scale in scales:
+            inputs = prepare_inputs(workdir, scale, seed)
+            for name in stages:
+                out = os.path.join(workdir, "runs", name)
+                record = {**context, "stage": name, "scale": scale}
+                try:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                        measured = pool.submit(run_stage, name, inputs, out, server.base_url).result()
+                    record.update(measured, status="ok", error="",
+                                  items_per_second=round(measured["items"] / measured["seconds"], 1)
+                                  if measured["seconds"] > 0 else None)
+                except Exception as e:
+                    record.update(items=0, seconds=None, peak_rss_mb=None, items_per_second=None,
+                                  status="failed", error=f"{type(e).__name__}: {e}")
+                record["change_vs_history"] = compare(record, history)
+                records.append(record)
+                with open(history_path, 'a') as f:
+                    f.write(json.dumps(record) + "\n")
+                print(format_row(record))
+
+    regressions = [r for r in records if r["change_vs_history"] is not None
+                   and r["change_vs_history"] > REGRESSION_TOLERANCE]
+    print(f"\n📈 {len(records)} measurements appended to {history_path} (run {run_id})")
+    if regressions:
+        print(f"⚠️ {len(regressions)} stages are more than {REGRESSION_TOLERANCE:.0%} slower than their recent history:")
+        for r in regressions:
+            print(f"   {r['stage']} @ {r['scale']}: {r['change_vs_history']:+.0%}")
+    return records
+
+
+def format_row(record):
+    if record["status"] != "ok":
+        return f"❌ {record['stage']:<16} scale={record['scale']:<9} {record['error']}"
+    change = record["change_vs_history"]
+    rss = f"{record['peak_rss_mb']:>8.1f} MiB" if record["peak_rss_mb"] is not None else "       n/a"
+    return (f"⏱️ {record['stage']:<16} scale={record['scale']:<9} {record['seconds']:>9.3f} s "
+            f"{record['items_per_second'] or 0:>12,.0f} items/s {rss}"
+            + (f"  ({change:+.0%} vs history)" if change is not None else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data.")
+    parser.add_argument("--scale", type=int, nargs="+", default=[1000], help="number of hits (e.g. 1000 100000 10000000)")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), help="stages to run (default: all)")
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR, help="where synthetic inputs and outputs go")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON-lines file the results are appended to")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    run_benchmarks(args.scale, args.stages, args.workdir, args.history, args.seed)
+
+
+if __name__ == "__main__":
+    main()
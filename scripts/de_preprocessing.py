@@ -0,0 +1,170 @@
+# Script: de_preprocessing.py
+# Purpose: Turn the differential expression workbook into accession lists for every contrast sheet at once.
+
+# ======================= OVERVIEW ==========================
+# preprocessing_FoldSeek_input.py read diffExpData.xlsx with pd.read_excel on every run (slow for a big
+# workbook), looked only at the "UA 5v7 (Main)" sheet, and filtered the frame three separate times to get
+# the significant / upregulated / downregulated lists. This module does the same for every sheet:
+# - each parsed sheet is cached as Parquet under .de_cache/<sha256 of the workbook>/, so the Excel file is
+#   parsed once and a changed workbook (new hash) is parsed again automatically,
+# - sheets that are not cached yet are parsed in parallel, one process per sheet,
+# - every sheet is classified in one vectorized pass: a single significance mask and a single direction
+#   array give all three categories, with configurable p-value and log2 fold-change thresholds,
+# - every contrast gets its own <contrast>_all_significant_accessions.txt / _upregulated_ / _downregulated_
+#   lists, and the main sheet also keeps the plain file names the rest of the pipeline reads.
+# The Parquet cache needs pyarrow; without it I simply parse the workbook every time.
+
+import hashlib   # I use this to key the cache on the workbook's contents.
+import os        # I use this for paths.
+import re        # I use this to turn sheet names into file-name prefixes.
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+try:
+    import pyarrow  # noqa: F401  (only needed for the Parquet cache)
+except ImportError:
+    pyarrow = None
+
+DEFAULT_CACHE_DIR = ".de_cache"
+MAIN_SHEET = "UA 5v7 (Main)"
+ACCESSION_COLUMN = "Accession"
+P_COLUMN = "P value "        # note the trailing space in the workbook
+RATIO_COLUMN = "Ratio(log2)"
+CATEGORY_FILES = {           # category -> file name suffix, as preprocessing_FoldSeek_input.py wrote them
+    "significant": "all_significant_accessions.txt",
+    "upregulated": "upregulated_accessions.txt",
+    "downregulated": "downregulated_accessions.txt",
+}
+
+
+# === Reading with a cache ===
+def workbook_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def contrast_slug(sheet_name):
+    # "UA 5v7 (Main)" -> "ua_5v7_main"
+    return re.sub(r"[^0-9a-z]+", "_", sheet_name.lower()).strip("_")
+
+
+def sheet_cache_path(cache_dir, digest, sheet_name):
+    return os.path.join(cache_dir, digest[:16], f"{contrast_slug(sheet_name)}.parquet")
+
+
+def read_sheet(excel_file, sheet_name, cache_path=None):
+    # I parse one sheet and, if a cache path is given, store it as Parquet. Mixed-type text columns are
+    # stored as strings so Parquet can hold them; numbers are converted again when the sheet is classified.
+    df = pd.read_excel(excel_file, sheet_name=sheet_name)
+    df.columns = [str(column) for column in df.columns]
+    if cache_path is not None:
+        for column in df.columns[df.dtypes == object]:
+            df[column] = df[column].astype("string")
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+    return df
+
+
+@timed("de_preprocessing.load_sheets")
+def load_sheets(excel_file, sheet_names=None, cache_dir=DEFAULT_CACHE_DIR, workers=None, use_cache=True):
+    # I return {sheet_name: DataFrame} for the requested sheets (all sheets by default), in workbook order.
+    use_cache = use_cache and pyarrow is not None
+    digest = workbook_hash(excel_file) if use_cache else None
+    if sheet_names is None:
+        # The sheet list is cached too, so a fully cached run never opens the workbook.
+        names_path = os.path.join(cache_dir, digest[:16], "sheets.txt") if use_cache else None
+        if names_path is not None and os.path.exists(names_path):
+            with open(names_path, 'r') as f:
+                sheet_names = [line.rstrip('\n') for line in f]
+        else:
+            with pd.ExcelFile(excel_file) as workbook:
+                sheet_names = list(workbook.sheet_names)
+            if names_path is not None:
+                os.makedirs(os.path.dirname(names_path), exist_ok=True)
+                with open(names_path, 'w') as f:
+                    f.writelines(name + '\n' for name in sheet_names)
+
+    sheets, todo = {}, []
+    for name in sheet_names:
+        cache_path = sheet_cache_path(cache_dir, digest, name) if use_cache else None
+        if cache_path is not None and os.path.exists(cache_path):
+            sheets[name] = pd.read_parquet(cache_path)
+        else:
+            todo.append((name, cache_path))
+
+    if len(todo) == 1 or workers == 1:
+        for name, cache_path in todo:
+            sheets[name] = read_sheet(excel_file, name, cache_path)
+    elif todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {name: pool.submit(read_sheet, excel_file, name, cache_path) for name, cache_path in todo}
+            for name, future in futures.items():
+                sheets[name] = future.result()
+    print(f"📒 {len(sheet_names)} sheets ({len(sheet_names) - len(todo)} from cache, {len(todo)} parsed)")
+    return {name: sheets[name] for name in sheet_names}
+
+
+# === Classification ===
+def classify(df, p_threshold=0.05, log2_threshold=1.0, accession_column=ACCESSION_COLUMN,
+             p_column=P_COLUMN, ratio_column=RATIO_COLUMN):
+    # One pass over the sheet: I return {category: [accessions]} in the order they appear in the sheet.
+    accession = df[accession_column].astype("string").str.strip()
+    p_value = pd.to_numeric(df[p_column], errors='coerce').to_numpy(dtype=float)
+    ratio = pd.to_numeric(df[ratio_column], errors='coerce').to_numpy(dtype=float)
+    valid = accession.notna().to_numpy() & (accession != "").fillna(False).to_numpy() \
+        & ~np.isnan(p_value) & ~np.isnan(ratio)
+
+    significant = valid & (p_value < p_threshold)
+    # +1 up, -1 down, 0 significant but below the fold-change threshold
+    direction = np.where(ratio > log2_threshold, 1, np.where(ratio < -log2_threshold, -1, 0))
+    masks = {
+        "significant": significant,
+        "upregulated": significant & (direction == 1),
+        "downregulated": significant & (direction == -1),
+    }
+    values = accession.to_numpy()
+    return {name: list(pd.unique(values[mask])) for name, mask in masks.items()}
+
+
+def has_de_columns(df, columns=(ACCESSION_COLUMN, P_COLUMN, RATIO_COLUMN)):
+    return all(column in df.columns for column in columns)
+
+
+# === Writing ===
+def save_list(accessions, filename):
+    with open(filename, 'w') as f:
+        for acc in accessions:
+            f.write(str(acc).strip() + '\n')  # I write one accession per line
+    print(f"Saved {len(accessions)} accessions to {filename}")
+
+
+def preprocess_workbook(excel_file, sheet_names=None, output_dir=".", p_threshold=0.05, log2_threshold=1.0,
+                        main_sheet=MAIN_SHEET, cache_dir=DEFAULT_CACHE_DIR, workers=None):
+    # I write the accession lists of every contrast sheet and return
+    # {contrast_slug: {"sheet": name, "counts": {...}, "files": {category: path}}}.
+    os.makedirs(output_dir, exist_ok=True)
+    contrasts = {}
+    for name, df in load_sheets(excel_file, sheet_names, cache_dir, workers).items():
+        if not has_de_columns(df):
+            print(f"⏭️ Skipping sheet '{name}' (no {ACCESSION_COLUMN} / {P_COLUMN.strip()} / {RATIO_COLUMN} columns)")
+            continue
+        groups = classify(df, p_threshold, log2_threshold)
+        slug = contrast_slug(name)
+        files = {}
+        for category, suffix in CATEGORY_FILES.items():
+            files[category] = os.path.join(output_dir, f"{slug}_{suffix}")
+            save_list(groups[category], files[category])
+            if name == main_sheet:
+                # The rest of the pipeline reads these names for the main contrast.
+                save_list(groups[category], os.path.join(output_dir, suffix))
+        contrasts[slug] = {"sheet": name, "counts": {c: len(a) for c, a in groups.items()}, "files": files}
+    return contrasts
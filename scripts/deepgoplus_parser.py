@@ -0,0 +1,121 @@
+# Script: deepgoplus_parser.py
+# Purpose: Parse DeepGOPlus prediction CSVs into one typed table and pick the top GO terms per protein.
+
+# ======================= OVERVIEW ==========================
+# sortData.ipynb parsed each predictions_<set>_<range>.csv by hand with a csv.reader loop, recognised
+# protein lines with startswith(("I","Q")) and [0:6], and then stitched a hand-written list of files
+# together into combined_parsed_predictions_*.csv and combined_top_predictions_*.csv.
+# This module does the same work for any number of chunk files:
+# - discover_prediction_files() finds every predictions_<set>_<start>_<end>.csv and groups them by set,
+# - each file is read with pandas' C parser and labelled with column operations instead of a row loop:
+#   section rows ("Cellular Component", ...) and protein rows are forward-filled onto the GO rows under them,
+# - protein IDs are matched with the UniProt accession pattern, so 10-character accessions and IDs
+#   not starting with I or Q work too,
+# - files are parsed in a process pool and combined into one table with categorical Protein / Section /
+#   GO_ID / Description columns and a float32 Score,
+# - top_go_terms() picks the k best GO terms per protein and section in one groupby, optionally after
+#   dropping scores below a threshold.
+
+import glob    # I use this to find the prediction chunk files.
+import os      # I use this for paths.
+import re      # I use this to read the set name and range from file names.
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+SECTIONS = ["Biological Process", "Cellular Component", "Molecular Function"]
+COLUMNS = ["Protein", "Section", "GO_ID", "Description", "Score"]
+# UniProt accession format (https://www.uniprot.org/help/accession_numbers)
+ACCESSION_PATTERN = r"([OPQ][0-9][A-Z0-9]{3}[0-9]|[A-NR-Z][0-9](?:[A-Z][A-Z0-9]{2}[0-9]){1,2})"
+CHUNK_NAME = re.compile(r"predictions_(?P<set>.+?)_(?P<start>\d+)_(?P<end>\d+)\.csv$")
+
+
+def empty_predictions():
+    return pd.DataFrame({
+        "Protein": pd.Categorical([]), "Section": pd.Categorical([], categories=SECTIONS),
+        "GO_ID": pd.Categorical([]), "Description": pd.Categorical([]),
+        "Score": pd.Series([], dtype=np.float32),
+    })
+
+
+def discover_prediction_files(folder="."):
+    # I return {set_name: [file, ...]} with each set's chunks ordered by their starting protein number.
+    found = {}
+    for path in glob.glob(os.path.join(folder, "predictions_*.csv")):
+        match = CHUNK_NAME.search(os.path.basename(path))
+        if match:
+            found.setdefault(match.group("set"), []).append((int(match.group("start")), path))
+    return {name: [path for _, path in sorted(chunks)] for name, chunks in sorted(found.items())}
+
+
+def parse_prediction_file(path):
+    # I parse one DeepGOPlus output file into the COLUMNS layout.
+    raw = pd.read_csv(path, header=None, names=["first", "description", "score"], dtype=str,
+                      keep_default_na=False, skip_blank_lines=True)
+    first = raw["first"].str.strip()
+    is_go = first.str.startswith("GO:")
+    is_section = first.isin(SECTIONS)
+    is_protein = ~is_go & ~is_section & (first != "")
+
+    # Every GO row inherits the protein and section from the nearest header rows above it.
+    protein = first.where(is_protein).str.extract(ACCESSION_PATTERN, expand=False)
+    protein = protein.fillna(first.where(is_protein).str.split().str[0]).ffill()
+    section = first.where(is_section).ffill()
+
+    go = pd.DataFrame({
+        "Protein": protein[is_go],
+        "Section": section[is_go],
+        "GO_ID": first[is_go],
+        "Description": raw["description"][is_go],
+        "Score": pd.to_numeric(raw["score"][is_go], errors="coerce").astype(np.float32),
+    })
+    return go.dropna(subset=["Protein", "Section"])
+
+
+def to_categorical(df):
+    return df.astype({"Protein": "category", "Section": pd.CategoricalDtype(SECTIONS),
+                      "GO_ID": "category", "Description": "category", "Score": np.float32})
+
+
+@timed("deepgoplus.parse_predictions")
+def parse_predictions(paths, workers=None, min_score=None):
+    # I parse every file in a process pool and return one typed table, in file order.
+    paths = list(paths)
+    if not paths:
+        return empty_predictions()
+    if len(paths) == 1 or workers == 1:
+        frames = [parse_prediction_file(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(parse_prediction_file, paths))
+    df = to_categorical(pd.concat(frames, ignore_index=True))
+    if min_score is not None:
+        df = df[df["Score"] >= min_score].reset_index(drop=True)
+    return df
+
+
+def top_go_terms(df, k=1, min_score=None):
+    # I keep the k highest-scoring GO terms for every protein and section, sorted by protein and section.
+    if min_score is not None:
+        df = df[df["Score"] >= min_score]
+    ranked = df.sort_values(["Protein", "Section", "Score"], ascending=[True, True, False], kind="stable")
+    return ranked.groupby(["Protein", "Section"], observed=True, sort=False).head(k).reset_index(drop=True)
+
+
+def combine_prediction_sets(folder=".", output_folder=None, k=1, min_score=None, workers=None):
+    # For every set found in folder (e.g. "increased", "decreased") I write
+    # combined_parsed_predictions_<set>.csv and combined_top_predictions_<set>.csv.
+    output_folder = output_folder or folder
+    results = {}
+    for name, paths in discover_prediction_files(folder).items():
+        parsed = parse_predictions(paths, workers=workers, min_score=min_score)
+        top = top_go_terms(parsed, k=k)
+        parsed.to_csv(os.path.join(output_folder, f"combined_parsed_predictions_{name}.csv"), index=False)
+        top.to_csv(os.path.join(output_folder, f"combined_top_predictions_{name}.csv"), index=False)
+        print(f"{name}: {len(paths)} files, {parsed['Protein'].nunique()} proteins, "
+              f"{len(parsed)} GO predictions, {len(top)} top terms")
+        results[name] = (parsed, top)
+    return results
@@ -0,0 +1,228 @@
+# Script: deepgoplus_scheduler.py
+# Purpose: Run DeepGOPlus over any number of proteins in parallel chunks and merge the results as they finish.
+
+# ======================= OVERVIEW ==========================
+# The DeepGOPlus predictions were made by hand, about 10 proteins at a time (predictions_increased_1_10.csv,
+# predictions_increased_11_20.csv, ..., predictions_decreased_31_32.csv), and then stitched together in
+# sortData.ipynb. This script turns that into one command:
+# - the input is increased_sequences.csv / decreased_sequences.csv (Accession, Sequence) or any FASTA,
+# - proteins are split into numbered chunks, written as chunks/<set>_<start>_<end>.fasta,
+# - a predictor command (a template with {input} and {output}) is run for every chunk in a process pool;
+#   its output must be the web server's CSV layout that deepgoplus_parser.py reads (the deepgoplus command
+#   line tool writes a different TSV, so there is no default command: --command or $DEEPGOPLUS_CMD has to
+#   name a wrapper that writes the web layout),
+# - the output is written to a .tmp file and renamed when the command succeeds, so a chunk whose
+#   predictions_<set>_<start>_<end>.csv exists is finished and skipped on the next run, as long as the
+#   chunk FASTA next to it still holds the same proteins (added, removed or reordered proteins change the
+#   chunks, and those predictions are made again),
+# - every chunk is parsed in its worker, and the main process appends it to .tmp copies of
+#   combined_parsed_predictions_<set>.csv and combined_top_predictions_<set>.csv as soon as all chunks
+#   before it are in; the tables only replace the old ones when every chunk succeeded.
+# The command can be a stub script, which is how I check the scheduling without DeepGOPlus installed.
+#
+# Example:  python deepgoplus_scheduler.py ../DeepGOPlus/increased_sequences.csv --chunk-size 10 \
+#               --command "<predictor> {input} {output}"
+#           python deepgoplus_scheduler.py proteome.fasta --set proteome --command "python stub.py {input} {output}"
+
+import argparse  # I use this for the command line.
+import os        # I use this for paths and CPU counts.
+import shlex     # I use this to split the predictor command.
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+from deepgoplus_parser import parse_prediction_file, to_categorical, top_go_terms
+from fasta_partition import iter_records, open_binary
+from foldseek_scheduler import run_logged
+from instrumentation import count, start_run, timed
+from sharded_search import pin_threads
+
+DEFAULT_COMMAND = os.environ.get("DEEPGOPLUS_CMD")  # no built-in default, see the overview
+DEFAULT_CHUNK_SIZE = 10
+
+
+# === Input ===
+def read_sequences(path):
+    # [(accession, sequence)] from a CSV with Accession / Sequence columns or from a FASTA file.
+    if path.endswith(".csv"):
+        df = pd.read_csv(path, dtype=str).dropna(subset=["Accession", "Sequence"])
+        return list(zip(df["Accession"].str.strip(), df["Sequence"].str.strip()))
+    with open_binary(path) as handle:
+        return [(record.accession, record.sequence.decode()) for record in iter_records(handle)]
+
+
+def set_name(path):
+    # "increased_sequences.csv" -> "increased", "proteome.fasta" -> "proteome"
+    stem = os.path.basename(path).split(".")[0]
+    return stem[:-len("_sequences")] if stem.endswith("_sequences") else stem
+
+
+def make_chunks(records, chunk_size=DEFAULT_CHUNK_SIZE):
+    # [(start, end, records)] with 1-based inclusive numbers, as in predictions_increased_11_20.csv.
+    return [(i + 1, min(i + chunk_size, len(records)), records[i:i + chunk_size])
+            for i in range(0, len(records), chunk_size)]
+
+
+# === One chunk ===
+def run_chunk(name, start, end, records, work_dir, command):
+    # I write the chunk FASTA, run the predictor unless its output already exists, and return the parsed rows.
+    chunk_dir = os.path.join(work_dir, "chunks")
+    os.makedirs(chunk_dir, exist_ok=True)
+    output = os.path.join(work_dir, f"predictions_{name}_{start}_{end}.csv")
+    fasta = os.path.join(chunk_dir, f"{name}_{start}_{end}.fasta")
+    content = "".join(f">{acc}\n{sequence}\n" for acc, sequence in records)
+    # Predictions only count for the proteins they were made for: a chunk whose FASTA changed (or is
+    # missing) loses its old output, like a changed shard in sharded_search.write_shards.
+    previous = None
+    if os.path.exists(fasta):
+        with open(fasta, 'r') as f:
+            previous = f.read()
+    if previous != content:
+        with open(fasta, 'w') as f:
+            f.write(content)
+        if os.path.exists(output):
+            os.remove(output)
+    cached = os.path.exists(output)
+    code = 0
+    if not cached:
+        tmp_output = output + ".tmp"
+        cmd = [part.format(input=fasta, output=tmp_output) for part in shlex.split(command)]
+        code, _ = run_logged(cmd, os.path.join(chunk_dir, f"{name}_{start}_{end}.log"))
+        if code == 0 and os.path.exists(tmp_output):
+            os.replace(tmp_output, output)
+    if not os.path.exists(output):
+        return {"start": start, "end": end, "ok": False, "cached": False, "exit_code": code, "rows": None}
+    try:
+        rows = parse_prediction_file(output)
+    except (ValueError, OSError) as error:
+        # The predictor exited 0 but wrote something I can't read: the chunk fails like a non-zero exit,
+        # and the output is removed so the next run predicts it again instead of skipping it.
+        os.remove(output)
+        return {"start": start, "end": end, "ok": False, "cached": False, "exit_code": code, "rows": None,
+                "error": f"unreadable output ({error})"}
+    return {"start": start, "end": end, "ok": True, "cached": cached, "exit_code": code, "rows": rows}
+
+
+# === Scheduling and merging ===
+class StreamingMerge:
+    # Appends finished chunks to .tmp copies of the combined tables in chunk order; finish() puts them in place.
+    def __init__(self, output_dir, name, k=1, min_score=None):
+        self.paths = {"parsed": os.path.join(output_dir, f"combined_parsed_predictions_{name}.csv"),
+                      "top": os.path.join(output_dir, f"combined_top_predictions_{name}.csv")}
+        self.tmp_paths = {key: path + ".tmp" for key, path in self.paths.items()}
+        self.k = k
+        self.min_score = min_score
+        self.pending = {}   # start -> parsed rows (or None for a failed chunk)
+        self.position = 0   # index of the next chunk to write
+        self.written = {"parsed": 0, "top": 0}
+        for path in self.tmp_paths.values():
+            if os.path.exists(path):
+                os.remove(path)
+
+    def add(self, start, rows, order):
+        # order is the list of chunk starts; I flush every chunk whose predecessors are all in.
+        self.pending[start] = rows
+        while self.position < len(order) and order[self.position] in self.pending:
+            self.write(self.pending.pop(order[self.position]))
+            self.position += 1
+
+    def write(self, rows):
+        if rows is None or rows.empty:
+            return
+        parsed = to_categorical(rows)
+        if self.min_score is not None:
+            parsed = parsed[parsed["Score"] >= self.min_score]
+        # Chunks never share a protein, so each chunk's top terms are final on their own.
+        tables = {"parsed": parsed, "top": top_go_terms(parsed, k=self.k)}
+        for key, table in tables.items():
+            table.to_csv(self.tmp_paths[key], mode='a', header=not self.written[key], index=False)
+            self.written[key] += len(table)
+
+    def finish(self, complete):
+        # The old tables are only replaced by a complete set; after a failed chunk they stay as they were.
+        for key, tmp_path in self.tmp_paths.items():
+            if complete and os.path.exists(tmp_path):
+                os.replace(tmp_path, self.paths[key])
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+@timed("deepgoplus.schedule")
+def schedule_predictions(input_path, name=None, work_dir=".", output_dir=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                         command=DEFAULT_COMMAND, workers=None, threads_per_chunk=1, k=1, min_score=None):
+    # One command for a whole set: chunk, predict in parallel, merge. Returns the list of chunk results.
+    if not command:
+        raise ValueError("No predictor command: pass --command or set $DEEPGOPLUS_CMD")
+    name = name or set_name(input_path)
+    output_dir = output_dir or work_dir
+    os.makedirs(work_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    records = read_sequences(input_path)
+    chunks = make_chunks(records, chunk_size)
+    workers = workers or max(1, (os.cpu_count() or 1) // threads_per_chunk)
+    print(f"🧬 {len(records)} proteins in {len(chunks)} chunks of {chunk_size}, {workers} at a time")
+
+    merge = StreamingMerge(output_dir, name, k=k, min_score=min_score)
+    order = [start for start, _, _ in chunks]
+    results = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=pin_threads,
+                                 initargs=(threads_per_chunk,)) as pool:
+            futures = {pool.submit(run_chunk, name, start, end, chunk, work_dir, command)
+                       for start, end, chunk in chunks}
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    label = f"{name} {result['start']}-{result['end']}"
+                    if result["ok"]:
+                        count("deepgoplus.chunks_cached" if result["cached"] else "deepgoplus.chunks_predicted")
+                        print(f"  {label}: ✅ {len(result['rows'])} GO rows"
+                              + (" (cached)" if result["cached"] else ""))
+                    else:
+                        count("deepgoplus.chunks_failed")
+                        reason = result.get("error", f"predictor exit code {result['exit_code']}")
+                        print(f"  {label}: ❌ {reason}")
+                    merge.add(result["start"], result["rows"], order)
+                    results.append({key: value for key, value in result.items() if key != "rows"})
+    except BaseException:
+        # Anything unexpected (a crashed worker, Ctrl-C) must not leave the combined_*.tmp files behind.
+        merge.finish(complete=False)
+        raise
+
+    failed = [r for r in results if not r["ok"]]
+    merge.finish(complete=not failed)
+    if failed:
+        print(f"⚠️ {len(failed)} of {len(results)} chunks failed, {merge.paths['parsed']} and "
+              f"{merge.paths['top']} were left unchanged; rerun to retry only those (finished chunks are skipped)")
+    else:
+        print(f"✅ {name}: {merge.written['parsed']} GO predictions, {merge.written['top']} top terms -> "
+              f"{merge.paths['parsed']}, {merge.paths['top']}")
+    return sorted(results, key=lambda r: r["start"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run DeepGOPlus in parallel chunks and merge the predictions.")
+    parser.add_argument("inputs", nargs="+", help="<set>_sequences.csv files or FASTA files")
+    parser.add_argument("--set", dest="names", nargs="*", help="set names (default: from the file names)")
+    parser.add_argument("--work-dir", default=".", help="where chunks and predictions_<set>_<a>_<b>.csv go")
+    parser.add_argument("--output-dir", default=None, help="where the combined tables go (default: work dir)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--command", default=DEFAULT_COMMAND, required=DEFAULT_COMMAND is None,
+                        help="predictor command with {input} and {output} that writes the web server's CSV "
+                             "layout (default: $DEEPGOPLUS_CMD)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threads-per-chunk", type=int, default=1)
+    parser.add_argument("--top", type=int, default=1, help="GO terms kept per protein and section")
+    parser.add_argument("--min-score", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.names and len(args.names) != len(args.inputs):
+        parser.error(f"--set has {len(args.names)} names for {len(args.inputs)} inputs; give one name per input")
+
+    start_run("deepgoplus_scheduler")
+    names = args.names or [None] * len(args.inputs)
+    for input_path, name in zip(args.inputs, names):
+        schedule_predictions(input_path, name=name, work_dir=args.work_dir, output_dir=args.output_dir,
+                             chunk_size=args.chunk_size, command=args.command, workers=args.workers,
+                             threads_per_chunk=args.threads_per_chunk, k=args.top, min_score=args.min_score)
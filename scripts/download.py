@@ -4,126 +4,115 @@
 #          for significantly regulated uncharacterized proteins using Foldseek results.
 
 import os           # I use this to manage folders and file paths.
-import pandas as pd # I use pandas to load, sort, and filter the Foldseek hit tables.
-import requests     # I use requests to download PDB files from AlphaFold’s public server.
-
-# === STEP 1: Define input files and output folders ===
-
-# These are my Foldseek search results against the three major AlphaFold databases.
-# Each file contains uncharacterized proteins and their structural hits.
-foldseek_result_files = [
-    "prostt5_uncharacterized_results/results_afdb50.m8",
-    "prostt5_uncharacterized_results/results_afdb_proteome.m8",
-    "prostt5_uncharacterized_results/results_afdb_swissprot.m8"
-]
-
-# This is where I want to store the downloaded PDB structure files from AlphaFold.
-output_folder = "top_hit_structures"
-os.makedirs(output_folder, exist_ok=True)  # I make sure the folder exists or create it.
-
-# This is the final summary file that will list each downloaded structure and its metadata.
-summary_output_path = "prostt5_uncharacterized_results/downloaded_af_models_summary.csv"
-
-# === STEP 2: Define the column layout of the .m8 Foldseek output files ===
-
-# These column names are based on the actual structure of my .m8 files.
-# Column 11 is E-value, and column 12 is bitscore.
-column_names = [
-    "query",      # 0 – UniProt ID of the uncharacterized protein
-    "target",     # 1 – AlphaFold model matched
-    "score",      # 2 – Some alignment score or % identity
-    "q_len",      # 3 – Query length
-    "t_len",      # 4 – Target length
-    "gap_open",   # 5 – Gap opens
-    "q_start",    # 6 – Start of alignment in query
-    "q_end",      # 7 – End of alignment in query
-    "t_start",    # 8 – Start in target
-    "t_end",      # 9 – End in target
-    "evalue",     # 10 – Match confidence
-    "bitscore"    # 11 – Structural similarity score
-]
-
-# === STEP 3: Load and combine all result files ===
-
-# I initialize an empty dataframe to store hits from all three databases.
-all_hits = pd.DataFrame()
-
-# I load each .m8 file, assign the correct column names, and tag the source database.
-for file in foldseek_result_files:
-    print(f"📂 Loading: {file}")
-    df = pd.read_csv(file, sep='\t', header=None, names=column_names)
-    df["source_db"] = os.path.basename(file)  # I add a column to trace where the hit came from
-    all_hits = pd.concat([all_hits, df], ignore_index=True)
-
-# === STEP 4: Apply filtering criteria ===
-
-# I first filter for only confident hits — those with an E-value less than 1e-2.
-evalue_cutoff = 1e-2
-filtered_hits = all_hits[all_hits["evalue"] < evalue_cutoff]
-
-# Then I sort the confident hits by bitscore in descending order,
-# so the most structurally similar hits appear first.
-filtered_hits_sorted = filtered_hits.sort_values(by="bitscore", ascending=False)
-
-# I keep only the best structural match per query protein.
-top_hits = filtered_hits_sorted.drop_duplicates(subset="query", keep="first")
-
-# === STEP 5: Keep only AlphaFold targets (ignore other database hits) ===
-
-# I only want to download AlphaFold predictions, so I filter targets starting with "AF-"
-af_top_hits = top_hits[top_hits["target"].str.startswith("AF-")].copy()
-
-# === STEP 6: Download AlphaFold models and track what I download ===
-
-# I will log all successful downloads here for the final summary file.
-downloaded_records = []
-
-# This function downloads a PDB structure for a given AlphaFold target model.
-def download_alphafold_model(model_id, query_id, evalue, bitscore, source_db):
-    output_path = os.path.join(output_folder, f"{model_id}.pdb")
-
-    # I skip the download if the file already exists locally.
-    if os.path.exists(output_path):
-        print(f"✅ Already exists: {model_id}")
-        downloaded_records.append((query_id, model_id, evalue, bitscore, source_db))
-        return
-
-    # I generate the direct URL to fetch the PDB model from EBI's AlphaFold server.
-    url = f"https://alphafold.ebi.ac.uk/files/{model_id}.pdb"
-
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            with open(output_path, "w") as f:
-                f.write(response.text)
-            print(f"⬇️ Downloaded: {model_id}")
-            downloaded_records.append((query_id, model_id, evalue, bitscore, source_db))
-        else:
-            print(f"❌ Failed to download {model_id} (HTTP {response.status_code})")
-    except Exception as e:
-        print(f"❌ Error downloading {model_id}: {e}")
-
-# I loop through all AlphaFold hits and download each structure.
-print(f"🔍 Found {len(af_top_hits)} AlphaFold hits to download...")
-for _, row in af_top_hits.iterrows():
-    download_alphafold_model(
-        model_id=row["target"],
-        query_id=row["query"],
-        evalue=row["evalue"],
-        bitscore=row["bitscore"],
-        source_db=row["source_db"]
-    )
-
-# === STEP 7: Write the download summary to a CSV ===
-
-# I now convert my download records into a DataFrame and export to CSV.
-summary_df = pd.DataFrame(downloaded_records, columns=[
-    "Query UniProt ID",
-    "AlphaFold Target Model",
-    "E-value",
-    "Bitscore",
-    "Source Database"
-])
-
-summary_df.to_csv(summary_output_path, index=False)
-print(f"📄 Summary written to: {summary_output_path}")
+import instrumentation  # I use this to log stage timings, requests and retries for this run.
+from af_downloader import download_models, OK_STATUSES  # I use this to download the models in parallel.
+from top_hits import top_hits_per_query  # I use this to pick the best hit per query in one streaming pass.
+from structure_store import StructureStore  # I use this to keep parsed copies of the models as arrays.
+from rerank import rerank_hits, alphafold_query_model  # I use this to re-score the hits by superposition.
+from m8_reader import query_accession
+
+# The steps only run when this file is the main script: the structure store and the re-ranking use
+# process pools, and under spawn (Windows, macOS) every worker imports this file again.
+if __name__ == "__main__":
+    instrumentation.start_run("download")
+
+    # === STEP 1: Define input files and output folders ===
+
+    # These are my Foldseek search results against the three major AlphaFold databases.
+    # Each file contains uncharacterized proteins and their structural hits.
+    foldseek_result_files = [
+        "prostt5_uncharacterized_results/results_afdb50.m8",
+        "prostt5_uncharacterized_results/results_afdb_proteome.m8",
+        "prostt5_uncharacterized_results/results_afdb_swissprot.m8"
+    ]
+
+    # This is where I want to store the downloaded PDB structure files from AlphaFold.
+    output_folder = "top_hit_structures"
+    os.makedirs(output_folder, exist_ok=True)  # I make sure the folder exists or create it.
+
+    # This is the final summary file that will list each downloaded structure and its metadata.
+    summary_output_path = "prostt5_uncharacterized_results/downloaded_af_models_summary.csv"
+
+    # === STEP 2: Select the best AlphaFold hit for every query ===
+
+    # Instead of loading and sorting every hit, I stream the three files once and keep only the best
+    # hits per query protein. While streaming I drop anything that isn't confident (E-value >= 1e-2)
+    # or isn't an AlphaFold prediction (target not starting with "AF-"), since those are the only
+    # models I can download. Memory stays proportional to the number of queries, not hits.
+    # Re-ranking (step 6) is off by default: it downloads the models of rerank_candidates hits per query plus
+    # every query's own model, which is up to five times the traffic and disk of the top hits alone. With it
+    # on I keep that many hits per query (with one hit per query there would be nothing to re-rank); the
+    # best one is still the one downloaded to output_folder and summarized. pipeline.py download --rerank
+    # does the same as a pipeline stage.
+    evalue_cutoff = 1e-2
+    rerank = False
+    rerank_candidates = 5
+    for file in foldseek_result_files:
+        print(f"📂 Scanning: {file}")
+    af_candidates = top_hits_per_query(foldseek_result_files, k=rerank_candidates if rerank else 1,
+                                       evalue_cutoff=evalue_cutoff, target_prefix="AF-")
+    af_top_hits = af_candidates.drop_duplicates("query")  # best hits come first, so this is the best per query
+
+    # === STEP 3: Download AlphaFold models and track what I download ===
+
+    # I hand the whole list to the parallel downloader. It streams each model to disk, resumes
+    # partial files, checks that every PDB ends with an END record, and goes through the shared
+    # structure cache, so models I already have never hit the network.
+    print(f"🔍 Found {len(af_top_hits)} AlphaFold hits to download...")
+    results = download_models(af_top_hits["target"].tolist(), output_folder, workers=16)
+
+    # === STEP 4: Write the download summary to a CSV ===
+
+    # I join the download results back onto the hits and keep the ones that are now on disk.
+    downloaded = af_top_hits.merge(results, left_on="target", right_on="model_id")
+    downloaded = downloaded[downloaded["status"].isin(OK_STATUSES)]
+    print(f"📊 {len(downloaded)}/{len(af_top_hits)} models available "
+          f"({(results['status'] == 'downloaded').sum()} downloaded, "
+          f"{results['status'].isin(['cached', 'exists']).sum()} reused)")
+
+    summary_df = downloaded[["query", "target", "evalue", "bitscore", "source_db"]]
+    summary_df.columns = [
+        "Query UniProt ID",
+        "AlphaFold Target Model",
+        "E-value",
+        "Bitscore",
+        "Source Database"
+    ]
+
+    summary_df.to_csv(summary_output_path, index=False)
+    print(f"📄 Summary written to: {summary_output_path}")
+
+    # === STEP 5: Convert the models into the structure store ===
+
+    # Every model is parsed once into a memory-mappable NumPy array (coordinates, residues, pLDDT),
+    # so later steps read arrays instead of re-parsing PDB text. Unchanged models are skipped.
+    store = StructureStore("structure_store")
+    store.add_folder(output_folder)
+
+    # === STEP 6: Re-rank the hits by structural superposition ===
+
+    # Only when rerank is set in step 2.
+    if rerank:
+        # Bitscore alone decides what gets downloaded, so I check every candidate against the AlphaFold model of
+        # its query: the aligned CA atoms are superposed (Kabsch) and scored by RMSD and TM-score, and rank_tm
+        # next to rank_bitscore shows where the order changes. The other candidates' models go to their own
+        # folder (top_hit_structures keeps only the best hits that summarize.py reports), and the query models
+        # come through the same downloader and cache; all of them go into the same store.
+        candidate_folder = "rerank_candidate_structures"
+        query_folder = "query_structures"
+        candidate_results = download_models(af_candidates["target"].unique().tolist(), candidate_folder,
+                                            workers=16)
+        candidates = af_candidates.merge(candidate_results, left_on="target", right_on="model_id")
+        candidates = candidates[candidates["status"].isin(OK_STATUSES)]
+        query_models = [alphafold_query_model(query_accession(q))
+                        for q in candidates["query"].astype(str).unique()]
+        download_models(query_models, query_folder, workers=16)
+        store.add_folder(candidate_folder)
+        store.add_folder(query_folder)
+
+        reranked_output_path = "prostt5_uncharacterized_results/reranked_top_hits.csv"
+        reranked = rerank_hits(candidates[["query", "target", "evalue", "bitscore", "source_db",
+                                           "q_start", "q_end", "t_start", "t_end"]], store_root="structure_store")
+        reranked.to_csv(reranked_output_path, index=False)
+        print(f"📐 Re-ranked {reranked['tm_score'].notna().sum()}/{len(reranked)} hits by TM-score: "
+              f"{reranked_output_path}")
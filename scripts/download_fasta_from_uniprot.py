@@ -10,15 +10,25 @@
 
 # What this script does:
 # - Reads a .txt file containing UniProt accessions (one per line)
-# - Queries the UniProt API for each sequence
+# - Copies sequences that are already in the local proteome FASTA (see fasta_index.py)
+# - Queries the UniProt API in batches for the rest (see uniprot_fetcher.py)
 # - Appends the results to a single output file: ua5v7_DE_proteins.fasta
+# - Skips accessions that are already in the output file, so an interrupted run can be resumed
 
-import requests  # I use this to send GET requests to the UniProt API.
-import time      # I use time.sleep to avoid overloading the API.
+import os  # I use this to check whether the local proteome FASTA is available.
+import instrumentation  # I use this to log request counts, retries and timings for this run.
+from fasta_index import FastaIndex  # I use this to copy sequences I already have on disk.
+from uniprot_fetcher import existing_accessions, fetch_fasta  # I use this to fetch many accessions per request.
 
 # === USER SETTINGS ===
 input_file = "all_significant_accessions.txt"  # I can change this to upregulated or downregulated as needed.
 output_fasta = "ua5v7_DE_proteins.fasta"       # This is the combined FASTA file I'll generate.
+batch_size = 100                               # How many accessions I put into one UniProt query.
+workers = 4                                    # How many batches I keep in flight at once.
+# The S. mutans reference proteome. Any accession found there is copied from disk instead of downloaded.
+local_fasta = "../DeepGOPlus/Streptococcus_mutans_proteome_UP000002512_2025_01_16.fasta"
+
+instrumentation.start_run("download_fasta_from_uniprot")
 
 # === STEP 1: Load all UniProt accession IDs ===
 # I open the input file and read in each accession ID.
@@ -27,21 +37,19 @@ with open(input_file, 'r') as f:
 
 print(f"Loaded {len(accessions)} accessions from {input_file}")
 
-# === STEP 2: Fetch FASTA from UniProt API ===
-# I open my output file in write mode so I can add one FASTA at a time.
-with open(output_fasta, 'w') as outfile:
-    for i, acc in enumerate(accessions):
-        # I construct the UniProt API URL to get FASTA format
-        url = f"https://rest.uniprot.org/uniprotkb/{acc}.fasta"
-        response = requests.get(url)
-
-        if response.status_code == 200:
-            outfile.write(response.text)  # I write the full FASTA entry to the combined file.
-            print(f"[{i+1}/{len(accessions)}] Downloaded: {acc}")
-        else:
-            print(f"[{i+1}/{len(accessions)}] Failed: {acc} (status {response.status_code})")
-
-        time.sleep(0.5)  # I pause briefly to avoid hitting UniProt's rate limits.
-
-print(f"Finished writing combined FASTA to {output_fasta}")
-
+# === STEP 2: Copy the sequences I already have locally ===
+# The index is built once next to the proteome FASTA and reused on every later run.
+if local_fasta and os.path.exists(local_fasta):
+    already = existing_accessions(output_fasta)
+    with FastaIndex(local_fasta) as proteome:
+        local = [acc for acc in accessions if acc in proteome and acc not in already]
+        proteome.write_fasta(local, output_fasta, mode='a')
+    print(f"Copied {len(local)} sequences from {local_fasta}")
+
+# === STEP 3: Fetch the rest from the UniProt API ===
+# The fetcher appends each finished batch to the output file and backs off on its own
+# if UniProt starts rate limiting (HTTP 429).
+result = fetch_fasta(accessions, output_fasta, batch_size=batch_size, workers=workers)
+
+print(f"Finished writing combined FASTA to {output_fasta} "
+      f"({len(result['written'])} new, {len(result['missing'])} missing)")
@@ -0,0 +1,142 @@
+# Script: fasta_index.py
+# Purpose: Random access to FASTA records by UniProt accession, without re-parsing the whole file.
+
+# ======================= OVERVIEW ==========================
+# Looking up a few sequences used to mean reading a whole FASTA: sortData.ipynb turned the proteome
+# into proteome_proteins_sequences.csv (cutting IDs out with a fixed line[4:10]) and then merged on it,
+# and download_fasta_from_uniprot.py went back to the network for sequences I already had on disk.
+# Here I build a faidx-style index once and keep it next to the FASTA as "<file>.acc.fai":
+# - one row per record: accession (parsed from "sp|ACC|NAME" headers), the first header token,
+#   byte offset, record size in bytes and sequence length,
+# - the first line stores the size and mtime of the FASTA, so a changed file is re-indexed automatically,
+# - the FASTA itself is memory-mapped, so fetching N records touches only those N byte ranges.
+# The index is a plain tab-separated file, so scripts and notebooks can all share it.
+
+import mmap  # I use this to read records straight out of the file.
+import os    # I use this for file stats and atomic renames.
+
+INDEX_SUFFIX = ".acc.fai"
+
+
+def header_accession(header):
+    # UniProt headers look like ">sp|Q8DUY0|NAME_STRMU ..." or ">tr|...|...". Plain ">Q8DUY0" also works.
+    token = header[1:].split(None, 1)[0] if len(header) > 1 else ""
+    parts = token.split('|')
+    return parts[1] if len(parts) >= 3 else token
+
+
+def source_stamp(fasta_path):
+    st = os.stat(fasta_path)
+    return f"#source\t{st.st_size}\t{st.st_mtime_ns}"
+
+
+def build_index(fasta_path, index_path=None):
+    # I scan the FASTA once in binary mode and write the index. Returns the index path.
+    index_path = index_path or fasta_path + INDEX_SUFFIX
+    rows = []
+    offset = 0
+    current = None  # [accession, name, offset, length]
+    with open(fasta_path, 'rb') as f:
+        for raw in f:
+            if raw.startswith(b'>'):
+                if current is not None:
+                    rows.append(current + [offset - current[2]])
+                header = raw.decode('utf-8', errors='replace').rstrip()
+                name = header[1:].split(None, 1)[0] if len(header) > 1 else ""
+                current = [header_accession(header), name, offset, 0]
+            elif current is not None:
+                current[3] += len(raw.strip())
+            offset += len(raw)
+    if current is not None:
+        rows.append(current + [offset - current[2]])
+
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'w') as out:
+        out.write(source_stamp(fasta_path) + '\n')
+        for accession, name, start, length, size in rows:
+            out.write(f"{accession}\t{name}\t{start}\t{size}\t{length}\n")
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def index_is_fresh(fasta_path, index_path):
+    if not os.path.exists(index_path):
+        return False
+    with open(index_path, 'r') as f:
+        return f.readline().rstrip('\n') == source_stamp(fasta_path)
+
+
+class FastaIndex:
+    def __init__(self, fasta_path, index_path=None):
+        # I load the index (building or rebuilding it if needed) and memory-map the FASTA.
+        self.fasta_path = fasta_path
+        self.index_path = index_path or fasta_path + INDEX_SUFFIX
+        if not index_is_fresh(fasta_path, self.index_path):
+            build_index(fasta_path, self.index_path)
+
+        self.records = {}  # key -> (offset, size, length); keys are accessions and header names
+        self.order = []
+        with open(self.index_path, 'r') as f:
+            next(f)
+            for line in f:
+                accession, name, start, size, length = line.rstrip('\n').split('\t')
+                entry = (int(start), int(size), int(length))
+                self.order.append(accession)
+                self.records.setdefault(accession, entry)
+                self.records.setdefault(name, entry)
+
+        self.file = open(fasta_path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def __len__(self):
+        return len(self.order)
+
+    def accessions(self):
+        return list(self.order)
+
+    def length(self, key):
+        return self.records[key][2]
+
+    def record(self, key):
+        # The raw FASTA record (header and sequence lines) as bytes.
+        start, size, _ = self.records[key]
+        return self.map[start:start + size]
+
+    def header(self, key):
+        return self.record(key).split(b'\n', 1)[0].decode().rstrip()
+
+    def sequence(self, key):
+        record = self.record(key)
+        body = record.split(b'\n', 1)[1] if b'\n' in record else b""
+        return body.replace(b'\n', b'').replace(b'\r', b'').decode()
+
+    def sequences(self, keys):
+        # (key, sequence) pairs for every key that is in the index, in the order given.
+        return [(key, self.sequence(key)) for key in keys if key in self.records]
+
+    def write_fasta(self, keys, output_path, mode='w'):
+        # I copy the records for keys to output_path and return the keys that were not found.
+        missing = []
+        with open(output_path, mode + 'b') as out:
+            for key in keys:
+                if key in self.records:
+                    record = self.record(key)
+                    out.write(record if record.endswith(b'\n') else record + b'\n')
+                else:
+                    missing.append(key)
+        return missing
@@ -0,0 +1,233 @@
+# Script: fasta_partition.py
+# Purpose: Split one FASTA into any number of outputs in a single pass, using rules on each record.
+
+# ======================= OVERVIEW ==========================
+# filter.py could only do one thing: read the DE FASTA and send every record to one of two files
+# depending on whether "uncharacterized" appears in the header, rebuilding each record with list joins.
+# The partitioner generalizes that:
+# - a partition is a name, an output path and a rule; a record goes to every partition whose rule matches,
+# - rules can look at the header (substring / regex), the accession (membership in a set),
+#   the sequence length, or the residue composition, and can be combined with AllOf / AnyOf / Not,
+# - input can be gzip-compressed, outputs are written through large buffers, and records are copied
+#   as raw bytes without being re-joined,
+# - for big uncompressed FASTAs (whole proteomes, metagenomes) the file can be split into byte ranges
+#   that are processed by separate worker processes and stitched back together in order,
+# - at the end I report how many records and residues went into each partition.
+# Rules are small classes rather than lambdas so they can be sent to worker processes.
+
+import gzip      # I use this to read compressed FASTAs.
+import os        # I use this for file sizes and temporary part files.
+import re        # I use this for regex header rules.
+import shutil    # I use this to stitch part files together.
+from concurrent.futures import ProcessPoolExecutor
+
+from fasta_index import header_accession
+from instrumentation import timed
+
+BUFFER_SIZE = 1024 * 1024  # 1 MiB write buffers
+
+
+# === Records and rules ===
+class FastaRecord:
+    # One record as raw bytes, with the header, accession and sequence statistics worked out on demand.
+    __slots__ = ("lines", "_header", "_sequence")
+
+    def __init__(self, lines):
+        self.lines = lines
+        self._header = None
+        self._sequence = None
+
+    @property
+    def header(self):
+        if self._header is None:
+            self._header = self.lines[0].decode('utf-8', errors='replace').rstrip()
+        return self._header
+
+    @property
+    def accession(self):
+        return header_accession(self.header)
+
+    @property
+    def sequence(self):
+        if self._sequence is None:
+            self._sequence = b"".join(line.strip() for line in self.lines[1:])
+        return self._sequence
+
+    @property
+    def length(self):
+        return len(self.sequence)
+
+
+class HeaderContains:
+    def __init__(self, text, case_sensitive=False):
+        self.pattern = re.compile(re.escape(text), 0 if case_sensitive else re.IGNORECASE)
+
+    def __call__(self, record):
+        return self.pattern.search(record.header) is not None
+
+
+class HeaderRegex:
+    def __init__(self, pattern, flags=0):
+        self.pattern = re.compile(pattern, flags)
+
+    def __call__(self, record):
+        return self.pattern.search(record.header) is not None
+
+
+class AccessionIn:
+    def __init__(self, accessions):
+        self.accessions = frozenset(accessions)
+
+    def __call__(self, record):
+        return record.accession in self.accessions
+
+
+class LengthRange:
+    def __init__(self, min_length=0, max_length=None):
+        self.min_length = min_length
+        self.max_length = max_length
+
+    def __call__(self, record):
+        length = record.length
+        return length >= self.min_length and (self.max_length is None or length <= self.max_length)
+
+
+class Composition:
+    # The fraction of the sequence made of `residues` (e.g. "X" or "KR") must lie in [min_fraction, max_fraction].
+    def __init__(self, residues, min_fraction=0.0, max_fraction=1.0):
+        self.residues = residues.upper().encode()
+        self.min_fraction = min_fraction
+        self.max_fraction = max_fraction
+
+    def __call__(self, record):
+        sequence = record.sequence.upper()
+        if not sequence:
+            return False
+        count = sum(sequence.count(residue) for residue in self.residues)
+        return self.min_fraction <= count / len(sequence) <= self.max_fraction
+
+
+class Not:
+    def __init__(self, rule):
+        self.rule = rule
+
+    def __call__(self, record):
+        return not self.rule(record)
+
+
+class AllOf:
+    def __init__(self, *rules):
+        self.rules = rules
+
+    def __call__(self, record):
+        return all(rule(record) for rule in self.rules)
+
+
+class AnyOf:
+    def __init__(self, *rules):
+        self.rules = rules
+
+    def __call__(self, record):
+        return any(rule(record) for rule in self.rules)
+
+
+class Everything:
+    def __call__(self, record):
+        return True
+
+
+# === Reading ===
+def open_binary(path):
+    return gzip.open(path, 'rb') if path.endswith(".gz") else open(path, 'rb', buffering=BUFFER_SIZE)
+
+
+def iter_records(handle, end=None):
+    # I yield FastaRecords from a binary handle. If end is given, I stop at the first record whose
+    # header starts at or after byte `end` (used for byte-range workers).
+    lines = []
+    position = handle.tell() if end is not None else 0
+    for line in handle:
+        if line.startswith(b'>'):
+            if lines:
+                yield FastaRecord(lines)
+            if end is not None and position >= end:
+                return
+            lines = [line]
+        elif lines:
+            lines.append(line)
+        if end is not None:
+            position += len(line)
+    if lines:
+        yield FastaRecord(lines)
+
+
+def seek_to_record(handle, start):
+    # I move a handle to the first header line that begins at or after byte `start`.
+    if start == 0:
+        handle.seek(0)
+        return
+    handle.seek(start - 1)
+    if handle.read(1) != b'\n':
+        handle.readline()  # I'm in the middle of a line; skip the rest of it.
+    while True:
+        position = handle.tell()
+        line = handle.readline()
+        if not line or line.startswith(b'>'):
+            handle.seek(position)
+            return
+
+
+# === Partitioning ===
+def partition_range(input_path, partitions, start=None, end=None, suffix=""):
+    # I route the records of input_path (or of the byte range [start, end)) to the partitions.
+    # partitions is a list of (name, output_path, rule). Returns {name: {"records", "residues"}}.
+    counts = {name: {"records": 0, "residues": 0} for name, _, _ in partitions}
+    sinks = [open(path + suffix, 'wb', buffering=BUFFER_SIZE) for _, path, _ in partitions]
+    try:
+        with open_binary(input_path) as handle:
+            if start is not None:
+                seek_to_record(handle, start)
+            for record in iter_records(handle, end):
+                for (name, _, rule), sink in zip(partitions, sinks):
+                    if rule(record):
+                        sink.writelines(record.lines)
+                        counts[name]["records"] += 1
+                        counts[name]["residues"] += record.length
+    finally:
+        for sink in sinks:
+            sink.close()
+    return counts
+
+
+@timed("fasta_partition.partition_fasta")
+def partition_fasta(input_path, partitions, workers=1, report=True):
+    # I split input_path into the partitions in one pass. With workers > 1 (uncompressed input only)
+    # the file is cut into byte ranges that are handled by separate processes; each writes part files
+    # that I concatenate in order, so the outputs are identical to a single-process run.
+    if workers <= 1 or input_path.endswith(".gz"):
+        counts = partition_range(input_path, partitions)
+    else:
+        size = os.path.getsize(input_path)
+        bounds = [size * i // workers for i in range(workers + 1)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(partition_range, input_path, partitions, bounds[i], bounds[i + 1], f".part{i}")
+                       for i in range(workers)]
+            parts = [future.result() for future in futures]
+
+        counts = {name: {"records": 0, "residues": 0} for name, _, _ in partitions}
+        for part in parts:
+            for name, stats in part.items():
+                counts[name]["records"] += stats["records"]
+                counts[name]["residues"] += stats["residues"]
+        for _, path, _ in partitions:
+            with open(path, 'wb') as out:
+                for i in range(workers):
+                    part_path = f"{path}.part{i}"
+                    with open(part_path, 'rb') as part_file:
+                        shutil.copyfileobj(part_file, out, BUFFER_SIZE)
+                    os.remove(part_path)
+
+    if report:
+        for name, path, _ in partitions:
+            print(f"{name}: {counts[name]['records']} records, {counts[name]['residues']} residues -> {path}")
+    return counts
@@ -12,86 +12,83 @@
 # because I want to functionally annotate and interpret **all** differential expression hits.
 
 import os  # I use this module to execute system commands and build file paths across my script.
+import instrumentation  # I use this to log how long createdb, every search and the routing took.
+from hit_router import DEFAULT_CATEGORY_FILES, HitRouter, load_categories  # I use this to sort hits into categories.
+from foldseek_scheduler import create_query_db, discover_databases, schedule_searches  # I use this to run Foldseek.
+from incremental_search import incremental_search  # I use this to skip sequences that were already searched.
+from sharded_search import sharded_search  # I use this to split big FASTAs over all cores.
 
-# === STEP 1: Define my input and output structure ===
-fasta_file = "ua5v7_DE_proteins.fasta"  # This is the FASTA file that I previously generated with DE protein sequences.
-query_db = "ua5v7_structural_db"        # This will be the output database name when I run Foldseek's createdb with ProstT5.
-results_dir = "prostt5_results"         # I will save all results to this directory so I can keep everything organized.
-prost_model = "weights"                 # This is the folder where I downloaded the ProstT5 model.
-database_dir = "/mnt/classes/biol_594_694/group6/databases"  # This is the path to all my usable Foldseek databases.
+# The steps only run when this file is the main script: sharded mode runs the shards in a process pool,
+# and under spawn (Windows, macOS) every worker imports this file again.
+if __name__ == "__main__":
+    instrumentation.start_run("fasta_to_foldseek")
 
-# === STEP 2: Load accession lists for category filtering ===
-def load_accessions(path):
-    # I open the file safely and load each line as a set element.
-    # I use sets because they allow for fast lookup and remove duplicate entries.
-    if os.path.exists(path):
-        with open(path, 'r') as f:
-            return set(line.strip() for line in f)  # I strip each line of whitespace and collect all in a set.
-    return set()  # If the file doesn't exist, I return an empty set to avoid crashing the script.
+    # === STEP 1: Define my input and output structure ===
+    fasta_file = "ua5v7_DE_proteins.fasta"  # This is the FASTA file that I previously generated with DE protein sequences.
+    query_db = "ua5v7_structural_db"        # This will be the output database name when I run Foldseek's createdb with ProstT5.
+    results_dir = "prostt5_results"         # I will save all results to this directory so I can keep everything organized.
+    prost_model = "weights"                 # This is the folder where I downloaded the ProstT5 model.
+    database_dir = "/mnt/classes/biol_594_694/group6/databases"  # This is the path to all my usable Foldseek databases.
+    cpu_budget = os.cpu_count()             # The total number of threads all concurrent searches may use together.
+    # "full" rebuilds and searches everything, as this script always has. "incremental" only embeds / searches
+    # sequences not seen before (see incremental_search.py), using the cache in cache_dir; "sharded" splits a
+    # big FASTA into shards that run in parallel (sharded_search.py). Both are opt-in.
+    search_mode = "full"
+    cache_dir = ".foldseek_cache"           # Where the ProstT5 3Di databases and hit rows of earlier runs are kept.
+    threads_per_shard = 1                   # Threads each shard's createdb / searches may use in sharded mode.
 
-# I now load my upregulated, downregulated, and all significant UniProt IDs from previous analyses.
-upregulated = load_accessions("upregulated_accessions.txt")
-downregulated = load_accessions("downregulated_accessions.txt")
-all_significant = load_accessions("all_significant_accessions.txt")
+    # === STEP 2: Load accession lists for category filtering ===
+    # Each category is a name plus the file with its UniProt IDs. I can add more contrasts here and they
+    # simply become more hits_<name>.txt files; a missing file just means an empty category.
+    category_files = dict(DEFAULT_CATEGORY_FILES)  # upregulated, downregulated and significant
+    categories = load_categories(category_files)
+    compress_hits = False  # I can switch this on to write hits_<name>.txt.gz instead.
 
-# === STEP 3: Define temporary working directory for Foldseek ===
-tmp_dir = os.path.join(results_dir, "tmp")  # I create a folder path for temporary Foldseek files.
-os.makedirs(tmp_dir, exist_ok=True)  # I make sure this folder exists (creates it if missing).
+    # === STEP 3: Create ProstT5 database from FASTA ===
+    # foldseek_scheduler runs Foldseek as a subprocess and stops the script if createdb fails,
+    # instead of carrying on with a missing query database.
+    # In incremental and sharded mode this happens inside the search step (only for new sequences / per shard).
+    os.makedirs(results_dir, exist_ok=True)
+    if search_mode == "full":
+        print("[Step 1] Creating ProstT5 structural database from FASTA...")
+        create_query_db(fasta_file, query_db, prost_model, log_dir=results_dir)
 
-# === STEP 4: Create ProstT5 database from FASTA ===
-print("[Step 1] Creating ProstT5 structural database from FASTA...")
-cmd_createdb = f"foldseek createdb {fasta_file} {query_db} --prostt5-model {prost_model}"  # I build the Foldseek command using ProstT5.
-os.system(cmd_createdb)  # I run the command in the system shell.
+    # === STEP 4: Route results from each finished search straight to the category files ===
+    # The router writes each hit line to hits_all.txt and to every category its query belongs to
+    # as soon as the line is read, so nothing piles up in memory and a crash keeps what was written.
+    router = HitRouter(results_dir, categories, compress=compress_hits)
 
-# === STEP 5: Run Foldseek search against all local structural databases ===
-print("[Step 2] Running Foldseek easy-search against all local databases...")
+    def route_results(result):
+        if result["ok"]:  # I skip databases whose search failed; the log file says why.
+            with instrumentation.timer("hit_router.route_file", database=result["database"]):
+                router.route_file(result["m8"])
 
-# I will now prepare four lists to hold hits categorized by significance class.
-all_hits = []  # This will hold every result from all databases.
-up_hits = []   # This will hold only hits where the query came from the upregulated list.
-down_hits = [] # This will hold only hits where the query came from the downregulated list.
-sig_hits = []  # This will hold only hits that were in the significant group.
+    # === STEP 5: Run Foldseek search against all local structural databases ===
+    print("[Step 2] Running Foldseek easy-search against all local databases...")
+    # I find the real search targets (skipping my own query DB and Foldseek's _ss/_h/_ca side files,
+    # and preferring createindex'ed copies), then run the searches side by side within my CPU budget.
+    # Each search gets its own tmp folder and log, and its results are routed as soon as it finishes.
+    # In incremental mode, cached hits (keyed on sequence hash and database version) are reused and only the
+    # missing sequence / database pairs are searched. In sharded mode each residue-balanced shard runs createdb
+    # and all searches in its own process, failed shards are retried alone, and the shard outputs are merged.
+    # The results_<db>.m8 files come out the same in every mode.
+    databases = discover_databases(database_dir, exclude_prefix=query_db)
+    if search_mode == "incremental":
+        search_results = incremental_search(fasta_file, databases, results_dir, prost_model, cache_dir=cache_dir,
+                                            cpu_budget=cpu_budget, on_result=route_results)
+    elif search_mode == "sharded":
+        search_results = sharded_search(fasta_file, databases, results_dir, prost_model, cpu_budget=cpu_budget,
+                                        threads_per_shard=threads_per_shard, on_result=route_results)
+    else:
+        search_results = schedule_searches(query_db, databases, results_dir, cpu_budget=cpu_budget,
+                                           on_result=route_results)
+    failed = [r["database"] for r in search_results if not r["ok"]]
+    if failed:
+        print(f"⚠️ Searches failed for: {', '.join(failed)}")
 
-# I go through each file in the database directory and filter out the valid database names by checking for the .dbtype extension.
-for db_file in os.listdir(database_dir):
-    if db_file.endswith(".dbtype") and not db_file.startswith(query_db):  # I ignore my own createdb file.
-        db_name = db_file.replace(".dbtype", "")  # I remove the extension to get the usable Foldseek DB name.
-        db_path = os.path.join(database_dir, db_name)  # I create the full path to the database.
-        db_results_m8 = os.path.join(results_dir, f"results_{db_name}.m8")  # I define a name for the result file from this DB.
-        print(f"\n▶ Searching against {db_name}...")  # I print which database I'm working on.
+    # === STEP 6: Close the category files and summarize ===
+    router.close()
 
-        # I now build and execute the Foldseek easy-search command.
-        cmd_search = f"foldseek easy-search {query_db} {db_path} {db_results_m8} {tmp_dir}"
-        os.system(cmd_search)  # I run the search using the shell.
-
-        # === STEP 6: Parse and classify results from this search ===
-        if os.path.exists(db_results_m8):  # I confirm the result file exists before parsing.
-            with open(db_results_m8, 'r') as f:
-                for line in f:
-                    all_hits.append(line.strip())  # I collect the raw line in the overall hits list.
-                    query_id = line.split('\t')[0].split('|')[1] if '|' in line.split('\t')[0] else line.split('\t')[0]  # I extract the UniProt ID.
-                    if query_id in upregulated:
-                        up_hits.append(line.strip())  # I check and store hits in the upregulated group.
-                    if query_id in downregulated:
-                        down_hits.append(line.strip())  # I do the same for downregulated hits.
-                    if query_id in all_significant:
-                        sig_hits.append(line.strip())  # I also collect all significant hits for separate analysis.
-
-# === STEP 7: Save categorized results ===
-def save_hits(hit_list, filename):
-    # I open the desired output file and write all lines from the hit list to it.
-    with open(os.path.join(results_dir, filename), 'w') as f:
-        for hit in hit_list:
-            f.write(hit + '\n')  # I write one hit per line.
-
-# I now save each result set to its own file for downstream analysis.
-save_hits(all_hits, "hits_all.txt")
-save_hits(up_hits, "hits_upregulated.txt")
-save_hits(down_hits, "hits_downregulated.txt")
-save_hits(sig_hits, "hits_significant.txt")
-
-# I finish by printing a simple summary showing how many hits were saved.
-print(f"✅ Done. Saved {len(all_hits)} total hits.")
-print(f"  - {len(up_hits)} upregulated")
-print(f"  - {len(down_hits)} downregulated")
-print(f"  - {len(sig_hits)} all significant")
+    # I finish by printing a simple summary showing how many hits were saved per category.
+    print(f"✅ Done. Saved {router.counts['all']} total hits.")
+    router.summary()
@@ -1,31 +1,19 @@
-def separate_fasta(input_file, characterized_file, uncharacterized_file):
-    with open(input_file, 'r') as infile, \
-         open(characterized_file, 'w') as char_file, \
-         open(uncharacterized_file, 'w') as unchar_file:
-        
-        current_seq = []
-        is_characterized = False
-        
-        for line in infile:
-            if line.startswith('>'):
-                if current_seq:
-                    if is_characterized:
-                        char_file.write(''.join(current_seq))
-                    else:
-                        unchar_file.write(''.join(current_seq))
-                    current_seq = []
-                
-                current_seq.append(line)
-                is_characterized = 'uncharacterized' not in line.lower()
-            else:
-                current_seq.append(line)
-        
-        if current_seq:
-            if is_characterized:
-                char_file.write(''.join(current_seq))
-            else:
-                unchar_file.write(''.join(current_seq))
+import instrumentation
+from annotation_filter import UNCHARACTERIZED_HEADER
+from fasta_partition import Not, partition_fasta
 
+
+def separate_fasta(input_file, characterized_file, uncharacterized_file, workers=1):
+    # One pass over the FASTA: every record goes to exactly one of the two outputs,
+    # depending on whether "uncharacterized" appears in its header (case-insensitive).
+    # More terms (hypothetical, DUF, ...) can go into the same precompiled AnnotationFilter.
+    uncharacterized = UNCHARACTERIZED_HEADER
+    return partition_fasta(input_file, [
+        ('characterized', characterized_file, Not(uncharacterized)),
+        ('uncharacterized', uncharacterized_file, uncharacterized),
+    ], workers=workers)
+
+instrumentation.start_run('filter')
 input_file = 'ua5v7_DE_proteins.fasta'
 characterized_file = 'characterizedfasta.txt'
 uncharacterized_file = 'uncharacterizedfasta.txt'
@@ -0,0 +1,195 @@
+# Script: foldseek_api.py
+# Purpose: Submit many structures to the Foldseek web server, poll them, and download the results.
+
+# ======================= OVERVIEW ==========================
+# foldseek_apiquery() in 01_Working_FoldSeek_Search.py handled one structure per run, polled at most
+# ten times with a fixed 30 s sleep (so anything slower than five minutes was downloaded unfinished),
+# and downloaded the archive in 128-byte chunks. This job manager:
+# - submits many query structures, with at most max_in_flight tickets open on the server at once,
+# - polls every open ticket with exponential backoff (capped at max_poll_interval) until it is
+#   COMPLETE or ERROR, with no fixed limit on the number of polls,
+# - saves the ticket of every submitted query in a small JSON state file, so a restarted run picks up
+#   the jobs that are still pending instead of submitting them again,
+# - streams finished archives to disk in 1 MiB chunks via a .part file,
+# - treats a failed request (network error, HTTP error, a submit reply without a ticket such as a rate
+#   limit) as a problem of that one job: it backs off and retries, and after max_retries failures in a
+#   row marks only that job ERROR while the rest of the batch carries on.
+# The server URL is a parameter, so a local mock ticket server can stand in for search.foldseek.com.
+
+import json       # I use this for the API responses and the ticket state file.
+import os         # I use this for paths and atomic renames.
+import time       # I use this for polling intervals.
+
+import requests   # I use this to talk to the Foldseek web API.
+
+from instrumentation import count, instrument_session  # Requests and status codes go to the run log.
+
+FOLDSEEK_API_URL = "https://search.foldseek.com/api"
+DEFAULT_DATABASES = ['afdb50', 'afdb-swissprot', 'afdb-proteome', 'mgnify_esm30', 'pdb100', 'gmgcl_id']
+CHUNK_SIZE = 1024 * 1024
+
+
+class TicketState:
+    # A JSON file mapping each query name to {"ticket", "status", "output"}. I rewrite it atomically
+    # after every change so a crash never leaves it half written.
+    def __init__(self, path):
+        self.path = path
+        self.jobs = {}
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                self.jobs = json.load(f)
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.jobs, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def update(self, name, **fields):
+        self.jobs.setdefault(name, {}).update(fields)
+        self.save()
+
+
+class FoldseekJobManager:
+    def __init__(self, base_url=FOLDSEEK_API_URL, databases=None, mode="3diaa", state_path=None,
+                 max_in_flight=4, min_poll_interval=5.0, max_poll_interval=120.0, timeout=None,
+                 max_retries=5, session=None):
+        self.base_url = base_url.rstrip('/')
+        self.databases = databases or DEFAULT_DATABASES
+        self.mode = mode
+        self.state = TicketState(state_path)
+        self.max_in_flight = max_in_flight
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.timeout = timeout  # Overall limit in seconds for run(); None means wait as long as it takes.
+        self.max_retries = max_retries  # Failed requests in a row before a single job is given up.
+        self.session = instrument_session(session or requests.Session())
+
+    # === API calls ===
+    def submit(self, pdb_data):
+        response = self.session.post(f"{self.base_url}/ticket",
+                                     data={'q': pdb_data, 'database[]': self.databases, 'mode': self.mode})
+        response.raise_for_status()
+        response_json = response.json()
+        if 'id' not in response_json:
+            raise RuntimeError(f"Error submitting job: {response_json}")
+        return response_json['id'], response_json.get('status', 'PENDING')
+
+    def status(self, ticket_id):
+        response = self.session.get(f"{self.base_url}/ticket/{ticket_id}")
+        response.raise_for_status()
+        return response.json().get('status', 'UNKNOWN')
+
+    def download(self, ticket_id, output_file):
+        # I stream the archive into a .part file and only rename it once it is complete.
+        part_path = output_file + ".part"
+        with self.session.get(f"{self.base_url}/result/download/{ticket_id}", stream=True) as response:
+            response.raise_for_status()
+            with open(part_path, 'wb') as fd:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    fd.write(chunk)
+        os.replace(part_path, output_file)
+        return output_file
+
+    # === Scheduling ===
+    def run(self, queries):
+        # queries maps a name to (pdb_path, output_tar_gz). I return the final state of every job:
+        # {"ticket", "status", "output"} with status COMPLETE, ERROR, DOWNLOADED or TIMEOUT.
+        started = time.monotonic()
+        waiting = []   # Names that still have to be submitted.
+        open_jobs = {}  # name -> {"next_poll": t, "interval": s}
+        not_before = {}  # name -> earliest time to submit again after a failed submission
+        failures = {}  # name -> failed requests in a row
+
+        def retry_delay(name, error):
+            # The back-off before the job's next request, or None once the job has been given up as ERROR.
+            failures[name] = failures.get(name, 0) + 1
+            if failures[name] > self.max_retries:
+                self.state.update(name, status="ERROR", error=str(error))
+                print(f"❌ {name}: giving up after {failures[name]} failed requests ({error})")
+                return None
+            count("foldseek_api.retries")
+            delay = min(self.max_poll_interval, self.min_poll_interval * 2 ** (failures[name] - 1))
+            print(f"⚠️ {name}: request failed ({error}), retrying in {delay:.0f}s")
+            return delay
+
+        for name, (pdb_path, output_file) in queries.items():
+            job = self.state.jobs.get(name, {})
+            if job.get("status") == "DOWNLOADED" and os.path.exists(job.get("output", "")):
+                print(f"✅ {name}: already downloaded to {job['output']}")
+            elif job.get("ticket") and job.get("status") not in ("ERROR", None):
+                # A ticket from an earlier run: I resume polling it instead of submitting again.
+                print(f"🔁 {name}: resuming ticket {job['ticket']}")
+                self.state.update(name, output=output_file)
+                open_jobs[name] = {"next_poll": 0.0, "interval": self.min_poll_interval}
+            else:
+                waiting.append(name)
+
+        while waiting or open_jobs:
+            # Top up the server with new submissions while there is room.
+            ready = [name for name in waiting if not_before.get(name, 0.0) <= time.monotonic()]
+            while ready and len(open_jobs) < self.max_in_flight:
+                name = ready.pop(0)
+                waiting.remove(name)
+                pdb_path, output_file = queries[name]
+                try:
+                    with open(pdb_path, 'r') as file:
+                        ticket_id, status = self.submit(file.read())
+                except (requests.RequestException, RuntimeError) as error:
+                    delay = retry_delay(name, error)
+                    if delay is not None:
+                        not_before[name] = time.monotonic() + delay
+                        waiting.append(name)
+                    continue
+                failures.pop(name, None)
+                print(f"📨 {name}: submitted as ticket {ticket_id}")
+                self.state.update(name, ticket=ticket_id, status=status, output=output_file)
+                open_jobs[name] = {"next_poll": time.monotonic() + self.min_poll_interval,
+                                   "interval": self.min_poll_interval}
+
+            if self.timeout is not None and time.monotonic() - started > self.timeout:
+                for name in list(open_jobs) + waiting:
+                    self.state.update(name, status="TIMEOUT")
+                print(f"⚠️ Gave up after {self.timeout}s with {len(open_jobs)} jobs still running")
+                break
+
+            if not open_jobs:
+                # Only submissions that are backing off are left.
+                if waiting:
+                    time.sleep(max(0.0, min(not_before[name] for name in waiting) - time.monotonic()))
+                continue
+
+            # Poll whichever open job is due next.
+            name = min(open_jobs, key=lambda n: open_jobs[n]["next_poll"])
+            delay = open_jobs[name]["next_poll"] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            job = self.state.jobs[name]
+            try:
+                status = self.status(job["ticket"])
+                if status == "COMPLETE":
+                    self.download(job["ticket"], job["output"])
+            except requests.RequestException as error:
+                delay = retry_delay(name, error)
+                if delay is None:
+                    del open_jobs[name]
+                else:
+                    open_jobs[name]["next_poll"] = time.monotonic() + delay
+                continue
+            failures.pop(name, None)
+            if status == "COMPLETE":
+                self.state.update(name, status="DOWNLOADED")
+                print(f"⬇️ {name}: results saved to {job['output']}")
+                del open_jobs[name]
+            elif status == "ERROR":
+                self.state.update(name, status="ERROR")
+                print(f"❌ {name}: Foldseek API returned an error.")
+                del open_jobs[name]
+            else:
+                self.state.update(name, status=status)
+                interval = min(self.max_poll_interval, open_jobs[name]["interval"] * 2)
+                open_jobs[name] = {"next_poll": time.monotonic() + interval, "interval": interval}
+
+        return {name: dict(self.state.jobs.get(name, {})) for name in queries}
@@ -0,0 +1,71 @@
+# Script: foldseek_archive.py
+# Purpose: Read hits straight out of a Foldseek web-server result archive (.tar.gz), without extracting it.
+
+# ======================= OVERVIEW ==========================
+# extract_uncharacterized_entries() used to extract the whole archive into a temp folder, walk it,
+# lowercase every line and run a fresh re.search on each match. Here I read the archive as a stream:
+# - tarfile's streaming mode ("r|gz") hands me one member at a time straight from the gzip stream,
+#   so nothing is written to disk and only the current member is ever buffered,
+# - every .m8 member (one per database, e.g. alis_afdb50.m8) is handled in the same single pass,
+# - the filters are compiled once instead of once per match (the default is the "uncharacterized protein"
+#   filter from annotation_filter.py; any AnnotationFilter or pattern works); an AnnotationFilter lowercases
+#   each line once for its literal screen and only runs the regex on lines that pass it,
+# - hits come out of a generator as small records that carry the database, query, target,
+#   the UniProt accession of AlphaFold targets, and the original line.
+
+import re        # I use precompiled patterns for the filter and the accession.
+import tarfile   # I use this to stream the .tar.gz.
+from typing import NamedTuple
+
+from annotation_filter import UNCHARACTERIZED_HIT
+
+UNCHARACTERIZED = UNCHARACTERIZED_HIT
+AF_ACCESSION = re.compile(r"AF-([A-Z0-9]+)-")
+
+
+class ArchiveHit(NamedTuple):
+    database: str   # Database the hit came from, taken from the member name (alis_afdb50.m8 -> afdb50)
+    query: str
+    target: str     # Target column, which on the web server includes the description
+    accession: str  # UniProt accession for AlphaFold targets, "" otherwise
+    line: str       # The original line without its newline
+
+
+def member_database(name):
+    base = name.rsplit('/', 1)[-1]
+    if base.endswith(".m8"):
+        base = base[:-3]
+    return base[len("alis_"):] if base.startswith("alis_") else base
+
+
+def iter_m8_members(tar_path):
+    # I yield (database, text_stream) for each .m8 member, in archive order. Each stream must be
+    # consumed before asking for the next member, because the archive is read strictly forwards.
+    with tarfile.open(tar_path, 'r|gz') as tar:
+        for member in tar:
+            if member.isfile() and member.name.endswith(".m8"):
+                raw = tar.extractfile(member)
+                # TextIOWrapper needs a seekable file, which a streamed member is not, so I decode line by line.
+                yield member_database(member.name), (line.decode('utf-8', errors='replace') for line in raw)
+
+
+def iter_archive_hits(tar_path, matcher=UNCHARACTERIZED):
+    # I yield an ArchiveHit for every line that matches (all lines if matcher is None).
+    # matcher can be an AnnotationFilter, a compiled pattern or anything with a .search(line) method.
+    search = matcher.search if matcher is not None else None
+    for database, stream in iter_m8_members(tar_path):
+        for line in stream:
+            if search is not None and not search(line):
+                continue
+            line = line.rstrip('\n')
+            fields = line.split('\t', 2)
+            target = fields[1] if len(fields) > 1 else ""
+            match = AF_ACCESSION.search(target)
+            yield ArchiveHit(database, fields[0], target, match.group(1) if match else "", line)
+
+
+def iter_archive_accessions(tar_path, matcher=UNCHARACTERIZED):
+    # Just the AlphaFold accessions of matching hits, in order of appearance.
+    for hit in iter_archive_hits(tar_path, matcher):
+        if hit.accession:
+            yield hit.accession
@@ -0,0 +1,146 @@
+# Script: foldseek_scheduler.py
+# Purpose: Run Foldseek createdb / easy-search as proper subprocesses and search many databases at once.
+
+# ======================= OVERVIEW ==========================
+# fasta_to_foldseek.py used to call os.system() for every database, one after another, with a single
+# shared tmp folder and no check of whether the search actually worked. Here I:
+# - find the searchable databases in a folder (skipping the _ss/_h/_ca side files Foldseek creates,
+#   and preferring a precomputed createindex version of a database when there is one),
+# - run the easy-search jobs concurrently, giving each job a fixed number of threads so that all
+#   running jobs together stay inside a total CPU budget,
+# - give every job its own tmp folder and log file,
+# - record the exit code and wall time of every job.
+# The Foldseek executable comes from $FOLDSEEK_BIN (default "foldseek"), so a stub script can stand
+# in for it when I want to check the scheduling without real databases.
+
+import os          # I use this for paths, CPU counts and environment variables.
+import shutil      # I use this to remove each job's tmp folder after a successful run.
+import subprocess  # I use this instead of os.system so I get exit codes.
+import tempfile    # I use this to give every search its own tmp folder.
+import time        # I use this to time each job.
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from instrumentation import record_subprocess  # Every foldseek call goes to the run log with its duration.
+
+FOLDSEEK_BIN = os.environ.get("FOLDSEEK_BIN", "foldseek")
+
+# Foldseek writes several side databases next to each real one (e.g. afdb50_ss.dbtype, afdb50_h.dbtype).
+# Only the main database is a valid search target.
+SIDE_SUFFIXES = ("_ss", "_h", "_ca", "_seq", "_seq_h", "_seq_ca", "_aln", "_mapping", "_taxonomy", ".idx")
+INDEXED_SUFFIX = "_indexed"
+
+
+def foldseek_command(*args, threads=None):
+    cmd = [FOLDSEEK_BIN] + [str(a) for a in args]
+    if threads:
+        cmd += ["--threads", str(threads)]
+    return cmd
+
+
+def run_logged(cmd, log_path, env=None):
+    # I run cmd with its output going to log_path and return (exit_code, seconds).
+    start = time.perf_counter()
+    with open(log_path, 'w') as log:
+        log.write(" ".join(cmd) + "\n")
+        log.flush()
+        try:
+            code = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT, env=env).returncode
+        except FileNotFoundError as e:
+            log.write(f"{e}\n")
+            code = 127
+    seconds = time.perf_counter() - start
+    record_subprocess(cmd, seconds, code, log=log_path)
+    return code, seconds
+
+
+def create_query_db(fasta_file, query_db, prost_model, threads=None, log_dir="."):
+    # I build the ProstT5 structural database from the FASTA and stop if Foldseek fails.
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(log_dir, f"createdb_{os.path.basename(query_db)}.log")
+    cmd = foldseek_command("createdb", fasta_file, query_db, "--prostt5-model", prost_model, threads=threads)
+    code, seconds = run_logged(cmd, log_path)
+    if code != 0:
+        raise RuntimeError(f"foldseek createdb failed with exit code {code} (see {log_path})")
+    print(f"✅ createdb finished in {seconds:.1f}s")
+    return seconds
+
+
+def database_size(path):
+    # The size of a database's main data files, which I use as a rough estimate of its search time.
+    folder, name = os.path.split(path)
+    total = 0
+    for file in os.listdir(folder or "."):
+        if file == name or (file.startswith(name + ".") and file[len(name) + 1:].isdigit()):
+            total += os.path.getsize(os.path.join(folder, file))
+    return total
+
+
+def discover_databases(database_dir, exclude_prefix=None):
+    # I return one entry per searchable database: {"name", "path", "indexed", "size"}.
+    names = set()
+    for file in os.listdir(database_dir):
+        if not file.endswith(".dbtype"):
+            continue
+        name = file[:-len(".dbtype")]
+        if name.endswith(SIDE_SUFFIXES) or (exclude_prefix and name.startswith(exclude_prefix)):
+            continue
+        names.add(name)
+
+    chosen = {}
+    for name in sorted(names):
+        path = os.path.join(database_dir, name)
+        # A database is "indexed" if createindex was run on it (db.idx exists), or if it is the
+        # "<name>_indexed" copy of another database in the same folder.
+        indexed = os.path.exists(path + ".idx") or name.endswith(INDEXED_SUFFIX)
+        base = name[:-len(INDEXED_SUFFIX)] if name.endswith(INDEXED_SUFFIX) else name
+        entry = {"name": base, "path": path, "indexed": indexed, "size": database_size(path)}
+        if base not in chosen or (indexed and not chosen[base]["indexed"]):
+            chosen[base] = entry
+    return list(chosen.values())
+
+
+def run_search(query_db, database, results_dir, tmp_root, threads, extra_args=()):
+    # I run one easy-search in its own tmp folder and report how it went.
+    out_m8 = os.path.join(results_dir, f"results_{database['name']}.m8")
+    log_path = os.path.join(results_dir, f"search_{database['name']}.log")
+    tmp_dir = tempfile.mkdtemp(prefix=f"{database['name']}-", dir=tmp_root)
+    cmd = foldseek_command("easy-search", query_db, database["path"], out_m8, tmp_dir, *extra_args,
+                           threads=threads)
+    code, seconds = run_logged(cmd, log_path)
+    if code == 0:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {"database": database["name"], "target": database["path"], "indexed": database["indexed"],
+            "m8": out_m8, "log": log_path, "threads": threads, "exit_code": code,
+            "seconds": round(seconds, 3), "ok": code == 0 and os.path.exists(out_m8)}
+
+
+def schedule_searches(query_db, databases, results_dir, cpu_budget=None, threads_per_job=None,
+                      extra_args=(), on_result=None):
+    # I run every database search with at most cpu_budget threads in use at once.
+    # Each job gets threads_per_job threads; by default I split the budget so that as many databases
+    # as possible run side by side. Bigger databases are started first because they take longest.
+    # on_result(result) is called in the main thread as soon as each job finishes.
+    if not databases:
+        return []
+    cpu_budget = cpu_budget or os.cpu_count() or 1
+    threads_per_job = threads_per_job or max(1, cpu_budget // len(databases))
+    slots = max(1, min(len(databases), cpu_budget // threads_per_job))
+
+    os.makedirs(results_dir, exist_ok=True)
+    tmp_root = os.path.join(results_dir, "tmp")
+    os.makedirs(tmp_root, exist_ok=True)
+    ordered = sorted(databases, key=lambda db: db["size"], reverse=True)
+    print(f"▶ Searching {len(ordered)} databases, {slots} at a time with {threads_per_job} threads each")
+
+    results = []
+    with ThreadPoolExecutor(max_workers=slots) as pool:
+        futures = [pool.submit(run_search, query_db, db, results_dir, tmp_root, threads_per_job, extra_args)
+                   for db in ordered]
+        for future in as_completed(futures):
+            result = future.result()
+            status = "✅" if result["ok"] else f"❌ exit code {result['exit_code']}, see {result['log']}"
+            print(f"  {result['database']}: {result['seconds']:.1f}s {status}")
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return results
@@ -0,0 +1,116 @@
+# Script: hit_router.py
+# Purpose: Stream Foldseek hits straight into per-category files (up/down/significant/...).
+
+# ======================= OVERVIEW ==========================
+# fasta_to_foldseek.py used to keep every hit line in four Python lists (all, up, down, significant)
+# and only wrote them out at the very end, splitting each line three times on the way. Against the big
+# databases that was the peak-memory point of the whole pipeline, and a crash lost everything.
+# The router here writes each line to its files the moment it is read:
+# - each line is split once and the query accession is taken from the "sp|ACC|NAME" header,
+# - the accession is looked up once in an index built from all categories, so a line costs one
+#   dict lookup no matter how many categories there are,
+# - categories are just names mapped to accession sets, so contrasts other than up/down/significant
+#   can be added without touching this code, and a name like "ua_5v7_main/upregulated" writes
+#   ua_5v7_main/hits_upregulated.txt, so many contrasts can share one router,
+# - sinks can be gzip-compressed, and I keep a count per category for the end-of-run summary.
+
+import gzip  # I use this when compressed outputs are requested.
+import os    # I use this to build the output paths.
+
+from m8_reader import query_accession
+
+# The categories fasta_to_foldseek.py has always produced, and where their accession lists live.
+DEFAULT_CATEGORY_FILES = {
+    "upregulated": "upregulated_accessions.txt",
+    "downregulated": "downregulated_accessions.txt",
+    "significant": "all_significant_accessions.txt",
+}
+
+
+def load_accessions(path):
+    # I load one accession per line into a set. A missing file simply means an empty category.
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return set(line.strip() for line in f if line.strip())
+    return set()
+
+
+def load_categories(category_files):
+    # category_files maps a category name to its accession list file.
+    return {name: load_accessions(path) for name, path in category_files.items()}
+
+
+class HitRouter:
+    def __init__(self, output_dir, categories, all_name="all", compress=False,
+                 filename_template="hits_{name}.txt", buffer_size=1024 * 1024):
+        # categories maps a name (e.g. "upregulated") to a set of query accessions.
+        # Every hit also goes to the all_name sink unless all_name is None.
+        self.output_dir = output_dir
+        self.counts = {}
+        self.paths = {}
+        self.sinks = {}
+        os.makedirs(output_dir, exist_ok=True)
+
+        names = ([all_name] if all_name else []) + list(categories)
+        for name in names:
+            folder, _, leaf = name.rpartition("/")
+            filename = filename_template.format(name=leaf) + (".gz" if compress else "")
+            path = os.path.join(output_dir, folder, filename)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.paths[name] = path
+            self.counts[name] = 0
+            if compress:
+                self.sinks[name] = gzip.open(path, 'wt', compresslevel=6)
+            else:
+                self.sinks[name] = open(path, 'w', buffering=buffer_size)
+
+        # I invert the categories once: accession -> every category sink it belongs to.
+        self.always = [all_name] if all_name else []
+        self.index = {}
+        for name, accessions in categories.items():
+            for acc in accessions:
+                self.index.setdefault(acc, []).append(name)
+        self.query_cache = {}  # Raw query ID -> category names, so each distinct header is parsed once.
+
+    def route_line(self, line):
+        # I write one hit line to every sink it belongs to.
+        if not line.strip():
+            return
+        if not line.endswith('\n'):
+            line += '\n'
+        query = line.split('\t', 1)[0]
+        names = self.query_cache.get(query)
+        if names is None:
+            names = self.always + self.index.get(query_accession(query), [])
+            self.query_cache[query] = names
+        for name in names:
+            self.sinks[name].write(line)
+            self.counts[name] += 1
+
+    def route_file(self, path):
+        # I stream a whole .m8 file through the router and flush so finished files are safe on disk.
+        routed = 0
+        with open(path, 'r') as f:
+            for line in f:
+                self.route_line(line)
+                routed += 1
+        self.flush()
+        return routed
+
+    def flush(self):
+        for sink in self.sinks.values():
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks.values():
+            sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def summary(self):
+        for name, count in self.counts.items():
+            print(f"  - {count} {name} ({self.paths[name]})")
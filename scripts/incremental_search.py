@@ -0,0 +1,250 @@
+# Script: incremental_search.py
+# Purpose: Only embed and search the query sequences that have not been searched before.
+
+# ======================= OVERVIEW ==========================
+# fasta_to_foldseek.py rebuilt ua5v7_structural_db from the whole FASTA and searched every query against
+# every database on each run, so adding ten proteins to a 339-protein run cost 349 proteins of ProstT5
+# and search time. Here every query is keyed on the SHA-256 of its sequence, and two caches live in
+# .foldseek_cache/:
+# - 3Di: sequences that have never been seen are written to a new "batch" FASTA (headers are the hashes)
+#   and go through ProstT5 createdb once; sequences.tsv records which batch database holds which hash,
+# - hits: for every target database *version* (its path, the size and mtime of its data files and the
+#   search arguments) I keep the hit rows of every hash searched so far, plus the list of searched hashes
+#   (so queries without hits are not searched again).
+# A run then only searches, per database, the hashes missing from that database's cache. Foldseek
+# createsubdb cuts those entries out of the batch databases (no second ProstT5 pass), the searches are run
+# by foldseek_scheduler, and the fresh rows are added to the cache. Finally results_<db>.m8 is written from
+# the cache for every query in the FASTA (with its own query ID, so duplicated sequences are searched once),
+# in the same place and format as a full run, so hit routing and summarize.py do not change.
+
+import hashlib   # I use this for sequence hashes and database versions.
+import json      # I use this to build the database version key.
+import os        # I use this for paths and file stats.
+import shutil    # I use this to clean up the per-run work folder.
+import uuid      # I use this to name new batches.
+
+from fasta_partition import iter_records, open_binary
+from foldseek_scheduler import create_query_db, foldseek_command, run_logged, schedule_searches
+from instrumentation import count, timed
+
+DEFAULT_CACHE_DIR = ".foldseek_cache"
+SEQUENCE_INDEX = "sequences.tsv"
+SIDE_DATABASES = ("", "_ss", "_h", "_ca")  # the query database and the side files createsubdb must follow
+
+
+# === Sequences ===
+def sequence_hash(sequence):
+    # Case and a trailing stop codon do not change the protein, so they do not change the key.
+    if isinstance(sequence, str):
+        sequence = sequence.encode()
+    return hashlib.sha256(sequence.upper().rstrip(b"*")).hexdigest()
+
+
+def read_queries(fasta_file):
+    # [(query ID as Foldseek reports it, sequence hash, record lines)] in FASTA order.
+    queries = []
+    with open_binary(fasta_file) as handle:
+        for record in iter_records(handle):
+            query_id = record.header[1:].split(None, 1)[0] if len(record.header) > 1 else ""
+            queries.append((query_id, sequence_hash(record.sequence), record.lines))
+    return queries
+
+
+def database_version(database, extra_args=()):
+    # A short key that changes whenever the target database files or the search arguments change.
+    folder, name = os.path.split(database["path"])
+    files = []
+    for file in sorted(os.listdir(folder or ".")):
+        if file == name or file.startswith(name + "."):
+            st = os.stat(os.path.join(folder, file))
+            files.append([file, st.st_size, st.st_mtime_ns])
+    key = json.dumps([os.path.abspath(database["path"]), files, [str(a) for a in extra_args]])
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+# === Cache ===
+class SearchCache:
+    def __init__(self, root=DEFAULT_CACHE_DIR):
+        self.root = root
+        self.batch_dir = os.path.join(root, "batches")
+        self.hit_dir = os.path.join(root, "hits")
+        os.makedirs(self.batch_dir, exist_ok=True)
+        os.makedirs(self.hit_dir, exist_ok=True)
+        self.index_path = os.path.join(root, SEQUENCE_INDEX)
+        self.batches = {}  # sequence hash -> batch name
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                for line in f:
+                    seq_hash, batch = line.rstrip('\n').split('\t')
+                    self.batches[seq_hash] = batch
+
+    def batch_db(self, batch):
+        return os.path.join(self.batch_dir, batch, "db")
+
+    # === 3Di conversions ===
+    def add_sequences(self, queries, prost_model, threads=None):
+        # I run ProstT5 createdb once over every sequence that is not cached yet. Returns the new hashes.
+        new = {}
+        for _, seq_hash, lines in queries:
+            if seq_hash not in self.batches and seq_hash not in new:
+                new[seq_hash] = lines
+        count("incremental.sequences_cached", len({h for _, h, _ in queries}) - len(new))
+        count("incremental.sequences_new", len(new))
+        if not new:
+            return []
+        batch = uuid.uuid4().hex[:12]
+        folder = os.path.dirname(self.batch_db(batch))
+        os.makedirs(folder, exist_ok=True)
+        batch_fasta = os.path.join(folder, "sequences.fasta")
+        with open(batch_fasta, 'wb') as f:
+            for seq_hash, lines in new.items():
+                f.write(f">{seq_hash}\n".encode())
+                f.writelines(lines[1:])
+        create_query_db(batch_fasta, self.batch_db(batch), prost_model, threads=threads, log_dir=folder)
+        # The index is only extended once createdb worked, so a failed batch is simply redone next time.
+        with open(self.index_path, 'a') as f:
+            f.writelines(f"{seq_hash}\t{batch}\n" for seq_hash in new)
+        self.batches.update((seq_hash, batch) for seq_hash in new)
+        return list(new)
+
+    def subset_db(self, batch, hashes, output_db, log_dir):
+        # createsubdb the given hashes out of a batch database (and its side databases), so they can be
+        # searched without running ProstT5 again. Hashes are mapped to keys through the batch's .lookup.
+        source = self.batch_db(batch)
+        wanted = set(hashes)
+        keys_path = output_db + ".keys"
+        with open(source + ".lookup", 'r') as lookup, open(keys_path, 'w') as keys:
+            for line in lookup:
+                key, name = line.split('\t')[:2]
+                if name in wanted:
+                    keys.write(key + '\n')
+        for suffix in SIDE_DATABASES:
+            if not os.path.exists(source + suffix + ".dbtype"):
+                continue
+            log_path = os.path.join(log_dir, f"createsubdb_{os.path.basename(output_db)}{suffix}.log")
+            code, _ = run_logged(foldseek_command("createsubdb", keys_path, source + suffix, output_db + suffix),
+                                 log_path)
+            if code != 0:
+                raise RuntimeError(f"foldseek createsubdb failed with exit code {code} (see {log_path})")
+        return output_db
+
+    # === Hits ===
+    def hit_paths(self, database, version):
+        folder = os.path.join(self.hit_dir, database["name"])
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, f"{version}.m8"), os.path.join(folder, f"{version}.searched")
+
+    def searched(self, database, version):
+        _, searched_path = self.hit_paths(database, version)
+        if not os.path.exists(searched_path):
+            return set()
+        with open(searched_path, 'r') as f:
+            return set(line.strip() for line in f if line.strip())
+
+    def add_hits(self, database, version, m8_path, hashes):
+        # I append the rows of a finished search (its query column is the sequence hash) and only then mark
+        # the hashes as searched, so an interrupted run never leaves hashes marked without their rows.
+        hits_path, searched_path = self.hit_paths(database, version)
+        rows = 0
+        with open(hits_path, 'a') as out:
+            if os.path.exists(m8_path):
+                with open(m8_path, 'r') as f:
+                    for line in f:
+                        if line.strip():
+                            out.write(line if line.endswith('\n') else line + '\n')
+                            rows += 1
+        with open(searched_path, 'a') as f:
+            f.writelines(seq_hash + '\n' for seq_hash in hashes)
+        return rows
+
+    def hits(self, database, version, hashes):
+        # {hash: [rest of the m8 line after the query column]} for the requested hashes.
+        hits_path, _ = self.hit_paths(database, version)
+        wanted = set(hashes)
+        rows = {}
+        if os.path.exists(hits_path):
+            with open(hits_path, 'r') as f:
+                for line in f:
+                    seq_hash, _, rest = line.partition('\t')
+                    if seq_hash in wanted:
+                        rows.setdefault(seq_hash, {})[rest] = None
+        # Rows appended by a run that died before marking its hashes come back on the rerun; identical
+        # lines are only kept once.
+        return {seq_hash: list(lines) for seq_hash, lines in rows.items()}
+
+
+# === Incremental search ===
+def write_results(queries, rows, out_m8):
+    # results_<db>.m8 for the whole FASTA, in FASTA order, with every query's own ID.
+    tmp_path = out_m8 + ".tmp"
+    written = 0
+    with open(tmp_path, 'w') as out:
+        for query_id, seq_hash, _ in queries:
+            for rest in rows.get(seq_hash, ()):
+                out.write(f"{query_id}\t{rest}")
+                written += 1
+    os.replace(tmp_path, out_m8)
+    return written
+
+
+@timed("incremental.search")
+def incremental_search(fasta_file, databases, results_dir, prost_model, cache_dir=DEFAULT_CACHE_DIR,
+                       cpu_budget=None, threads_per_job=None, extra_args=(), on_result=None):
+    # The incremental counterpart of create_query_db + schedule_searches: same results_<db>.m8 outputs and
+    # the same on_result(result) callback, but only uncached (sequence, database version) pairs are run.
+    os.makedirs(results_dir, exist_ok=True)
+    cache = SearchCache(cache_dir)
+    queries = read_queries(fasta_file)
+    hashes = list(dict.fromkeys(seq_hash for _, seq_hash, _ in queries))
+    new = cache.add_sequences(queries, prost_model, threads=cpu_budget)
+    print(f"🧬 {len(hashes)} unique sequences, {len(new)} new ProstT5 conversions")
+
+    # Which hashes does every database still need? Databases that need the same hashes share one query DB.
+    versions, groups = {}, {}
+    for database in databases:
+        version = database_version(database, extra_args)
+        versions[database["name"]] = version
+        done = cache.searched(database, version)
+        todo = tuple(seq_hash for seq_hash in hashes if seq_hash not in done)
+        count("incremental.searches_cached", len(hashes) - len(todo))
+        count("incremental.searches_new", len(todo))
+        print(f"  {database['name']}: {len(hashes) - len(todo)} cached, {len(todo)} to search")
+        if todo:
+            groups.setdefault(todo, []).append(database)
+
+    work_dir = os.path.join(results_dir, "incremental_work")
+    failed = set()
+    for n, (todo, group) in enumerate(groups.items()):
+        # One search per database for each batch the missing hashes live in.
+        by_batch = {}
+        for seq_hash in todo:
+            by_batch.setdefault(cache.batches[seq_hash], []).append(seq_hash)
+        for batch, batch_hashes in by_batch.items():
+            run_dir = os.path.join(work_dir, f"group{n}_{batch}")
+            os.makedirs(run_dir, exist_ok=True)
+            query_db = cache.subset_db(batch, batch_hashes, os.path.join(run_dir, "query_db"), run_dir)
+            for result in schedule_searches(query_db, group, run_dir, cpu_budget=cpu_budget,
+                                            threads_per_job=threads_per_job, extra_args=extra_args):
+                database = next(db for db in group if db["name"] == result["database"])
+                if result["ok"]:
+                    cache.add_hits(database, versions[database["name"]], result["m8"], batch_hashes)
+                else:
+                    failed.add(database["name"])
+    if not failed:
+        shutil.rmtree(work_dir, ignore_errors=True)  # on failure I keep the logs for a look
+
+    results = []
+    for database in databases:
+        out_m8 = os.path.join(results_dir, f"results_{database['name']}.m8")
+        ok = database["name"] not in failed
+        written = 0
+        if ok:
+            written = write_results(queries, cache.hits(database, versions[database["name"]], hashes), out_m8)
+        result = {"database": database["name"], "target": database["path"], "m8": out_m8, "hits": written,
+                  "version": versions[database["name"]], "ok": ok,
+                  "log": work_dir if not ok else None}
+        print(f"  {database['name']}: " + (f"✅ {written} hits" if ok else f"❌ search failed, see {work_dir}"))
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+    return results
@@ -0,0 +1,254 @@
+# Script: instrumentation.py
+# Purpose: Shared timers, counters and a JSON-lines run log for every pipeline script.
+
+# ======================= OVERVIEW ==========================
+# The scripts only ever told me what they were doing through emoji prints, so after a long run there was
+# no record of how long createdb or each easy-search took, how many UniProt / AlphaFold requests were made,
+# how many bytes came down or how often a server made me retry. This module is the one place that is recorded:
+# - timer("name") is a context manager and timed("name") a decorator; both measure wall time and the
+#   peak RSS seen while they were open,
+# - count("name", n) keeps counters (requests, bytes, retries, status codes, ...),
+# - instrument_session(session) hooks a requests.Session so every response is counted by status code,
+#   with the bytes actually read from its body and its server time, without touching the calling code,
+# - record_subprocess() logs external commands (foldseek) with their exit code and duration,
+# - a background thread samples the resident memory twice a second, so peaks between timers are seen too.
+# Nothing is written until a script calls start_run("name"): from then on every event goes as one JSON line
+# to run_logs/<name>_<timestamp>.jsonl, and at exit a summary table (per timer: calls, total, mean, max,
+# peak memory; plus all counters) is printed and appended to the log as the last line.
+# Without start_run the timers and counters still work in memory, so library code can always call them.
+
+import atexit     # I use this to write the summary when a script ends.
+import datetime   # I use this for timestamps.
+import functools  # I use this for the decorator.
+import json       # I use this for the run log.
+import os         # I use this for paths and the process ID.
+import sys
+import threading  # I use this for the lock and the memory sampler.
+import time       # I use this for the timers.
+from contextlib import contextmanager
+
+try:
+    import resource  # Peak RSS on Linux / macOS.
+except ImportError:
+    resource = None
+
+DEFAULT_LOG_DIR = "run_logs"
+SAMPLE_INTERVAL = 0.5  # seconds between memory samples
+
+
+# === Memory ===
+def current_rss_mb():
+    # Resident memory right now. /proc is Linux only; elsewhere I fall back to the peak so far.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)  # bytes on macOS, KiB on Linux
+
+
+# === Run state ===
+class Run:
+    def __init__(self):
+        self.name = None
+        self.run_id = None
+        self.log_path = None
+        self.log = None
+        self.lock = threading.Lock()
+        self.timers = {}      # name -> {"calls", "total", "max", "peak_rss_mb"}
+        self.counters = {}    # name -> number
+        self.open_timers = {}  # token -> [name, peak rss seen while open]
+        self.sampler = None
+        self.stopped = threading.Event()
+        self.started = time.perf_counter()
+
+    def emit(self, event, **fields):
+        if self.log is None:
+            return
+        record = {"ts": datetime.datetime.now().isoformat(timespec="milliseconds"), "run": self.run_id,
+                  "event": event, **fields}
+        line = json.dumps(record, default=str)
+        with self.lock:
+            self.log.write(line + "\n")
+            self.log.flush()
+
+    def sample_memory(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            rss = current_rss_mb()
+            if rss is None:
+                continue
+            with self.lock:
+                for entry in self.open_timers.values():
+                    entry[1] = max(entry[1] or 0.0, rss)
+
+
+_run = Run()
+
+
+def start_run(name, log_dir=DEFAULT_LOG_DIR, sample_memory=True):
+    # I start logging this script's events to run_logs/<name>_<timestamp>.jsonl and print a summary at exit.
+    if _run.log is not None:
+        return _run.log_path
+    os.makedirs(log_dir, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    _run.name = name
+    _run.run_id = f"{name}_{stamp}_{os.getpid()}"
+    _run.log_path = os.path.join(log_dir, f"{_run.run_id}.jsonl")
+    _run.log = open(_run.log_path, 'a')
+    _run.emit("run_start", name=name, argv=sys.argv, pid=os.getpid(), cwd=os.getcwd())
+    if sample_memory:
+        _run.sampler = threading.Thread(target=_run.sample_memory, daemon=True)
+        _run.sampler.start()
+    atexit.register(finish_run)
+    return _run.log_path
+
+
+def finish_run(print_summary=True):
+    # I write the summary as the last log line and print the table. Safe to call more than once.
+    if _run.log is None:
+        return None
+    _run.stopped.set()
+    summary = summary_rows()
+    _run.emit("run_end", seconds=round(time.perf_counter() - _run.started, 4), peak_rss_mb=peak_rss_mb(),
+              timers=summary, counters=dict(_run.counters))
+    _run.log.close()
+    _run.log = None
+    if print_summary:
+        print(format_summary(summary, _run.counters))
+        print(f"🧾 Run log: {_run.log_path}")
+    return summary
+
+
+# === Timers ===
+@contextmanager
+def timer(name, **fields):
+    # with timer("foldseek.search", database="afdb50"): ...
+    token = object()
+    with _run.lock:
+        _run.open_timers[token] = [name, current_rss_mb()]
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        rss = current_rss_mb()
+        with _run.lock:
+            _, peak = _run.open_timers.pop(token)
+            peaks = [p for p in (peak, rss) if p is not None]
+            peak = max(peaks) if peaks else None
+            stats = _run.timers.setdefault(name, {"calls": 0, "total": 0.0, "max": 0.0, "peak_rss_mb": None})
+            stats["calls"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            if peak is not None:
+                stats["peak_rss_mb"] = max(stats["peak_rss_mb"] or 0.0, peak)
+        _run.emit("timer", name=name, seconds=round(seconds, 6),
+                  peak_rss_mb=round(peak, 1) if peak is not None else None,
+                  **({"error": error} if error else {}), **fields)
+
+
+def timed(name=None):
+    # @timed("parse") or @timed() (uses the function's module and name)
+    def decorate(func):
+        label = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# === Counters ===
+def count(name, value=1):
+    with _run.lock:
+        _run.counters[name] = _run.counters.get(name, 0) + value
+
+
+def counters():
+    with _run.lock:
+        return dict(_run.counters)
+
+
+def event(name, **fields):
+    # A free-form log line (e.g. a download result) for things that are neither timers nor counters.
+    _run.emit(name, **fields)
+
+
+# === HTTP and subprocesses ===
+def count_body_bytes(response):
+    # The hook runs before the body is read, and chunked or streamed responses have no Content-Length,
+    # so I count http.bytes as the body is actually read. .content, .json(), iter_lines() and streamed
+    # downloads all read through iter_content, so wrapping it on this one response covers them all.
+    iter_content = response.iter_content
+
+    def counted(*args, **kwargs):
+        for chunk in iter_content(*args, **kwargs):
+            count("http.bytes", len(chunk))
+            yield chunk
+
+    response.iter_content = counted
+
+
+def record_http(response, *args, **kwargs):
+    # requests response hook: one event and a few counters per response. The event's declared_bytes is
+    # the Content-Length header (0 when the server does not send one); http.bytes counts the bytes read,
+    # after any Content-Encoding is decoded.
+    host = response.url.split('/')[2] if '://' in response.url else ""
+    declared = int(response.headers.get("Content-Length") or 0)
+    count("http.requests")
+    count(f"http.status.{response.status_code}")
+    count_body_bytes(response)
+    _run.emit("http", method=response.request.method, host=host, url=response.url.split('?')[0],
+              status=response.status_code, declared_bytes=declared,
+              seconds=round(response.elapsed.total_seconds(), 4))
+
+
+def instrument_session(session):
+    if record_http not in session.hooks["response"]:
+        session.hooks["response"].append(record_http)
+    return session
+
+
+def record_subprocess(cmd, seconds, exit_code, **fields):
+    name = f"subprocess.{os.path.basename(cmd[0])}" + (f".{cmd[1]}" if len(cmd) > 1 else "")
+    with _run.lock:
+        stats = _run.timers.setdefault(name, {"calls": 0, "total": 0.0, "max": 0.0, "peak_rss_mb": None})
+        stats["calls"] += 1
+        stats["total"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+    count("subprocess.failed" if exit_code else "subprocess.ok")
+    _run.emit("subprocess", cmd=" ".join(map(str, cmd)), seconds=round(seconds, 4), exit_code=exit_code, **fields)
+
+
+# === Summary ===
+def summary_rows():
+    with _run.lock:
+        return [{"name": name, "calls": s["calls"], "total_s": round(s["total"], 4),
+                 "mean_s": round(s["total"] / s["calls"], 4), "max_s": round(s["max"], 4),
+                 "peak_rss_mb": round(s["peak_rss_mb"], 1) if s["peak_rss_mb"] is not None else None}
+                for name, s in sorted(_run.timers.items(), key=lambda item: -item[1]["total"])]
+
+
+def format_summary(rows, counter_values):
+    lines = ["", "📊 Run summary",
+             f"{'stage':<40} {'calls':>6} {'total s':>10} {'mean s':>9} {'max s':>9} {'peak MiB':>9}"]
+    for row in rows:
+        peak = f"{row['peak_rss_mb']:>9.1f}" if row["peak_rss_mb"] is not None else f"{'n/a':>9}"
+        lines.append(f"{row['name']:<40} {row['calls']:>6} {row['total_s']:>10.3f} {row['mean_s']:>9.3f} "
+                     f"{row['max_s']:>9.3f} {peak}")
+    if counter_values:
+        lines.append("")
+        lines.extend(f"{name:<40} {value:>12,}" for name, value in sorted(counter_values.items()))
+    return "\n".join(lines)
@@ -0,0 +1,156 @@
+# Script: m8_reader.py
+# Purpose: One typed, cached loader for Foldseek .m8 result tables.
+
+# ======================= OVERVIEW ==========================
+# Before this module, every script parsed .m8 files its own way: download.py with pd.read_csv plus
+# pd.concat inside a loop, summarize.py and the WIP download.py by splitting lines by hand.
+# Here I read them once, with compact dtypes:
+# - query / target as categoricals (the same IDs repeat thousands of times),
+# - fident / bitscore as float32, alignment lengths and coordinates as int32,
+# - evalue stays float64, because Foldseek e-values go far below what float32 can hold.
+# Parsed tables are cached next to the .m8 as "<file>.m8.parquet". The cache remembers the size and
+# mtime of the text file it came from and is rebuilt automatically when either changes.
+# The Parquet cache needs pyarrow; without it I simply parse the text every time.
+# Several files are loaded in parallel and concatenated once, with a source_db column.
+
+import os  # I use this for file stats and paths.
+from concurrent.futures import ThreadPoolExecutor  # I use this to load several files at once.
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # The cache is optional; parsing works without it.
+    pa = pq = None
+
+# These are the columns of Foldseek's default tabular output (--format-output left at its default).
+M8_COLUMNS = [
+    "query",      # 0 – query ID (for ProstT5 runs this is the FASTA header, e.g. sp|Q8DUY0|...)
+    "target",     # 1 – target ID, e.g. AF-A0A660S8M7-F1-model_v4
+    "fident",     # 2 – fraction of identical residues
+    "alnlen",     # 3 – alignment length
+    "mismatch",   # 4 – number of mismatches
+    "gap_open",   # 5 – gap opens
+    "q_start",    # 6 – start of alignment in query
+    "q_end",      # 7 – end of alignment in query
+    "t_start",    # 8 – start in target
+    "t_end",      # 9 – end in target
+    "evalue",     # 10 – match confidence
+    "bitscore"    # 11 – structural similarity score
+]
+
+M8_DTYPES = {
+    "query": "category",
+    "target": "category",
+    "fident": np.float32,
+    "alnlen": np.int32,
+    "mismatch": np.int32,
+    "gap_open": np.int32,
+    "q_start": np.int32,
+    "q_end": np.int32,
+    "t_start": np.int32,
+    "t_end": np.int32,
+    "evalue": np.float64,
+    "bitscore": np.float32,
+}
+
+CACHE_SUFFIX = ".parquet"
+CACHE_VERSION = "1"
+
+
+def query_accession(query_id):
+    # Queries built from UniProt FASTA headers look like "sp|Q8DUY0|NAME_STRMU"; I return the accession.
+    parts = query_id.split('|')
+    return parts[1] if len(parts) >= 3 else query_id
+
+
+def empty_m8():
+    return pd.DataFrame({name: pd.Series(dtype=M8_DTYPES[name]) for name in M8_COLUMNS})
+
+
+def parse_m8(path):
+    # I parse the text file straight into the compact dtypes. Extra columns (e.g. from the web API) are ignored.
+    if os.path.getsize(path) == 0:
+        return empty_m8()
+    return pd.read_csv(path, sep='\t', header=None, names=M8_COLUMNS, usecols=range(len(M8_COLUMNS)),
+                       dtype=M8_DTYPES, engine="c")
+
+
+def source_stamp(path):
+    st = os.stat(path)
+    return {b"m8_size": str(st.st_size).encode(), b"m8_mtime_ns": str(st.st_mtime_ns).encode(),
+            b"m8_cache_version": CACHE_VERSION.encode()}
+
+
+def cache_is_fresh(path, cache_path):
+    # I only trust the cache when it was written from a file of the same size and mtime.
+    if pq is None or not os.path.exists(cache_path):
+        return False
+    try:
+        metadata = pq.read_schema(cache_path).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return False
+    stamp = source_stamp(path)
+    return all(metadata.get(key) == value for key, value in stamp.items())
+
+
+def write_cache(df, path, cache_path):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), **source_stamp(path)})
+    tmp_path = cache_path + ".tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, cache_path)
+
+
+@timed("m8.read")
+def read_m8(path, use_cache=True):
+    # I return the .m8 at path as a typed DataFrame, from the Parquet sidecar when it is up to date.
+    cache_path = path + CACHE_SUFFIX
+    if use_cache and cache_is_fresh(path, cache_path):
+        df = pq.read_table(cache_path).to_pandas()
+        # Parquet keeps the dtypes, except for empty categoricals, so I restore any that drifted.
+        drifted = {name: dtype for name, dtype in M8_DTYPES.items()
+                   if str(df[name].dtype) != str(pd.Series(dtype=dtype).dtype)}
+        return df.astype(drifted) if drifted else df
+
+    df = parse_m8(path)
+    if use_cache and pq is not None:
+        try:
+            write_cache(df, path, cache_path)
+        except OSError as e:
+            print(f"⚠️ Could not write m8 cache {cache_path}: {e}")
+    return df
+
+
+def concat_m8(frames, sources=None, source_column="source_db"):
+    # I concatenate typed frames without losing the categoricals: the categories are unified first,
+    # otherwise pandas would silently fall back to (much larger) object columns.
+    frames = list(frames)
+    if not frames:
+        df = empty_m8()
+        if sources is not None:
+            df[source_column] = pd.Categorical([])
+        return df
+    for name in ("query", "target"):
+        categories = reduce(lambda a, b: a.union(b, sort=False),
+                            [f[name].cat.categories for f in frames if len(f)] or [frames[0][name].cat.categories])
+        for f in frames:
+            f[name] = f[name].cat.set_categories(categories)
+    if sources is not None:
+        for f, source in zip(frames, sources):
+            f[source_column] = pd.Categorical([source] * len(f), categories=list(dict.fromkeys(sources)))
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_m8_files(paths, workers=None, use_cache=True, source_column="source_db"):
+    # I load every file in parallel and tag each row with the file it came from.
+    paths = list(paths)
+    workers = workers or min(8, max(1, len(paths)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        frames = list(pool.map(lambda p: read_m8(p, use_cache=use_cache), paths))
+    return concat_m8(frames, [os.path.basename(p) for p in paths], source_column)
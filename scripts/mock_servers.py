@@ -0,0 +1,120 @@
+# Script: mock_servers.py
+# Purpose: A local stand-in for the AlphaFold file server and the UniProt stream endpoint.
+
+# ======================= OVERVIEW ==========================
+# The download stages (af_downloader.py, uniprot_fetcher.py) talk to public servers, which makes them
+# impossible to time reproducibly and rude to hammer in a benchmark. This server answers the same URLs locally:
+# - GET /files/<model_id>.pdb returns a synthetic AlphaFold-like model (the same bytes for the same ID),
+#   with Range support so resumed downloads can be exercised,
+# - GET /uniprotkb/stream?format=fasta&query=accession:A OR accession:B ... returns FASTA records,
+# - an optional delay per request and an optional "every Nth request gets 429 + Retry-After" imitate a
+#   slow or rate-limiting server.
+# The server runs on a background thread on 127.0.0.1 and a free port; base_url is what to hand to the
+# downloaders (as urls=... or base_url=...).
+
+import re          # I use this to pull accessions out of the UniProt query.
+import threading   # I use this to run the server in the background and count requests safely.
+import time        # I use this for the artificial latency.
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from synthetic_data import AMINO_ACIDS, model_pdb, model_seed, query_header
+
+
+def synthetic_fasta_record(accession, line_width=60):
+    rng = np.random.default_rng(model_seed(accession))
+    sequence = "".join(rng.choice(AMINO_ACIDS, int(rng.integers(80, 600))))
+    lines = [sequence[i:i + line_width] for i in range(0, len(sequence), line_width)]
+    return f">{query_header(accession)} Uncharacterized protein OS=Streptococcus mutans\n" + "\n".join(lines) + "\n"
+
+
+class MockServer:
+    def __init__(self, delay=0.0, throttle_every=0, retry_after=0, missing=()):
+        # delay: seconds added to every response; throttle_every: answer every Nth request with 429;
+        # missing: model IDs / accessions that should not exist (404 / left out of the FASTA).
+        self.delay = delay
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.missing = set(missing)
+        self.requests = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def model_url(self, model_id):
+        return f"{self.base_url}/files/{model_id}.pdb"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass  # Keep the benchmark output clean.
+
+            def send_body(self, status, body, content_type="text/plain", extra_headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (extra_headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+                with mock.lock:
+                    mock.bytes_sent += len(body)
+
+            def do_GET(self):
+                with mock.lock:
+                    mock.requests += 1
+                    count = mock.requests
+                if mock.delay:
+                    time.sleep(mock.delay)
+                if mock.throttle_every and count % mock.throttle_every == 0:
+                    self.send_body(429, b"slow down", extra_headers={"Retry-After": str(mock.retry_after)})
+                    return
+
+                url = urlparse(self.path)
+                if url.path.startswith("/files/") and url.path.endswith(".pdb"):
+                    model_id = url.path[len("/files/"):-len(".pdb")]
+                    if model_id in mock.missing:
+                        self.send_body(404, b"not found")
+                        return
+                    body = model_pdb(model_id)
+                    match = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+                    if match and int(match.group(1)) < len(body):
+                        start = int(match.group(1))
+                        self.send_body(206, body[start:], extra_headers={
+                            "Content-Range": f"bytes {start}-{len(body) - 1}/{len(body)}"})
+                    else:
+                        self.send_body(200, body)
+                elif url.path == "/uniprotkb/stream":
+                    query = parse_qs(url.query).get("query", [""])[0]
+                    accessions = re.findall(r"accession:([A-Z0-9]+)", query)
+                    body = "".join(synthetic_fasta_record(acc) for acc in accessions if acc not in mock.missing)
+                    self.send_body(200, body.encode())
+                else:
+                    self.send_body(404, b"not found")
+
+        return Handler
@@ -0,0 +1,129 @@
+# Script: multi_contrast.py
+# Purpose: Fetch and search the proteins of many DE contrasts once, then fan the hits back out per contrast.
+
+# ======================= OVERVIEW ==========================
+# The pipeline was wired for one contrast: one accession list -> ua5v7_DE_proteins.fasta ->
+# ua5v7_structural_db -> one round of Foldseek searches. Running the other strain comparisons the same way
+# would fetch, embed (ProstT5 createdb) and search every protein once per contrast it appears in, and most
+# proteins appear in several. Here the unit of work is the unique protein instead:
+# - the accession lists of all contrasts (as written by de_preprocessing.py) are merged into one ordered
+#   union, and I report how many fetches / searches that saves,
+# - the union is copied from the local proteome where possible and fetched from UniProt otherwise, into a
+#   single FASTA, which resumes like download_fasta_from_uniprot.py does,
+# - one createdb and one round of easy-search over that FASTA, scheduled like fasta_to_foldseek.py,
+# - every finished .m8 is streamed once through a single HitRouter whose categories are
+#   "<contrast>/<category>", so each contrast gets its own hits_upregulated / hits_downregulated /
+#   hits_significant files and a line costs one accession lookup however many contrasts there are.
+# Compute scales with the number of unique proteins; contrasts only add output files.
+
+import os  # I use this for paths.
+
+from de_preprocessing import CATEGORY_FILES, preprocess_workbook
+from fasta_index import FastaIndex
+from foldseek_scheduler import create_query_db, discover_databases, schedule_searches
+from hit_router import HitRouter, load_accessions
+from instrumentation import count, timer
+from uniprot_fetcher import existing_accessions, fetch_fasta
+
+
+# === Contrasts ===
+def contrasts_from_folder(folder=".", category_files=CATEGORY_FILES):
+    # I find the <contrast>_<suffix> lists de_preprocessing.py writes and return
+    # {contrast: {category: path}}. The plain main-sheet copies (no contrast prefix) are skipped.
+    contrasts = {}
+    for name in sorted(os.listdir(folder)):
+        for category, suffix in category_files.items():
+            if name.endswith("_" + suffix):
+                slug = name[:-len(suffix) - 1]
+                contrasts.setdefault(slug, {})[category] = os.path.join(folder, name)
+    return contrasts
+
+
+def contrasts_from_workbook(excel_file, output_dir=".", **kwargs):
+    # I run the DE preprocessing (cached) and return the same {contrast: {category: path}} mapping.
+    return {slug: info["files"] for slug, info in preprocess_workbook(excel_file, output_dir=output_dir,
+                                                                       **kwargs).items()}
+
+
+def load_contrasts(contrast_files):
+    # {contrast: {category: path}} -> {contrast: {category: set of accessions}}
+    return {slug: {category: load_accessions(path) for category, path in files.items()}
+            for slug, files in contrast_files.items()}
+
+
+def union_accessions(contrasts):
+    # Every accession of every contrast exactly once, in first-seen order (sorted within a category,
+    # so the order does not depend on set iteration).
+    union = {}
+    memberships = 0
+    for categories in contrasts.values():
+        seen_here = set()
+        for accessions in categories.values():
+            seen_here.update(accessions)
+        memberships += len(seen_here)
+        for acc in sorted(seen_here):
+            union.setdefault(acc, None)
+    count("multi_contrast.memberships", memberships)
+    count("multi_contrast.unique", len(union))
+    print(f"🧮 {len(contrasts)} contrasts, {memberships} contrast/protein pairs, {len(union)} unique proteins"
+          + (f" ({memberships - len(union)} fetches and searches saved)" if memberships > len(union) else ""))
+    return list(union)
+
+
+def contrast_categories(contrasts):
+    # The router categories: "<contrast>/<category>" -> accessions.
+    return {f"{slug}/{category}": accessions
+            for slug, categories in contrasts.items() for category, accessions in categories.items()}
+
+
+# === Fetch ===
+def build_query_fasta(accessions, output_fasta, local_fasta=None, batch_size=100, workers=4, **fetch_kwargs):
+    # I write every accession once to output_fasta: first from the local proteome, then from UniProt.
+    # Accessions already in output_fasta (an earlier or interrupted run) are neither copied nor fetched.
+    copied = []
+    if local_fasta and os.path.exists(local_fasta):
+        already = existing_accessions(output_fasta)
+        with FastaIndex(local_fasta) as proteome:
+            copied = [acc for acc in accessions if acc in proteome and acc not in already]
+            proteome.write_fasta(copied, output_fasta, mode='a')
+        print(f"Copied {len(copied)} sequences from {local_fasta}")
+    result = fetch_fasta(accessions, output_fasta, batch_size=batch_size, workers=workers, **fetch_kwargs)
+    return {"copied": copied, **result}
+
+
+# === Search and fan-out ===
+def search_contrasts(query_fasta, contrasts, query_db, prost_model, database_dir, results_dir,
+                     cpu_budget=None, threads_per_job=None, compress=False, extra_args=()):
+    # One createdb and one easy-search per database over the union FASTA; hits are routed to
+    # results_dir/hits_all.txt and results_dir/<contrast>/hits_<category>.txt as each search finishes.
+    # Returns (search results, router counts).
+    os.makedirs(results_dir, exist_ok=True)
+    create_query_db(query_fasta, query_db, prost_model, threads=cpu_budget, log_dir=results_dir)
+    router = HitRouter(results_dir, contrast_categories(contrasts), compress=compress)
+
+    def route_results(result):
+        if result["ok"]:
+            with timer("hit_router.route_file", database=result["database"]):
+                router.route_file(result["m8"])
+
+    databases = discover_databases(database_dir, exclude_prefix=os.path.basename(query_db))
+    with router:
+        results = schedule_searches(query_db, databases, results_dir, cpu_budget=cpu_budget,
+                                    threads_per_job=threads_per_job, extra_args=extra_args,
+                                    on_result=route_results)
+    failed = [r["database"] for r in results if not r["ok"]]
+    if failed:
+        print(f"⚠️ Searches failed for: {', '.join(failed)}")
+    return results, dict(router.counts)
+
+
+def print_contrast_summary(counts):
+    # I group the router counts per contrast for the end-of-run summary.
+    print(f"✅ {counts.get('all', 0)} hits in total")
+    per_contrast = {}
+    for name, n in counts.items():
+        slug, _, category = name.rpartition("/")
+        if slug:
+            per_contrast.setdefault(slug, []).append(f"{n} {category}")
+    for slug, parts in per_contrast.items():
+        print(f"  - {slug}: {', '.join(parts)}")
@@ -0,0 +1,50 @@
+# Script: multi_contrast_search.py
+
+# ======================= OVERVIEW ==========================
+# fasta_to_foldseek.py and download_fasta_from_uniprot.py handle one contrast (UA 5v7). When I want the
+# other strain comparisons too, running them once per contrast would fetch, embed and search the same
+# proteins over and over, because most DE proteins show up in several contrasts.
+# This script does all contrasts in one batch (see multi_contrast.py):
+# - it picks up every <contrast>_*_accessions.txt list written by preprocessing_FoldSeek_input.py,
+# - builds one FASTA with each unique protein once (local proteome first, UniProt for the rest),
+# - runs one ProstT5 createdb and one easy-search per database over that FASTA,
+# - and splits the hits into multi_contrast_results/<contrast>/hits_upregulated.txt,
+#   hits_downregulated.txt and hits_significant.txt, plus one shared hits_all.txt.
+
+import os
+import instrumentation  # I use this to log the fetch, createdb, searches and routing of this run.
+from multi_contrast import (build_query_fasta, contrasts_from_folder, load_contrasts, print_contrast_summary,
+                            search_contrasts, union_accessions)
+
+instrumentation.start_run("multi_contrast_search")
+
+# === STEP 1: Settings ===
+lists_folder = "."                                  # Where preprocessing_FoldSeek_input.py wrote the lists.
+only_contrasts = None                               # None means every contrast found; or a list of names.
+query_fasta = "multi_contrast_proteins.fasta"       # One record per unique protein across all contrasts.
+query_db = "multi_contrast_structural_db"           # The ProstT5 createdb output for that FASTA.
+results_dir = "multi_contrast_results"
+prost_model = "weights"
+database_dir = "/mnt/classes/biol_594_694/group6/databases"
+local_fasta = "../DeepGOPlus/Streptococcus_mutans_proteome_UP000002512_2025_01_16.fasta"
+cpu_budget = os.cpu_count()
+
+# === STEP 2: Load every contrast and merge the accessions ===
+contrast_files = contrasts_from_folder(lists_folder)
+if only_contrasts is not None:
+    contrast_files = {slug: files for slug, files in contrast_files.items() if slug in only_contrasts}
+if not contrast_files:
+    raise SystemExit(f"No <contrast>_*_accessions.txt lists found in {lists_folder}; "
+                     "run preprocessing_FoldSeek_input.py first.")
+contrasts = load_contrasts(contrast_files)
+accessions = union_accessions(contrasts)
+
+# === STEP 3: Fetch each unique protein once ===
+fetched = build_query_fasta(accessions, query_fasta, local_fasta=local_fasta)
+print(f"📄 {query_fasta}: {len(fetched['copied'])} copied, {len(fetched['written'])} downloaded, "
+      f"{len(fetched['missing'])} missing")
+
+# === STEP 4: One createdb and one search round, hits fanned out per contrast ===
+search_results, counts = search_contrasts(query_fasta, contrasts, query_db, prost_model, database_dir,
+                                          results_dir, cpu_budget=cpu_budget)
+print_contrast_summary(counts)
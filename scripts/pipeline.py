@@ -0,0 +1,392 @@
+# Script: pipeline.py
+# Purpose: One non-interactive command line for every pipeline stage.
+
+# ======================= OVERVIEW ==========================
+# Every stage used to be its own script with hard-coded paths (/mnt/classes/..., C:/Users/...), and
+# 01_Working_FoldSeek_Search.py waited for three input() prompts, so nothing could run unattended from a
+# batch scheduler. This is the single entry point:
+#   python pipeline.py preprocess   DE workbook -> accession lists for every contrast   (de_preprocessing.py)
+#   python pipeline.py fetch        accession list -> FASTA, local proteome first        (uniprot_fetcher.py)
+#   python pipeline.py search       ProstT5 createdb + Foldseek searches + hit routing   (fasta_to_foldseek.py)
+#   python pipeline.py route        route existing results_*.m8 into category files      (hit_router.py)
+#   python pipeline.py select       best AlphaFold hit per query from .m8 files          (top_hits.py)
+#   python pipeline.py download     AlphaFold models, structure store, optional re-rank  (download.py)
+#   python pipeline.py summarize    results database + final summary CSV                 (summarize.py)
+#   python pipeline.py go-parse     DeepGOPlus chunk files -> combined tables            (deepgoplus_parser.py)
+#   python pipeline.py run          every stage above that is out of date, as a DAG      (pipeline_runner.py)
+# - paths and thresholds are flags; defaults are what the stand-alone scripts use,
+# - --config file.toml / file.json (before or after the subcommand) sets any flag: top-level keys apply
+#   to every subcommand that has that flag, a [<subcommand>] table only to that one, and flags on the
+#   command line still win; keys that match no flag are an error,
+# - only argparse / json / os / sys are imported at startup; pandas, requests, numpy and the pipeline
+#   modules are imported inside the subcommand that needs them, so --help or a config check starts in tens
+#   of milliseconds and a subcommand only pays for its own imports,
+# - every subcommand logs its run through instrumentation.py like the scripts do.
+#
+# Example:  python pipeline.py --config contrast_ua5v7.toml preprocess --p-threshold 0.01
+
+import argparse  # I use this for the subcommands.
+import json      # I use this for JSON config files.
+import os        # I use this for paths and CPU counts.
+import sys
+
+DATABASE_DIR = "/mnt/classes/biol_594_694/group6/databases"
+EXCEL_FILE = "/mnt/classes/biol_594_694/group6/datasets/diffExpData.xlsx"
+LOCAL_PROTEOME = "../DeepGOPlus/Streptococcus_mutans_proteome_UP000002512_2025_01_16.fasta"
+RESULTS_DIR = "prostt5_uncharacterized_results"  # shared by search, route, select, download and summarize
+
+
+# === Config ===
+def load_config(path):
+    # TOML (Python 3.11+) or JSON, chosen by extension.
+    if path.endswith(".toml"):
+        import tomllib
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def apply_config(subparsers, config):
+    # Config values become each subparser's defaults, so explicit flags still override them.
+    # A misspelled key would otherwise be silently ignored, so I reject top-level keys that no
+    # subcommand has as a flag and tables that are not a subcommand.
+    shared = {key.replace('-', '_'): value for key, value in config.items() if not isinstance(value, dict)}
+    all_dests = {action.dest for subparser in subparsers.choices.values() for action in subparser._actions}
+    unknown = set(shared) - all_dests
+    if unknown:
+        raise SystemExit(f"Unknown settings in config: {', '.join(sorted(unknown))}")
+    unknown = {key for key, value in config.items() if isinstance(value, dict)} - set(subparsers.choices)
+    if unknown:
+        raise SystemExit(f"Unknown sections in config: {', '.join(sorted(unknown))}")
+    for name, subparser in subparsers.choices.items():
+        dests = {action.dest for action in subparser._actions}
+        section = {key.replace('-', '_'): value for key, value in config.get(name, {}).items()}
+        values = {key: value for key, value in {**shared, **section}.items() if key in dests}
+        unknown = set(section) - dests
+        if unknown:
+            raise SystemExit(f"Unknown settings for '{name}' in config: {', '.join(sorted(unknown))}")
+        subparser.set_defaults(**values)
+
+
+def start(name):
+    import instrumentation
+    instrumentation.start_run(name)
+
+
+# === Subcommands ===
+def cmd_preprocess(args):
+    start("preprocess")
+    from de_preprocessing import preprocess_workbook
+    contrasts = preprocess_workbook(args.excel, sheet_names=args.sheets, output_dir=args.output_dir,
+                                    p_threshold=args.p_threshold, log2_threshold=args.log2_threshold,
+                                    main_sheet=args.main_sheet, cache_dir=args.cache_dir, workers=args.workers)
+    for info in contrasts.values():
+        counts = info["counts"]
+        print(f"{info['sheet']}: {counts['significant']} significant, {counts['upregulated']} up, "
+              f"{counts['downregulated']} down")
+
+
+def cmd_fetch(args):
+    start("fetch")
+    from fasta_index import FastaIndex
+    from uniprot_fetcher import UNIPROT_BASE_URL, existing_accessions, fetch_fasta
+    accessions = []
+    for path in args.accessions:
+        with open(path, 'r') as f:
+            accessions.extend(line.strip() for line in f if line.strip())
+    accessions = list(dict.fromkeys(accessions))
+    print(f"Loaded {len(accessions)} unique accessions from {len(args.accessions)} file(s)")
+    if args.local_fasta and os.path.exists(args.local_fasta):
+        already = existing_accessions(args.output)
+        with FastaIndex(args.local_fasta) as proteome:
+            local = [acc for acc in accessions if acc in proteome and acc not in already]
+            proteome.write_fasta(local, args.output, mode='a')
+        print(f"Copied {len(local)} sequences from {args.local_fasta}")
+    result = fetch_fasta(accessions, args.output, batch_size=args.batch_size, workers=args.workers,
+                         base_url=args.base_url or UNIPROT_BASE_URL)
+    print(f"Finished writing {args.output} ({len(result['written'])} new, {len(result['missing'])} missing)")
+
+
+def parse_categories(items):
+    # ["upregulated=upregulated_accessions.txt", ...] -> {name: path}
+    categories = {}
+    for item in items:
+        name, sep, path = item.partition("=")
+        if not sep:
+            raise SystemExit(f"--category expects name=path, got '{item}'")
+        categories[name] = path
+    return categories
+
+
+def make_router(args):
+    from hit_router import DEFAULT_CATEGORY_FILES, HitRouter, load_categories
+    category_files = parse_categories(args.category) if args.category else dict(DEFAULT_CATEGORY_FILES)
+    return HitRouter(args.results_dir, load_categories(category_files), compress=args.compress)
+
+
+def cmd_search(args):
+    start("search")
+    import instrumentation
+    from foldseek_scheduler import create_query_db, discover_databases, schedule_searches
+
+    # With --no-route the category files are left to the route subcommand, so changing a threshold
+    # (and with it the category lists) never requires searching again.
+    router = None if args.no_route else make_router(args)
+
+    def route_results(result):
+        if result["ok"] and router is not None:
+            with instrumentation.timer("hit_router.route_file", database=result["database"]):
+                router.route_file(result["m8"])
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    databases = discover_databases(args.database_dir, exclude_prefix=os.path.basename(args.query_db))
+    if args.databases:
+        databases = [db for db in databases if db["name"] in args.databases]
+    try:
+        if args.mode == "incremental":
+            from incremental_search import incremental_search
+            results = incremental_search(args.fasta, databases, args.results_dir, args.prost_model,
+                                         cache_dir=args.cache_dir, cpu_budget=args.cpu_budget,
+                                         on_result=route_results)
+        elif args.mode == "sharded":
+            from sharded_search import sharded_search
+            results = sharded_search(args.fasta, databases, args.results_dir, args.prost_model,
+                                     cpu_budget=args.cpu_budget, threads_per_shard=args.threads_per_shard,
+                                     shards=args.shards, max_createdb=args.max_createdb, on_result=route_results)
+        else:
+            create_query_db(args.fasta, args.query_db, args.prost_model, log_dir=args.results_dir)
+            results = schedule_searches(args.query_db, databases, args.results_dir, cpu_budget=args.cpu_budget,
+                                        on_result=route_results)
+    finally:
+        if router is not None:
+            router.close()
+    failed = [r["database"] for r in results if not r["ok"]]
+    if router is not None:
+        print(f"✅ Done. Saved {router.counts['all']} total hits.")
+        router.summary()
+    if failed:
+        raise SystemExit(f"⚠️ Searches failed for: {', '.join(failed)}")
+
+
+def cmd_route(args):
+    start("route")
+    m8_files = sorted(os.path.join(args.results_dir, f) for f in os.listdir(args.results_dir)
+                      if f.startswith("results_") and f.endswith(".m8"))
+    with make_router(args) as router:
+        for path in m8_files:
+            router.route_file(path)
+    print(f"✅ Routed {router.counts['all']} hits from {len(m8_files)} files.")
+    router.summary()
+
+
+def cmd_select(args):
+    start("select")
+    from top_hits import top_hits_per_query
+    top = top_hits_per_query(args.m8, k=args.k, evalue_cutoff=args.evalue,
+                             target_prefix=args.target_prefix or None)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    top.to_csv(args.output, index=False)
+    print(f"🔍 {len(top)} hits for {top['query'].nunique()} queries -> {args.output}")
+
+
+def cmd_download(args):
+    start("download")
+    import pandas as pd
+    from af_downloader import OK_STATUSES, download_models
+    from structure_store import StructureStore
+
+    # The hits file can hold several candidates per query (select --k): the best one per query is
+    # downloaded and summarized, and --rerank re-scores all of them.
+    candidates = pd.read_csv(args.hits)
+    hits = candidates.sort_values("bitscore", ascending=False, kind="stable").drop_duplicates("query")
+    results = download_models(hits["target"].tolist(), args.output_dir, workers=args.workers)
+    downloaded = hits.merge(results, left_on="target", right_on="model_id")
+    downloaded = downloaded[downloaded["status"].isin(OK_STATUSES)]
+    print(f"📊 {len(downloaded)}/{len(hits)} models available")
+    summary = downloaded[["query", "target", "evalue", "bitscore", "source_db"]]
+    summary.columns = ["Query UniProt ID", "AlphaFold Target Model", "E-value", "Bitscore", "Source Database"]
+    summary.to_csv(args.summary, index=False)
+    print(f"📄 Summary written to: {args.summary}")
+
+    store = StructureStore(args.store)
+    store.add_folder(args.output_dir)
+    if args.rerank:
+        from m8_reader import query_accession
+        from rerank import alphafold_query_model, rerank_hits
+        candidate_results = download_models(candidates["target"].unique().tolist(), args.candidate_dir,
+                                            workers=args.workers)
+        candidates = candidates.merge(candidate_results, left_on="target", right_on="model_id")
+        candidates = candidates[candidates["status"].isin(OK_STATUSES)]
+        if candidates.groupby("query").size().max() < 2:
+            print("⚠️ Only one candidate per query, so re-ranking cannot change the order (select with --k > 1)")
+        queries = [alphafold_query_model(query_accession(q)) for q in candidates["query"].astype(str).unique()]
+        download_models(queries, args.query_dir, workers=args.workers)
+        store.add_folder(args.candidate_dir)
+        store.add_folder(args.query_dir)
+        reranked = rerank_hits(candidates[["query", "target", "evalue", "bitscore", "source_db",
+                                           "q_start", "q_end", "t_start", "t_end"]], store_root=args.store)
+        reranked.to_csv(args.rerank, index=False)
+        print(f"📐 Re-ranked {reranked['tm_score'].notna().sum()}/{len(reranked)} hits: {args.rerank}")
+
+
+def cmd_summarize(args):
+    start("summarize")
+    from hit_router import DEFAULT_CATEGORY_FILES, load_categories
+    from results_store import ResultsStore
+
+    category_files = parse_categories(args.category) if args.category else dict(DEFAULT_CATEGORY_FILES)
+    store = ResultsStore(args.database or os.path.join(args.results_dir, "results.sqlite"))
+    store.load_categories(load_categories(category_files))
+    m8_files = sorted(os.path.join(args.results_dir, f) for f in os.listdir(args.results_dir) if f.endswith(".m8"))
+    for path, count in store.load_m8_files(m8_files).items():
+        print(f"📂 {path}: " + (f"loaded {count} hits" if count else "unchanged"))
+    print(f"🔎 Detected {store.load_structures(args.structures)} downloaded AlphaFold structures.")
+    df_hits = store.top_hits_summary()
+    store.close()
+    if df_hits.empty:
+        print("⚠️ No matches found between Foldseek results and downloaded structures.")
+        return
+    df_hits.to_csv(args.output, index=False)
+    print("✅ Final summary written to:", args.output)
+
+
+def cmd_go_parse(args):
+    start("go_parse")
+    from deepgoplus_parser import combine_prediction_sets
+    combine_prediction_sets(args.predictions, output_folder=args.output_dir, k=args.top, min_score=args.min_score,
+                            workers=args.workers)
+
+
+def cmd_run(args):
+    start("run")
+    from pipeline_runner import run_pipeline
+    statuses = run_pipeline(args.stages, config_path=args.config, state_dir=args.state_dir, force=args.force,
+                            jobs=args.jobs, dry_run=args.dry_run)
+    if any(status in ("failed", "blocked") for status in statuses.values()):
+        raise SystemExit("⚠️ Some stages failed; rerun to retry them (finished stages are skipped)")
+
+
+# === Command line ===
+def build_parser():
+    parser = argparse.ArgumentParser(description="Streptococcus mutans structure / function pipeline.")
+    parser.add_argument("--config", help="TOML or JSON file with default settings")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("preprocess", help="DE workbook -> accession lists for every contrast")
+    p.add_argument("--excel", default=EXCEL_FILE)
+    p.add_argument("--sheets", nargs="*", default=None, help="sheet names (default: every sheet)")
+    p.add_argument("--main-sheet", default="UA 5v7 (Main)")
+    p.add_argument("--p-threshold", type=float, default=0.05)
+    p.add_argument("--log2-threshold", type=float, default=1.0)
+    p.add_argument("--output-dir", default=".")
+    p.add_argument("--cache-dir", default=".de_cache")
+    p.add_argument("--workers", type=int, default=None)
+    p.set_defaults(func=cmd_preprocess)
+
+    p = subparsers.add_parser("fetch", help="accession lists -> FASTA (local proteome first, then UniProt)")
+    p.add_argument("--accessions", nargs="+", default=["all_significant_accessions.txt"])
+    p.add_argument("--output", default="ua5v7_DE_proteins.fasta")
+    p.add_argument("--local-fasta", default=LOCAL_PROTEOME)
+    p.add_argument("--batch-size", type=int, default=100)
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--base-url", default=None, help="UniProt REST base URL (default: rest.uniprot.org)")
+    p.set_defaults(func=cmd_fetch)
+
+    p = subparsers.add_parser("search", help="ProstT5 createdb + Foldseek searches + routing into categories")
+    p.add_argument("--fasta", default="ua5v7_DE_proteins.fasta")
+    p.add_argument("--query-db", default="ua5v7_structural_db")
+    p.add_argument("--results-dir", default=RESULTS_DIR)
+    p.add_argument("--prost-model", default="weights")
+    p.add_argument("--database-dir", default=DATABASE_DIR)
+    p.add_argument("--databases", nargs="*", default=None, help="only these database names")
+    p.add_argument("--mode", choices=["full", "incremental", "sharded"], default="full",
+                   help="full: createdb + search everything (default); incremental: only sequences not in "
+                        "--cache-dir yet; sharded: split the FASTA over parallel shards")
+    p.add_argument("--cache-dir", default=".foldseek_cache", help="incremental mode: cached 3Di databases and hits")
+    p.add_argument("--cpu-budget", type=int, default=os.cpu_count())
+    p.add_argument("--threads-per-shard", type=int, default=1)
+    p.add_argument("--shards", type=int, default=None)
+    p.add_argument("--max-createdb", type=int, default=None,
+                   help="sharded mode: ProstT5 createdb runs at once (default: what fits in memory)")
+    p.add_argument("--category", action="append", default=None, help="name=accession_file (repeatable)")
+    p.add_argument("--compress", action="store_true")
+    p.add_argument("--no-route", action="store_true", help="leave the category files to 'route'")
+    p.set_defaults(func=cmd_search)
+
+    p = subparsers.add_parser("route", help="route existing results_*.m8 into the category hit files")
+    p.add_argument("--results-dir", default=RESULTS_DIR)
+    p.add_argument("--category", action="append", default=None, help="name=accession_file (repeatable)")
+    p.add_argument("--compress", action="store_true")
+    p.set_defaults(func=cmd_route)
+
+    p = subparsers.add_parser("select", help="best AlphaFold hit per query from .m8 files")
+    p.add_argument("--m8", nargs="+", default=[os.path.join(RESULTS_DIR, f"results_{name}.m8")
+                                              for name in ("afdb50", "afdb_proteome", "afdb_swissprot")])
+    p.add_argument("--k", type=int, default=5,
+                   help="hits kept per query; download summarizes the best one and --rerank re-scores them all")
+    p.add_argument("--evalue", type=float, default=1e-2)
+    p.add_argument("--target-prefix", default="AF-")
+    p.add_argument("--output", default=os.path.join(RESULTS_DIR, "af_top_hits.csv"))
+    p.set_defaults(func=cmd_select)
+
+    p = subparsers.add_parser("download", help="AlphaFold models for selected hits, structure store, re-rank")
+    p.add_argument("--hits", default=os.path.join(RESULTS_DIR, "af_top_hits.csv"))
+    p.add_argument("--output-dir", default="top_hit_structures")
+    p.add_argument("--summary", default=os.path.join(RESULTS_DIR, "downloaded_af_models_summary.csv"))
+    p.add_argument("--store", default="structure_store")
+    p.add_argument("--workers", type=int, default=16)
+    p.add_argument("--rerank", default=None, help="write TM-score re-ranked hits to this CSV")
+    p.add_argument("--query-dir", default="query_structures")
+    p.add_argument("--candidate-dir", default="rerank_candidate_structures",
+                   help="models of the other candidates, downloaded only for --rerank")
+    p.set_defaults(func=cmd_download)
+
+    p = subparsers.add_parser("summarize", help="results database and final summary CSV")
+    p.add_argument("--results-dir", default=RESULTS_DIR)
+    p.add_argument("--structures", default="top_hit_structures")
+    p.add_argument("--database", default=None, help="SQLite file (default: <results-dir>/results.sqlite)")
+    p.add_argument("--category", action="append", default=None,
+                   help="name=accession_file (repeatable; default: the upregulated / downregulated / "
+                        "all_significant_accessions.txt lists in the working directory)")
+    p.add_argument("--output", default=os.path.join(RESULTS_DIR, "top_hits_summary_final.csv"))
+    p.set_defaults(func=cmd_summarize)
+
+    p = subparsers.add_parser("go-parse", help="DeepGOPlus chunk outputs -> combined tables")
+    p.add_argument("--predictions", default=".", help="folder with predictions_<set>_<a>_<b>.csv")
+    p.add_argument("--output-dir", default=None)
+    p.add_argument("--top", type=int, default=1)
+    p.add_argument("--min-score", type=float, default=None)
+    p.add_argument("--workers", type=int, default=None)
+    p.set_defaults(func=cmd_go_parse)
+
+    p = subparsers.add_parser("run", help="run every out-of-date stage, independent stages in parallel")
+    p.add_argument("stages", nargs="*", help="bring only these stages (and what they need) up to date")
+    p.add_argument("--force", nargs="*", default=[], help="rerun these stages anyway ('all' for every stage)")
+    p.add_argument("--jobs", type=int, default=None, help="stages running at once (default: as many as ready)")
+    p.add_argument("--state-dir", default=".pipeline_state")
+    p.add_argument("--dry-run", action="store_true", help="only show which stages are out of date")
+    p.set_defaults(func=cmd_run)
+
+    # --config works before or after the subcommand. SUPPRESS keeps a subcommand from resetting a
+    # --config given before it to None.
+    for subparser in subparsers.choices.values():
+        subparser.add_argument("--config", default=argparse.SUPPRESS, help="TOML or JSON file with default settings")
+    return parser, subparsers
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser, subparsers = build_parser()
+    # The config file has to be read before the real parse so its values can become defaults.
+    pre = argparse.ArgumentParser(add_help=False)
+    pre.add_argument("--config")
+    known, _ = pre.parse_known_args(argv)
+    if known.config:
+        apply_config(subparsers, load_config(known.config))
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
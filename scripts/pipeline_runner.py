@@ -0,0 +1,354 @@
+# Script: pipeline_runner.py
+# Purpose: Run the pipeline.py stages as a small DAG and only redo the stages whose inputs actually changed.
+
+# ======================= OVERVIEW ==========================
+# Running the stages by hand means either rerunning everything after a small change or remembering which
+# stages a change touches. Here every stage declares what it reads and writes, worked out from the same
+# settings pipeline.py would use for it (flags, config file, defaults):
+# - a stage's fingerprint is the SHA-256 of its settings plus the content hash of every input file
+#   (globs and folders are expanded); huge read-only inputs such as the Foldseek databases and the ProstT5
+#   weights are fingerprinted by file sizes and modification times instead,
+# - file hashes are cached in the state file by size and mtime, so an unchanged file is never read twice,
+#   and a file that was rewritten with the same content still counts as unchanged,
+# - a stage runs when its fingerprint differs from the last successful run or an output it wrote is gone
+#   or was changed; when it reruns but writes the same bytes, the stages after it stay up to date,
+# - dependencies come from matching one stage's inputs against another's outputs, and every stage whose
+#   upstream stages are done starts at once in a thread pool (e.g. go-parse next to search and download),
+# - a failed stage blocks only the stages downstream of it; everything else still runs.
+# Searching runs with --no-route and routing is its own stage, so a new p-value threshold rewrites the
+# accession lists, the category hit files and the summary, while fetch only adds missing sequences and the
+# Foldseek searches are skipped unless the query FASTA really changed.
+#
+# Example:  python pipeline.py --config contrast_ua5v7.toml run
+#           python pipeline.py run summarize --dry-run     (what would run to bring the summary up to date)
+
+import fnmatch   # I use this to match inputs against globbed outputs.
+import glob      # I use this to expand globbed inputs and outputs.
+import hashlib   # I use this for the content hashes.
+import json      # I use this for the state file.
+import os        # I use this for paths and file stats.
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from foldseek_scheduler import run_logged
+from instrumentation import count, event
+
+DEFAULT_STATE_DIR = ".pipeline_state"
+PIPELINE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipeline.py")
+# Settings that change how fast a stage runs but not what it writes.
+SPEED_SETTINGS = {"func", "command", "config", "workers", "cpu_budget", "threads_per_shard", "shards",
+                  "max_createdb"}
+
+
+# === Stage declarations ===
+def category_files(args):
+    from hit_router import DEFAULT_CATEGORY_FILES
+    from pipeline import parse_categories
+    return list((parse_categories(args.category) if args.category else DEFAULT_CATEGORY_FILES).values())
+
+
+# Each function gets the stage's parsed pipeline.py arguments and returns its inputs ("hash": content,
+# "stat": sizes and mtimes only) and outputs. Paths may be globs or folders.
+def preprocess_files(args):
+    return {"hash": [args.excel], "stat": [],
+            "outputs": [os.path.join(args.output_dir, "*accessions.txt")]}
+
+
+def fetch_files(args):
+    return {"hash": list(args.accessions), "stat": [], "outputs": [args.output]}
+
+
+def search_files(args):
+    return {"hash": [args.fasta], "stat": [args.database_dir, args.prost_model],
+            "outputs": [os.path.join(args.results_dir, "results_*.m8")]}
+
+
+def route_files(args):
+    return {"hash": [os.path.join(args.results_dir, "results_*.m8")] + category_files(args), "stat": [],
+            "outputs": [os.path.join(args.results_dir, "hits_*"), os.path.join(args.results_dir, "*", "hits_*")]}
+
+
+def select_files(args):
+    return {"hash": list(args.m8), "stat": [], "outputs": [args.output]}
+
+
+def download_files(args):
+    outputs = [args.summary, args.output_dir, args.store]
+    if args.rerank:
+        outputs += [args.rerank, args.query_dir, args.candidate_dir]
+    return {"hash": [args.hits], "stat": [], "outputs": outputs}
+
+
+def summarize_files(args):
+    return {"hash": [os.path.join(args.results_dir, "*.m8"), args.structures] + category_files(args), "stat": [],
+            "outputs": [args.output]}
+
+
+def go_parse_files(args):
+    output_dir = args.output_dir or args.predictions
+    return {"hash": [os.path.join(args.predictions, "predictions_*.csv")], "stat": [],
+            "outputs": [os.path.join(output_dir, "combined_*_predictions_*.csv")]}
+
+
+# name -> (declaration, extra pipeline.py flags the runner adds)
+STAGES = {
+    "preprocess": (preprocess_files, []),
+    "fetch": (fetch_files, []),
+    "search": (search_files, ["--no-route"]),
+    "route": (route_files, []),
+    "select": (select_files, []),
+    "download": (download_files, []),
+    "summarize": (summarize_files, []),
+    "go-parse": (go_parse_files, []),
+}
+
+
+def stage_arguments(name, config_path=None):
+    # The exact namespace pipeline.py would run this stage with.
+    from pipeline import apply_config, build_parser, load_config
+    parser, subparsers = build_parser()
+    if config_path:
+        apply_config(subparsers, load_config(config_path))
+    return parser.parse_args([name] + STAGES[name][1])
+
+
+def stage_settings(args):
+    return {key: value for key, value in sorted(vars(args).items()) if key not in SPEED_SETTINGS}
+
+
+# === Hashing ===
+def expand(patterns):
+    # Existing files for a list of paths, globs and folders, sorted, each listed once.
+    files = set()
+    for pattern in patterns:
+        for path in glob.glob(pattern) if glob.has_magic(pattern) else [pattern]:
+            if os.path.isdir(path):
+                for root, _, names in os.walk(path):
+                    files.update(os.path.join(root, name) for name in names)
+            elif os.path.isfile(path):
+                files.add(path)
+    return sorted(os.path.normpath(path) for path in files)
+
+
+class HashCache:
+    # SHA-256 of files, remembered by (size, mtime) so unchanged files are only hashed once.
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self.lock = threading.Lock()
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        with self.lock:
+            cached = self.entries.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        count("runner.files_hashed")
+        with self.lock:
+            self.entries[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def hashes(self, patterns):
+        return {path: self.file_hash(path) for path in expand(patterns)}
+
+
+def stat_signature(patterns):
+    return {path: [os.stat(path).st_size, os.stat(path).st_mtime_ns] for path in expand(patterns)}
+
+
+def fingerprint(name, args, files, hashes):
+    payload = {"stage": name, "settings": stage_settings(args), "inputs": hashes.hashes(files["hash"]),
+               "stat_inputs": stat_signature(files["stat"])}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# === State ===
+class RunnerState:
+    # .pipeline_state/state.json: the hash cache and, per stage, the fingerprint and output hashes of its last
+    # successful run. Logs of every stage go next to it.
+    def __init__(self, state_dir=DEFAULT_STATE_DIR):
+        self.path = os.path.join(state_dir, "state.json")
+        self.log_dir = os.path.join(state_dir, "logs")
+        os.makedirs(self.log_dir, exist_ok=True)
+        data = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        self.stages = data.get("stages", {})
+        self.hashes = HashCache(data.get("files"))
+
+    def save(self):
+        # Hashes of files that are gone are dropped, so the state does not grow with every renamed output.
+        # Workers add hashes while this runs, so I copy the entries under the lock first.
+        with self.hashes.lock:
+            entries = list(self.hashes.entries.items())
+        files = {path: entry for path, entry in entries if os.path.exists(path)}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"stages": self.stages, "files": files}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def outputs_intact(self, name):
+        # Every output recorded for the stage still exists with the same content.
+        recorded = self.stages.get(name, {}).get("outputs", {})
+        return all(os.path.isfile(path) and self.hashes.file_hash(path) == digest
+                   for path, digest in recorded.items())
+
+    def reason_to_run(self, name, stage_fingerprint):
+        # Why the stage is out of date, or None when it is not.
+        previous = self.stages.get(name)
+        if previous is None:
+            return "never run"
+        if previous["fingerprint"] != stage_fingerprint:
+            return "inputs or settings changed"
+        if not self.outputs_intact(name):
+            return "outputs missing or changed"
+        return None
+
+
+# === Graph ===
+# stage -> upstream stages it reads from when the stages share their paths (the pipeline.py defaults do).
+EXPECTED_LINKS = {"fetch": {"preprocess"}, "search": {"fetch"}, "route": {"search", "preprocess"},
+                  "select": {"search"}, "download": {"select"}, "summarize": {"search", "download"}}
+
+
+def overlaps(path, output):
+    # True when an input (path or glob) can be a file that an output (path, glob or folder) writes.
+    path, output = os.path.normpath(path), os.path.normpath(output)
+    return (path == output or fnmatch.fnmatch(path, output) or fnmatch.fnmatch(output, path)
+            or path.startswith(output + os.sep))
+
+
+def build_graph(declared):
+    # stage -> set of upstream stages, from inputs that overlap another stage's outputs.
+    return {name: {other for other, other_files in declared.items() if other != name
+                   and any(overlaps(path, output) for path in files["hash"] + files["stat"]
+                           for output in other_files["outputs"])}
+            for name, files in declared.items()}
+
+
+def missing_links(graph):
+    # [(upstream, stage)] pairs from EXPECTED_LINKS that the declared paths do not connect, e.g. because a
+    # config gives search and select different results folders; such a stage never goes stale after its
+    # upstream stage reruns.
+    return [(upstream, name) for name, upstreams in EXPECTED_LINKS.items()
+            for upstream in sorted(upstreams - graph[name])]
+
+
+def topological_order(graph):
+    order, seen = [], set()
+
+    def visit(name, path=()):
+        if name in path:
+            raise SystemExit(f"Stage cycle: {' -> '.join(path + (name,))}")
+        if name not in seen:
+            for upstream in sorted(graph[name]):
+                visit(upstream, path + (name,))
+            seen.add(name)
+            order.append(name)
+    for name in STAGES:
+        visit(name)
+    return order
+
+
+def with_upstream(targets, graph):
+    selected, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in selected:
+            selected.add(name)
+            todo.extend(graph[name])
+    return selected
+
+
+# === Running ===
+def run_stage(name, args, files, state, config_path=None, force=False):
+    # Worker: decide whether the stage is stale, run pipeline.py for it if so, and hash what it wrote.
+    stage_fingerprint = fingerprint(name, args, files, state.hashes)
+    reason = "forced" if force else state.reason_to_run(name, stage_fingerprint)
+    if reason is None:
+        return {"stage": name, "status": "fresh", "fingerprint": stage_fingerprint}
+    cmd = [sys.executable, PIPELINE_SCRIPT] + (["--config", config_path] if config_path else [])
+    cmd += [name] + STAGES[name][1]
+    log_path = os.path.join(state.log_dir, f"{name}.log")
+    print(f"▶️ {name}: {reason}")
+    code, seconds = run_logged(cmd, log_path)
+    if code != 0:
+        return {"stage": name, "status": "failed", "exit_code": code, "seconds": seconds, "log": log_path}
+    return {"stage": name, "status": "ran", "seconds": seconds, "fingerprint": stage_fingerprint,
+            "outputs": state.hashes.hashes(files["outputs"])}
+
+
+def run_pipeline(targets=None, config_path=None, state_dir=DEFAULT_STATE_DIR, force=(), jobs=None,
+                 dry_run=False):
+    # Bring the target stages (default: all) up to date. Returns {stage: status}.
+    unknown = set(targets or []) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"Unknown stages: {', '.join(sorted(unknown))} (choose from {', '.join(STAGES)})")
+    arguments = {name: stage_arguments(name, config_path) for name in STAGES}
+    declared = {name: STAGES[name][0](args) for name, args in arguments.items()}
+    graph = build_graph(declared)
+    for upstream, name in missing_links(graph):
+        print(f"⚠️ {name} does not read anything {upstream} writes, so it will not rerun after {upstream}; "
+              "check that both use the same paths")
+    order = topological_order(graph)
+    selected = with_upstream(targets, graph) if targets else set(STAGES)
+    order = [name for name in order if name in selected]
+    force = set(STAGES) if "all" in force else set(force)
+    state = RunnerState(state_dir)
+
+    if dry_run:
+        statuses = {}
+        for name in order:
+            waiting = [up for up in graph[name] if statuses.get(up) not in ("fresh", None)]
+            if waiting:
+                statuses[name] = f"after {', '.join(sorted(waiting))}"
+            else:
+                stage_fingerprint = fingerprint(name, arguments[name], declared[name], state.hashes)
+                reason = "forced" if name in force else state.reason_to_run(name, stage_fingerprint)
+                statuses[name] = reason or "fresh"
+            print(f"  {name:<10} {statuses[name]}")
+        state.save()
+        return statuses
+
+    statuses = {}
+    pending = list(order)
+    with ThreadPoolExecutor(max_workers=jobs or len(order) or 1) as pool:
+        running = {}
+        while pending or running:
+            for name in list(pending):
+                upstream = [statuses.get(up) for up in graph[name] if up in selected]
+                if any(status in ("failed", "blocked") for status in upstream):
+                    statuses[name] = "blocked"
+                    pending.remove(name)
+                    print(f"⛔ {name}: skipped, an upstream stage failed")
+                elif all(status is not None for status in upstream):
+                    pending.remove(name)
+                    running[pool.submit(run_stage, name, arguments[name], declared[name], state, config_path,
+                                        name in force)] = name
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                result = future.result()
+                statuses[name] = result["status"]
+                event("runner.stage", **{key: value for key, value in result.items() if key != "outputs"})
+                count(f"runner.stages_{result['status']}")
+                if result["status"] == "fresh":
+                    print(f"⏭️ {name}: up to date")
+                elif result["status"] == "ran":
+                    if not result["outputs"]:
+                        print(f"⚠️ {name}: finished but wrote none of {', '.join(declared[name]['outputs'])}")
+                    print(f"✅ {name}: {result['seconds']:.1f}s, {len(result['outputs'])} output files")
+                    state.stages[name] = {"fingerprint": result["fingerprint"], "outputs": result["outputs"]}
+                else:
+                    print(f"❌ {name}: exit code {result['exit_code']}, see {result['log']}")
+                    state.stages.pop(name, None)
+                state.save()
+    return statuses
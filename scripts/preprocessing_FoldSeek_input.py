@@ -26,59 +26,34 @@
 #   3. Significantly downregulated proteins (log2FC < -1, p < 0.05)
 # It outputs three text files, each containing UniProt accession IDs for use with Foldseek.
 
-import pandas as pd  # I import pandas to handle the spreadsheet and manipulate tabular data easily.
-
-# === Step 1: Load the Excel file ===
-# I define the path to the Excel file and the name of the sheet that contains the UA5v7-specific data.
-excel_file = "/mnt/classes/biol_594_694/group6/datasets/diffExpData.xlsx"  # Full path to the uploaded Excel file.
-sheet_name = "UA 5v7 (Main)"            # This is the worksheet focused specifically on UA5v7 strain comparisons.
-
-# I use pandas to load the relevant sheet into a DataFrame so I can filter and analyze the data.
-df = pd.read_excel(excel_file, sheet_name=sheet_name)
-
-# === Step 2: Clean and filter the data ===
-# Some rows may have missing data or headers — I need to filter them out before continuing.
-# I keep only rows that contain:
-# - A valid UniProt accession in the "Accession" column
-# - A valid p-value in the "P value " column (note the space)
-# - A valid log2 fold change in the "Ratio(log2)" column
-df = df[df['Accession'].notna() & df['P value '].notna() & df['Ratio(log2)'].notna()]
-
-# Just to be safe, I ensure the numeric columns are correctly typed as floats
-# in case Excel formatted them as strings. This also catches any non-numeric values.
-df['P value '] = pd.to_numeric(df['P value '], errors='coerce')
-df['Ratio(log2)'] = pd.to_numeric(df['Ratio(log2)'], errors='coerce')
-
-# === Step 3: Apply filtering criteria ===
-# Now I define three groups based on differential expression logic.
-
-# Group 1: All significantly differentially expressed proteins (p < 0.05)
-# This includes both upregulated and downregulated proteins.
-significant_df = df[df['P value '] < 0.05]
-all_significant = significant_df['Accession'].unique()  # I extract just the unique accession IDs
-
-# Group 2: Upregulated proteins — log2FC > 1 and significant
-# These proteins increased in abundance at pH 7.
-upregulated_df = df[(df['P value '] < 0.05) & (df['Ratio(log2)'] > 1)]
-upregulated = upregulated_df['Accession'].unique()
-
-# Group 3: Downregulated proteins — log2FC < -1 and significant
-# These proteins decreased in abundance at pH 7.
-downregulated_df = df[(df['P value '] < 0.05) & (df['Ratio(log2)'] < -1)]
-downregulated = downregulated_df['Accession'].unique()
-
-# === Step 4: Write each list to a .txt file ===
-# I define a helper function to save each list of accessions to a file.
-def save_list(accessions, filename):
-    with open(filename, 'w') as f:
-        for acc in accessions:
-            f.write(str(acc).strip() + '\n')  # I write one accession per line
-    print(f"Saved {len(accessions)} accessions to {filename}")
-
-# I save all three groups to their respective output files
-save_list(all_significant, "all_significant_accessions.txt")
-save_list(upregulated, "upregulated_accessions.txt")
-save_list(downregulated, "downregulated_accessions.txt")
-
-# Final message to confirm everything worked
-print("Completed Organization")
+# Every sheet of the workbook is a contrast, so I now produce the three lists for each of them in one run
+# (e.g. ua_5v7_main_upregulated_accessions.txt), and the main UA5v7 sheet is also written to the plain
+# file names the rest of the pipeline reads. See de_preprocessing.py for the caching and the single-pass filter.
+
+from de_preprocessing import preprocess_workbook  # I use this to parse, cache and classify every sheet.
+
+# The steps only run when this file is the main script: the sheets are parsed in a process pool, and
+# under spawn (Windows, macOS) every worker imports this file again.
+if __name__ == "__main__":
+    # === Step 1: Settings ===
+    # I define the path to the Excel file and the sheet that holds the main UA5v7 comparison.
+    excel_file = "/mnt/classes/biol_594_694/group6/datasets/diffExpData.xlsx"  # Full path to the uploaded Excel file.
+    main_sheet = "UA 5v7 (Main)"   # This is the worksheet focused specifically on UA5v7 strain comparisons.
+    sheet_names = None             # None means every sheet; I can also list just the contrasts I want.
+    p_threshold = 0.05             # Significance cutoff on the "P value " column
+    log2_threshold = 1.0           # |log2 fold change| needed to count as up- or downregulated
+
+    # === Step 2: Load, clean, filter and save every contrast ===
+    # Sheets are parsed once (in parallel) and cached as Parquet keyed on the workbook's hash, so later runs
+    # skip Excel entirely. Rows without an accession, p-value or log2 ratio are dropped, the numeric columns
+    # are coerced to floats, and all three groups come out of one pass over each sheet.
+    contrasts = preprocess_workbook(excel_file, sheet_names=sheet_names, output_dir=".",
+                                    p_threshold=p_threshold, log2_threshold=log2_threshold, main_sheet=main_sheet)
+
+    for slug, info in contrasts.items():
+        counts = info["counts"]
+        print(f"{info['sheet']}: {counts['significant']} significant, {counts['upregulated']} up, "
+              f"{counts['downregulated']} down")
+
+    # Final message to confirm everything worked
+    print("Completed Organization")
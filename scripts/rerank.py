@@ -0,0 +1,177 @@
+# Script: rerank.py
+# Purpose: Re-score Foldseek hits by superposing CA traces (Kabsch RMSD and TM-score), batched in NumPy.
+
+# ======================= OVERVIEW ==========================
+# download.py picks top hits by Foldseek bitscore alone, and until now nothing re-checked a query against
+# the models that are already on disk. This module does that locally, on the CPU:
+# - CA traces come from the structure store (structure_store.py), memory-mapped, so no PDB is re-parsed,
+# - residue pairs are taken from the alignment ranges already in the m8 columns (q_start..q_end against
+#   t_start..t_end); the .m8 has no gap string, so I pair the two ranges position by position over their
+#   common length,
+# - many pairs are padded to the same length and superposed together: centroids, covariance matrices and
+#   SVDs are computed for the whole batch at once (np.linalg.svd works on stacks of 3x3 matrices),
+# - the TM-score is refined a few times by re-superposing on the pairs closer than d0, in the spirit of
+#   the TM-score program's search, and is normalized by the query length and by the target length,
+# - pairs are split into chunks that run in a process pool, each worker opening the store itself.
+# The result is the hit table with rmsd / tm_score columns and a rank by TM-score next to the rank by bitscore.
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+from m8_reader import query_accession
+from structure_store import StructureStore, DEFAULT_STORE_DIR
+
+BATCH_SIZE = 256          # Pairs superposed together in one NumPy call
+REFINE_ITERATIONS = 3     # Re-superpositions on the close pairs for the TM-score
+RERANK_COLUMNS = ["aligned", "rmsd", "tm_score", "tm_score_target", "rank_bitscore", "rank_tm"]
+
+
+def alphafold_query_model(accession):
+    # Query structures are the AlphaFold models of the S. mutans proteins themselves.
+    return f"AF-{accession}-F1-model_v4"
+
+
+# === Superposition ===
+def kabsch_batch(P, Q, mask):
+    # P, Q: (batch, length, 3) coordinates, mask: (batch, length) weights (1 for paired positions, 0 for padding).
+    # Returns R (batch, 3, 3) and t (batch, 3) such that P @ R^T + t is superposed onto Q.
+    w = mask[..., None]
+    n = np.maximum(mask.sum(axis=1), 1.0)[:, None]
+    p_mean = (P * w).sum(axis=1) / n
+    q_mean = (Q * w).sum(axis=1) / n
+    H = np.einsum('bli,blj->bij', (P - p_mean[:, None]) * w, Q - q_mean[:, None])
+    U, _, Vt = np.linalg.svd(H)
+    # I flip the last axis where needed so every R is a proper rotation (no reflection).
+    d = np.sign(np.linalg.det(np.einsum('bij,bjk->bik', U, Vt)))
+    d[d == 0] = 1.0
+    D = np.zeros_like(H)
+    D[:, 0, 0] = 1.0
+    D[:, 1, 1] = 1.0
+    D[:, 2, 2] = d
+    R = np.einsum('bji,bjk,blk->bil', Vt, D, U)  # R = V D U^T
+    t = q_mean - np.einsum('bij,bj->bi', R, p_mean)
+    return R, t
+
+
+def superposed_distances(P, Q, R, t):
+    moved = np.einsum('bij,blj->bli', R, P) + t[:, None]
+    return np.sqrt(((moved - Q) ** 2).sum(axis=2))
+
+
+def tm_d0(length):
+    # TM-score distance scale (Zhang & Skolnick 2004), floored at 0.5 for short chains.
+    length = np.asarray(length, dtype=np.float64)
+    return np.maximum(1.24 * np.cbrt(np.maximum(length, 19) - 15) - 1.8, 0.5)
+
+
+def score_batch(P, Q, mask, query_lengths, target_lengths):
+    # I return (rmsd, tm_query, tm_target) for a padded batch of paired CA traces.
+    R, t = kabsch_batch(P, Q, mask)
+    dist = superposed_distances(P, Q, R, t)
+    n = np.maximum(mask.sum(axis=1), 1.0)
+    rmsd = np.sqrt((dist ** 2 * mask).sum(axis=1) / n)
+
+    d0_query = tm_d0(query_lengths)[:, None]
+    d0_target = tm_d0(target_lengths)[:, None]
+    tm_query = ((1.0 / (1.0 + (dist / d0_query) ** 2)) * mask).sum(axis=1)
+    tm_target = ((1.0 / (1.0 + (dist / d0_target) ** 2)) * mask).sum(axis=1)
+    for _ in range(REFINE_ITERATIONS):
+        # Superposing on the pairs that are already close usually finds a better TM-score.
+        close = mask * (dist < d0_query)
+        close = np.where(close.sum(axis=1, keepdims=True) >= 3, close, mask)
+        R, t = kabsch_batch(P, Q, close)
+        dist = superposed_distances(P, Q, R, t)
+        tm_query = np.maximum(tm_query, ((1.0 / (1.0 + (dist / d0_query) ** 2)) * mask).sum(axis=1))
+        tm_target = np.maximum(tm_target, ((1.0 / (1.0 + (dist / d0_target) ** 2)) * mask).sum(axis=1))
+    return rmsd, tm_query / query_lengths, tm_target / target_lengths
+
+
+# === Pairing ===
+def paired_traces(query_ca, query_res, target_ca, target_res, q_start, q_end, t_start, t_end):
+    # CA coordinates of the paired residues: q_start+i with t_start+i over the shorter of the two ranges.
+    length = min(q_end - q_start, t_end - t_start) + 1
+    if length <= 0:
+        return np.empty((0, 3)), np.empty((0, 3))
+    q_pos = np.searchsorted(query_res, np.arange(q_start, q_start + length))
+    t_pos = np.searchsorted(target_res, np.arange(t_start, t_start + length))
+    # Residue numbers that are not in the model (gaps in the numbering) are dropped.
+    keep = ((q_pos < len(query_res)) & (t_pos < len(target_res)))
+    q_pos, t_pos = q_pos[keep], t_pos[keep]
+    keep = (query_res[q_pos] == np.arange(q_start, q_start + length)[keep]) & \
+           (target_res[t_pos] == np.arange(t_start, t_start + length)[keep])
+    return query_ca[q_pos[keep]], target_ca[t_pos[keep]]
+
+
+def score_pairs(store_root, pairs):
+    # pairs: list of (query_model, target_model, q_start, q_end, t_start, t_end).
+    # Returns one (aligned, rmsd, tm_score, tm_score_target) tuple per pair; NaN when a model is missing.
+    store = StructureStore(store_root)
+    traces = {}
+
+    def trace(model_id):
+        if model_id not in traces:
+            traces[model_id] = store.ca_coords(model_id) if model_id in store else None
+        return traces[model_id]
+
+    results = [(0, np.nan, np.nan, np.nan)] * len(pairs)
+    prepared = []  # (index, P, Q, query_length, target_length)
+    for i, (query_model, target_model, q_start, q_end, t_start, t_end) in enumerate(pairs):
+        query, target = trace(query_model), trace(target_model)
+        if query is None or target is None:
+            continue
+        P, Q = paired_traces(query[0], query[1], target[0], target[1], int(q_start), int(q_end),
+                             int(t_start), int(t_end))
+        if len(P) >= 3:
+            prepared.append((i, P, Q, len(query[0]), len(target[0])))
+
+    # Sorting by length keeps the padding inside each batch small.
+    prepared.sort(key=lambda item: len(item[1]))
+    for start in range(0, len(prepared), BATCH_SIZE):
+        batch = prepared[start:start + BATCH_SIZE]
+        width = max(len(item[1]) for item in batch)
+        P = np.zeros((len(batch), width, 3))
+        Q = np.zeros((len(batch), width, 3))
+        mask = np.zeros((len(batch), width))
+        for b, (_, p, q, _, _) in enumerate(batch):
+            P[b, :len(p)] = p
+            Q[b, :len(q)] = q
+            mask[b, :len(p)] = 1.0
+        rmsd, tm_query, tm_target = score_batch(
+            P, Q, mask,
+            np.array([item[3] for item in batch], dtype=np.float64),
+            np.array([item[4] for item in batch], dtype=np.float64))
+        for b, item in enumerate(batch):
+            results[item[0]] = (int(mask[b].sum()), float(rmsd[b]), float(tm_query[b]), float(tm_target[b]))
+    return results
+
+
+# === Re-ranking ===
+@timed("rerank.rerank_hits")
+def rerank_hits(hits, store_root=DEFAULT_STORE_DIR, query_model=alphafold_query_model, workers=None,
+                chunk_size=500):
+    # hits is an m8-style table (query, target, bitscore, q_start, q_end, t_start, t_end). query may be a
+    # raw header or an accession; query_model maps the accession to the model ID of its structure.
+    hits = hits.reset_index(drop=True)
+    queries = hits["query"].astype(str).map(query_accession)
+    pairs = list(zip(queries.map(query_model), hits["target"].astype(str),
+                     hits["q_start"], hits["q_end"], hits["t_start"], hits["t_end"]))
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+
+    if workers == 1 or len(chunks) <= 1:
+        scored = [row for chunk in chunks for row in score_pairs(store_root, chunk)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            scored = [row for part in pool.map(score_pairs, [store_root] * len(chunks), chunks) for row in part]
+
+    ranked = hits.copy()
+    scores = pd.DataFrame(scored, columns=RERANK_COLUMNS[:4])
+    for column in RERANK_COLUMNS[:4]:
+        ranked[column] = scores[column].to_numpy()
+    ranked["rank_bitscore"] = ranked.groupby(queries)["bitscore"].rank(ascending=False, method="first")
+    ranked["rank_tm"] = ranked.groupby(queries)["tm_score"].rank(ascending=False, method="first")
+    ranked = ranked.astype({"aligned": np.int32, "rmsd": np.float32, "tm_score": np.float32,
+                            "tm_score_target": np.float32})
+    return ranked.sort_values(["tm_score", "bitscore"], ascending=False, na_position="last").reset_index(drop=True)
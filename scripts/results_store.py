@@ -0,0 +1,263 @@
+# Script: results_store.py
+# Purpose: One local SQLite database that holds DE categories, Foldseek hits, downloaded structures
+#          and DeepGOPlus GO predictions, with indexes so the usual joins are instant.
+
+# ======================= OVERVIEW ==========================
+# Every summary used to start from flat files: summarize.py read the three hits_*_uncharacterized.txt
+# files into sets, listed top_hit_structures/ with os.listdir and re-scanned every .m8, and the GO
+# predictions sat in separate CSVs under DeepGOPlus/. Here everything goes into one SQLite file once:
+# - categories:      accession -> DE category (upregulated, downregulated, significant, ...)
+# - hits:            every Foldseek hit: the query as written in the .m8 (query_header), its accession (query),
+#                    the database it came from and all m8 columns
+# - sources:         which .m8 files have been loaded, with their size and mtime, so unchanged files are skipped
+# - structures:      the structure files that are on disk, keyed by model ID
+# - go_predictions:  DeepGOPlus predictions per protein / section, for each prediction set
+# Loading is done in bulk inside one transaction per file. The summary CSVs I used to build by hand
+# (top_hits_summary_final.csv, top_foldseek_hits_all_databases.csv) are now single indexed queries.
+# sqlite3 ships with Python, so nothing extra needs to be installed.
+
+import os       # I use this for file stats and walking structure folders.
+import re       # I use this to strip rank prefixes from structure file names.
+import sqlite3  # I use this as the embedded database.
+
+import pandas as pd
+
+from instrumentation import timed
+from m8_reader import M8_COLUMNS, query_accession, read_m8
+
+DEFAULT_DB_PATH = "prostt5_uncharacterized_results/results.sqlite"
+# Order in which a query is assigned a category when it belongs to several (same as summarize.py).
+CATEGORY_PRIORITY = ["upregulated", "downregulated", "significant"]
+RANK_PREFIX = re.compile(r"^\d+_")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    category  TEXT NOT NULL,
+    accession TEXT NOT NULL,
+    PRIMARY KEY (category, accession)
+);
+CREATE INDEX IF NOT EXISTS categories_accession ON categories (accession);
+
+CREATE TABLE IF NOT EXISTS sources (
+    id       INTEGER PRIMARY KEY,
+    path     TEXT NOT NULL UNIQUE,
+    database TEXT NOT NULL,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hits     INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS hits (
+    source_id    INTEGER NOT NULL REFERENCES sources (id),
+    database     TEXT NOT NULL,
+    query_header TEXT NOT NULL,
+    query        TEXT NOT NULL,
+    target       TEXT NOT NULL,
+    fident       REAL,
+    alnlen       INTEGER,
+    mismatch     INTEGER,
+    gap_open     INTEGER,
+    q_start      INTEGER,
+    q_end        INTEGER,
+    t_start      INTEGER,
+    t_end        INTEGER,
+    evalue       REAL,
+    bitscore     REAL
+);
+CREATE INDEX IF NOT EXISTS hits_query_database ON hits (query, database, bitscore DESC);
+CREATE INDEX IF NOT EXISTS hits_target ON hits (target);
+CREATE INDEX IF NOT EXISTS hits_source ON hits (source_id);
+CREATE INDEX IF NOT EXISTS hits_bitscore ON hits (bitscore DESC);
+
+CREATE TABLE IF NOT EXISTS structures (
+    model_id TEXT PRIMARY KEY,
+    path     TEXT NOT NULL,
+    size     INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS go_predictions (
+    prediction_set TEXT NOT NULL,
+    protein        TEXT NOT NULL,
+    section        TEXT NOT NULL,
+    go_id          TEXT NOT NULL,
+    description    TEXT,
+    score          REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS go_protein ON go_predictions (protein, section, score DESC);
+CREATE INDEX IF NOT EXISTS go_term ON go_predictions (go_id);
+"""
+
+
+def m8_database(path):
+    # results_afdb50.m8 / results_afdb50_indexed.m8 -> results_afdb50, the name used in the summaries.
+    name = os.path.basename(path)
+    for suffix in (".m8", "_indexed"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+def structure_model_id(filename):
+    # "AF-X-F1-model_v4.pdb", "07_AF-X-F1-model_v4.pdb" and "1abc.pdb.gz" -> model ID without rank or extension.
+    name = os.path.basename(filename)
+    for suffix in (".gz", ".pdb", ".cif"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return RANK_PREFIX.sub("", name, count=1)
+
+
+class ResultsStore:
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        folder = os.path.dirname(db_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        # WAL lets notebooks read while a loader is writing; NORMAL sync is safe with WAL and much faster.
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.migrate()
+
+    def migrate(self):
+        # Databases from before the rename called the raw .m8 query "query_id", which the summaries use
+        # for the accession.
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(hits)")]
+        if "query_id" in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE hits RENAME COLUMN query_id TO query_header")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # === Loading ===
+    def load_categories(self, categories, replace=True):
+        # categories maps a name to a set of accessions (what hit_router.load_categories returns).
+        with self.conn:
+            for name, accessions in categories.items():
+                if replace:
+                    self.conn.execute("DELETE FROM categories WHERE category = ?", (name,))
+                self.conn.executemany("INSERT OR IGNORE INTO categories VALUES (?, ?)",
+                                      ((name, acc) for acc in accessions))
+
+    @timed("results_store.load_m8")
+    def load_m8(self, path, database=None, force=False):
+        # I load one .m8 file, replacing whatever was loaded from it before. Unchanged files are skipped.
+        # Returns the number of hits inserted (0 when skipped).
+        path = os.path.abspath(path)
+        database = database or m8_database(path)
+        st = os.stat(path)
+        row = self.conn.execute("SELECT id, size, mtime_ns FROM sources WHERE path = ?", (path,)).fetchone()
+        if not force and row is not None and row[1:] == (st.st_size, st.st_mtime_ns):
+            return 0
+
+        df = read_m8(path)
+        queries = df["query"].astype(str)
+        accessions = queries.map(query_accession)
+        with self.conn:
+            if row is not None:
+                self.conn.execute("DELETE FROM hits WHERE source_id = ?", (row[0],))
+                self.conn.execute("DELETE FROM sources WHERE id = ?", (row[0],))
+            source_id = self.conn.execute(
+                "INSERT INTO sources (path, database, size, mtime_ns, hits) VALUES (?, ?, ?, ?, ?)",
+                (path, database, st.st_size, st.st_mtime_ns, len(df))).lastrowid
+            rows = zip(
+                [source_id] * len(df), [database] * len(df), queries, accessions, df["target"].astype(str),
+                *(df[col].tolist() for col in M8_COLUMNS[2:])
+            )
+            self.conn.executemany(f"INSERT INTO hits VALUES ({', '.join('?' * 15)})", rows)
+        return len(df)
+
+    def load_m8_files(self, paths, force=False):
+        loaded = {}
+        for path in paths:
+            loaded[path] = self.load_m8(path, force=force)
+        return loaded
+
+    def load_structures(self, folder, replace=True):
+        # I record every structure file in folder (.pdb, .pdb.gz, .cif) under its model ID.
+        rows = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith((".pdb", ".pdb.gz", ".cif", ".cif.gz")):
+                    rows.append((structure_model_id(entry.name), os.path.abspath(entry.path), entry.stat().st_size))
+        with self.conn:
+            if replace:
+                self.conn.execute("DELETE FROM structures")
+            self.conn.executemany("INSERT OR REPLACE INTO structures VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def load_go_predictions(self, predictions, prediction_set):
+        # predictions is a DataFrame in deepgoplus_parser's layout (Protein, Section, GO_ID, Description, Score)
+        # or the path of a combined_parsed_predictions_<set>.csv.
+        if isinstance(predictions, str):
+            predictions = pd.read_csv(predictions)
+        rows = zip(
+            [prediction_set] * len(predictions),
+            predictions["Protein"].astype(str), predictions["Section"].astype(str),
+            predictions["GO_ID"].astype(str), predictions["Description"].astype(str),
+            predictions["Score"].astype(float),
+        )
+        with self.conn:
+            self.conn.execute("DELETE FROM go_predictions WHERE prediction_set = ?", (prediction_set,))
+            self.conn.executemany("INSERT INTO go_predictions VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return len(predictions)
+
+    # === Queries ===
+    def query(self, sql, params=()):
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def category_case(self, column):
+        # SQL expression that gives the first category (in CATEGORY_PRIORITY order) of an accession column.
+        names = CATEGORY_PRIORITY + [name for (name,) in self.conn.execute(
+            "SELECT DISTINCT category FROM categories ORDER BY category") if name not in CATEGORY_PRIORITY]
+        quote = lambda text: "'" + text.replace("'", "''") + "'"
+        whens = " ".join(
+            f"WHEN EXISTS (SELECT 1 FROM categories c WHERE c.category = {quote(name)} AND c.accession = {column}) "
+            f"THEN {quote(name.capitalize())}" for name in names)
+        return f"CASE {whens} ELSE 'Uncategorized' END"
+
+    def top_hits_summary(self):
+        # What summarize.py writes to top_hits_summary_final.csv: every hit to a structure I have on disk.
+        return self.query(f"""
+            SELECT h.query AS query_id, h.target AS target_id, h.bitscore AS bitscore,
+                   {self.category_case('h.query')} AS category
+            FROM hits h JOIN structures s ON s.model_id = h.target
+            ORDER BY h.bitscore DESC
+        """)
+
+    def top_hits_per_database(self, evalue_cutoff=None):
+        # The best hit (by bitscore) for every query in every database, as in top_foldseek_hits_all_databases.csv.
+        where = "WHERE evalue < ?" if evalue_cutoff is not None else ""
+        params = (evalue_cutoff,) if evalue_cutoff is not None else ()
+        df = self.query(f"""
+            SELECT query, target, bitscore AS bits, evalue, fident, database FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY query, database ORDER BY bitscore DESC) AS rank
+                FROM hits {where}
+            ) WHERE rank = 1
+            ORDER BY database, bits DESC
+        """, params)
+        df.insert(2, "uniprot_id", df["target"].str.extract(r"AF-([A-Z0-9]+)-", expand=False))
+        return df
+
+    def hits_for(self, accession, database=None, limit=None):
+        sql = "SELECT * FROM hits WHERE query = ?" + (" AND database = ?" if database else "")
+        sql += " ORDER BY bitscore DESC" + (f" LIMIT {int(limit)}" if limit else "")
+        return self.query(sql, (accession, database) if database else (accession,))
+
+    def go_terms_for(self, accessions, top=None):
+        # GO predictions for a list of proteins; with top=k only the k best per protein and section.
+        marks = ", ".join("?" * len(accessions))
+        df = self.query(f"""
+            SELECT protein, section, go_id, description, score, prediction_set,
+                   ROW_NUMBER() OVER (PARTITION BY protein, section ORDER BY score DESC) AS rank
+            FROM go_predictions WHERE protein IN ({marks})
+            ORDER BY protein, section, rank
+        """, list(accessions))
+        return df[df["rank"] <= top].reset_index(drop=True) if top else df
@@ -0,0 +1,248 @@
+# Script: sharded_search.py
+# Purpose: Split a big query FASTA into residue-balanced shards and run createdb + searches per shard in parallel.
+
+# ======================= OVERVIEW ==========================
+# fasta_to_foldseek.py runs one ProstT5 createdb over the whole FASTA and then searches that one database.
+# On a CPU-only node ProstT5 inference dominates, and a single createdb neither keeps every core busy nor
+# survives a failure: one crash means starting over. Here I:
+# - cut the FASTA into shards balanced on total residue count (longest-first onto the lightest shard),
+#   keeping the original record order inside each shard,
+# - run every shard (createdb, then easy-search against every database) in its own process with a fixed
+#   number of threads (--threads plus OMP/MKL variables), so shards x threads never exceeds the CPU budget,
+# - let at most max_createdb shards run ProstT5 createdb at the same time (every one loads its own copy of
+#   the model); by default that is what fits in memory at PROSTT5_MEMORY each, the searches are not limited,
+# - retry a failed shard on its own, and skip shards that finished in an earlier run; a shard whose
+#   createdb already succeeded only repeats its searches,
+# - merge the shard .m8 files per database into the usual results_<db>.m8, in FASTA query order and by
+#   descending bitscore within each query, streaming so only one query block per shard is held in memory.
+
+import heapq   # I use this to merge the shard outputs.
+import multiprocessing  # I use this for the semaphore that limits concurrent createdb runs.
+import os      # I use this for paths, CPU counts and the thread variables.
+import shutil  # I use this to remove each shard's tmp folder.
+import tempfile
+import time    # I use this to time each shard.
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from fasta_partition import iter_records, open_binary
+from foldseek_scheduler import foldseek_command, run_logged
+from instrumentation import count, event, timed
+
+THREAD_VARIABLES = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "TORCH_NUM_THREADS")
+DONE_MARKER = "done"
+CREATEDB_MARKER = "createdb.done"
+PROSTT5_MEMORY = 4 * 1024 ** 3  # bytes one ProstT5 createdb process needs, with headroom
+createdb_slots = None  # per worker process: the semaphore shared by all shards, set by init_worker
+
+
+# === Sharding ===
+def balance_shards(lengths, shards):
+    # Longest processing time first: every record goes to the shard with the fewest residues so far.
+    # Returns a list of record indices per shard, each in the original order.
+    heap = [(0, i) for i in range(shards)]
+    members = [[] for _ in range(shards)]
+    for index in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+        total, shard = heapq.heappop(heap)
+        members[shard].append(index)
+        heapq.heappush(heap, (total + lengths[index], shard))
+    return [sorted(m) for m in members if m]
+
+
+def write_shards(fasta_file, shard_root, shards):
+    # I write shard_<n>/shard.fasta files and return [{"name", "fasta", "records", "residues"}] plus the
+    # query IDs in FASTA order (used to order the merged output).
+    with open_binary(fasta_file) as handle:
+        records = [(record.header[1:].split(None, 1)[0], record.length, record.lines)
+                   for record in iter_records(handle)]
+    groups = balance_shards([length for _, length, _ in records], max(1, min(shards, len(records))))
+    shard_list = []
+    for n, members in enumerate(groups):
+        folder = os.path.join(shard_root, f"shard_{n:03d}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, "shard.fasta")
+        content = b"".join(b"".join(records[i][2]) for i in members)
+        # A shard whose FASTA did not change keeps its results; otherwise its done marker is dropped.
+        previous = None
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                previous = f.read()
+        if previous != content:
+            with open(path, 'wb') as f:
+                f.write(content)
+            for marker in (DONE_MARKER, CREATEDB_MARKER):
+                if os.path.exists(os.path.join(folder, marker)):
+                    os.remove(os.path.join(folder, marker))
+        shard_list.append({"name": f"shard_{n:03d}", "folder": folder, "fasta": path, "records": len(members),
+                           "residues": sum(records[i][1] for i in members)})
+    return shard_list, [query_id for query_id, _, _ in records]
+
+
+# === One shard ===
+def pin_threads(threads):
+    # Process pool initializer: ProstT5 / BLAS inside foldseek must not start more threads than the shard owns.
+    for name in THREAD_VARIABLES:
+        os.environ[name] = str(threads)
+
+
+def init_worker(threads, slots):
+    global createdb_slots
+    pin_threads(threads)
+    createdb_slots = slots
+
+
+def memory_bytes():
+    # Physical memory, or None where sysconf does not know it (Windows).
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_max_createdb(workers):
+    memory = memory_bytes()
+    fits = memory // PROSTT5_MEMORY if memory else 2
+    return max(1, min(workers, fits))
+
+
+def run_shard(shard, databases, prost_model, threads, extra_args=()):
+    # createdb for the shard, then easy-search against every database, all logged in the shard folder.
+    folder = shard["folder"]
+    start = time.perf_counter()
+    marker_path = os.path.join(folder, DONE_MARKER)
+    # The marker lists what the shard was searched against, so new databases or arguments rerun it.
+    marker = "\n".join([db["path"] for db in databases] + [str(a) for a in extra_args]) + "\n"
+    if os.path.exists(marker_path):
+        with open(marker_path, 'r') as f:
+            if f.read() == marker:
+                return {**shard, "ok": True, "cached": True, "seconds": 0.0}
+
+    query_db = os.path.join(folder, "query_db")
+    createdb_marker = os.path.join(folder, CREATEDB_MARKER)
+    # A retry after a failed search keeps the query database of the earlier attempt.
+    if not os.path.exists(createdb_marker):
+        cmd = foldseek_command("createdb", shard["fasta"], query_db, "--prostt5-model", prost_model,
+                               threads=threads)
+        if createdb_slots is not None:
+            with createdb_slots:
+                code, _ = run_logged(cmd, os.path.join(folder, "createdb.log"))
+        else:
+            code, _ = run_logged(cmd, os.path.join(folder, "createdb.log"))
+        if code != 0:
+            return {**shard, "ok": False, "step": "createdb", "exit_code": code,
+                    "log": os.path.join(folder, "createdb.log"), "seconds": round(time.perf_counter() - start, 3)}
+        with open(createdb_marker, 'w') as f:
+            f.write(shard["fasta"] + "\n")
+
+    for database in databases:
+        out_m8 = os.path.join(folder, f"results_{database['name']}.m8")
+        log_path = os.path.join(folder, f"search_{database['name']}.log")
+        tmp_dir = tempfile.mkdtemp(prefix="tmp-", dir=folder)
+        cmd = foldseek_command("easy-search", query_db, database["path"], out_m8, tmp_dir, *extra_args,
+                               threads=threads)
+        code, _ = run_logged(cmd, log_path)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if code != 0 or not os.path.exists(out_m8):
+            return {**shard, "ok": False, "step": f"search {database['name']}", "exit_code": code,
+                    "log": log_path, "seconds": round(time.perf_counter() - start, 3)}
+
+    with open(marker_path, 'w') as f:
+        f.write(marker)
+    return {**shard, "ok": True, "cached": False, "seconds": round(time.perf_counter() - start, 3)}
+
+
+# === Merging ===
+def query_blocks(path, order):
+    # I yield (query position, -bitscore, line) from one shard m8, sorted by bitscore inside each query block.
+    block, current = [], None
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if fields[0] != current:
+                yield from sorted(block)
+                block, current = [], fields[0]
+            if not line.endswith('\n'):
+                line += '\n'
+            block.append((order.get(fields[0], len(order)), -float(fields[11]), line))
+    yield from sorted(block)
+
+
+def merge_shard_results(paths, query_order, out_m8):
+    # The shards hold disjoint queries, so a k-way merge on (FASTA position, -bitscore) gives one file in
+    # query order with the best hits first.
+    order = {query_id: i for i, query_id in enumerate(query_order)}
+    tmp_path = out_m8 + ".tmp"
+    rows = 0
+    with open(tmp_path, 'w') as out:
+        for _, _, line in heapq.merge(*(query_blocks(path, order) for path in paths)):
+            out.write(line)
+            rows += 1
+    os.replace(tmp_path, out_m8)
+    return rows
+
+
+# === Sharded run ===
+@timed("sharded.search")
+def sharded_search(fasta_file, databases, results_dir, prost_model, cpu_budget=None, threads_per_shard=1,
+                   shards=None, max_retries=2, extra_args=(), on_result=None, max_createdb=None):
+    # The sharded counterpart of create_query_db + schedule_searches: same results_<db>.m8 outputs and the
+    # same on_result(result) callback. shards defaults to one per worker slot; max_createdb defaults to
+    # the number of ProstT5 models that fit in memory.
+    cpu_budget = cpu_budget or os.cpu_count() or 1
+    workers = max(1, cpu_budget // threads_per_shard)
+    max_createdb = max_createdb or default_max_createdb(workers)
+    shard_root = os.path.join(results_dir, "shards")
+    os.makedirs(shard_root, exist_ok=True)
+    shard_list, query_order = write_shards(fasta_file, shard_root, shards or workers)
+    print(f"🧩 {len(query_order)} queries in {len(shard_list)} shards "
+          f"({min(s['residues'] for s in shard_list)}-{max(s['residues'] for s in shard_list)} residues each), "
+          f"{workers} at a time with {threads_per_shard} threads each, at most {max_createdb} in createdb")
+
+    attempts = {shard["name"]: 0 for shard in shard_list}
+    failed = []
+    slots = multiprocessing.Semaphore(max_createdb)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(threads_per_shard, slots)) as pool:
+        def submit(shard):
+            return pool.submit(run_shard, shard, databases, prost_model, threads_per_shard, extra_args)
+
+        futures = {submit(shard): shard for shard in shard_list}
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                shard = futures.pop(future)
+                result = future.result()
+                attempts[shard["name"]] += 1
+                event("shard", shard=shard["name"], attempt=attempts[shard["name"]],
+                      **{k: v for k, v in result.items() if k not in ("name", "folder")})
+                if result["ok"]:
+                    status = "cached" if result["cached"] else f"{result['seconds']:.1f}s"
+                    print(f"  {shard['name']}: {shard['records']} queries, {shard['residues']} residues ✅ {status}")
+                elif attempts[shard["name"]] <= max_retries:
+                    # Only this shard is run again; the others keep going.
+                    count("sharded.retries")
+                    print(f"  {shard['name']}: ❌ {result['step']} failed (exit code {result['exit_code']}), "
+                          "retrying")
+                    futures[submit(shard)] = shard
+                else:
+                    print(f"  {shard['name']}: ❌ {result['step']} failed {attempts[shard['name']]} times, "
+                          f"see {result['log']}")
+                    failed.append(shard["name"])
+
+    results = []
+    for database in databases:
+        out_m8 = os.path.join(results_dir, f"results_{database['name']}.m8")
+        ok = not failed
+        rows = 0
+        if ok:
+            paths = [os.path.join(shard["folder"], f"results_{database['name']}.m8") for shard in shard_list]
+            rows = merge_shard_results(paths, query_order, out_m8)
+        result = {"database": database["name"], "target": database["path"], "m8": out_m8, "hits": rows,
+                  "ok": ok, "failed_shards": failed}
+        print(f"  {database['name']}: " + (f"✅ {rows} hits merged" if ok else
+                                           f"❌ not merged, shards failed: {', '.join(failed)}"))
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+    return results
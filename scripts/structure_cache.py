@@ -0,0 +1,243 @@
+# Script: structure_cache.py
+# Purpose: One local, compressed cache for every AlphaFold / RCSB structure the pipeline downloads.
+
+# ======================= OVERVIEW ==========================
+# download.py, scripts_WIP/prostt5_results/download.py and 01_Working_FoldSeek_Search.py all used to
+# fetch the same structure files on their own, so overlapping hit lists were downloaded again and again.
+# Now they all go through this cache:
+# - Every structure is stored once, gzip-compressed, under a key that is its model ID
+#   (for example "AF-Q8DUY0-F1-model_v4", which already carries the AlphaFold version, or "7ccg" for RCSB).
+# - Files are written to a temporary name and then renamed into place, so an interrupted download
+#   can never leave a truncated PDB behind.
+# - When the cache grows past max_bytes I evict the least recently used entries. Each read touches
+#   the file's modification time, so mtime doubles as the "last used" clock.
+# - I keep the size and last use of every entry in memory with a running total, so a put costs one stat
+#   instead of a walk over the whole cache. Only when the total passes max_bytes do I rescan the folder
+#   (other scripts may share the cache) and evict in one batch down to EVICT_TARGET of max_bytes, so the
+#   rescan is paid once per batch of evictions, not once per insert.
+# - The scripts still get plain .pdb files in their own folders through materialize(), and extra
+#   names for the same file (like the rank-prefixed "01_AF-....pdb") are hardlinks or symlinks.
+
+import gzip       # I use this to store the structures compressed.
+import hashlib    # I use this to spread the cache entries over subfolders.
+import os         # I use this for paths, renames and links.
+import shutil     # I use this as the last-resort copy when links are not possible.
+import tempfile   # I use this to write every file under a temporary name first.
+import threading  # I use a lock so concurrent downloads don't evict while another write is going on.
+import time       # I use this as the "last used" clock of the in-memory index.
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "STRUCTURE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "smutans_structures"))
+DEFAULT_MAX_BYTES = int(os.environ.get("STRUCTURE_CACHE_MAX_BYTES", 2 * 1024 ** 3))  # 2 GiB of compressed files
+EVICT_TARGET = 0.9  # An eviction frees space down to this fraction of max_bytes.
+
+
+def alphafold_url(model_id):
+    # AlphaFold model IDs look like AF-<UniProt>-F1-model_v4.
+    return f"https://alphafold.ebi.ac.uk/files/{model_id}.pdb"
+
+
+def rcsb_url(pdb_id):
+    return f"https://files.rcsb.org/download/{pdb_id.upper()}.pdb"
+
+
+def structure_url(model_id):
+    # I pick the download URL from the shape of the ID.
+    if model_id.upper().startswith("AF-"):
+        return alphafold_url(model_id)
+    if len(model_id) == 4 and model_id.isalnum():
+        return rcsb_url(model_id)
+    return None
+
+
+def atomic_write(path, data, mode='wb'):
+    # I write to a temporary file in the same folder and rename it, which is atomic on the same filesystem.
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def link_or_copy(src, dest):
+    # I give an existing file another name without duplicating its content: hardlink first, then
+    # symlink, and only copy if the filesystem supports neither.
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+        return "hardlink"
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.relpath(os.path.abspath(src), os.path.dirname(os.path.abspath(dest))), dest)
+        return "symlink"
+    except OSError:
+        shutil.copyfile(src, dest)
+        return "copy"
+
+
+class StructureCache:
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.index = None  # path -> (last used, size), read from disk the first time it is needed
+        self.total = 0
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+
+    # === Lookup ===
+    def path_for(self, key):
+        safe_key = key.replace("/", "_")
+        shard = hashlib.sha1(safe_key.encode()).hexdigest()[:2]
+        return os.path.join(self.root, "objects", shard, f"{safe_key}.pdb.gz")
+
+    def has(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def touch(self, key):
+        # I mark the entry as recently used.
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return
+        with self.lock:
+            if self.index is not None and path in self.index:
+                self.index[path] = (time.time(), self.index[path][1])
+
+    def read_bytes(self, key):
+        path = self.path_for(key)
+        with gzip.open(path, 'rb') as f:
+            data = f.read()
+        self.touch(key)
+        return data
+
+    # === Storing ===
+    def put_bytes(self, key, data):
+        # I compress the structure and store it atomically under its key.
+        atomic_write(self.path_for(key), gzip.compress(data, compresslevel=6))
+        self.added(self.path_for(key))
+        self.evict()
+        return self.path_for(key)
+
+    def put_file(self, key, src_path):
+        # I stream the file through gzip so large models never have to sit in memory.
+        path = self.path_for(key)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-", suffix=os.path.basename(path))
+        try:
+            with open(src_path, 'rb') as src, os.fdopen(fd, 'wb') as raw, \
+                    gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.added(path)
+        self.evict()
+        return path
+
+    def materialize(self, key, dest):
+        # I write a plain .pdb for the scripts that want one. If dest already exists I leave it alone.
+        if not os.path.exists(dest):
+            atomic_write(dest, self.read_bytes(key))
+        else:
+            self.touch(key)
+        return dest
+
+    def fetch(self, key, url=None, session=None, timeout=60):
+        # I return the cache path for key and only go to the network when the entry is missing.
+        # The return value is (path, was_downloaded).
+        if self.has(key):
+            self.touch(key)
+            return self.path_for(key), False
+
+        url = url or structure_url(key)
+        if url is None:
+            raise ValueError(f"Don't know where to download {key} from")
+        if session is None:
+            import requests
+            session = requests
+        response = session.get(url, timeout=timeout)
+        response.raise_for_status()
+        return self.put_bytes(key, response.content), True
+
+    # === Eviction ===
+    def entries(self):
+        # I list (mtime, size, path) for every cached object.
+        found = []
+        for dirpath, _, files in os.walk(os.path.join(self.root, "objects")):
+            for name in files:
+                if name.endswith(".pdb.gz"):
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    found.append((st.st_mtime, st.st_size, path))
+        return found
+
+    def rescan(self):
+        # I rebuild the in-memory index and running total from disk. Call with self.lock held.
+        self.index = {path: (mtime, size) for mtime, size, path in self.entries()}
+        self.total = sum(size for _, size in self.index.values())
+
+    def added(self, path):
+        # I add a freshly written entry (or a rewrite of an existing one) to the running total.
+        size = os.path.getsize(path)
+        with self.lock:
+            if self.index is None:
+                self.rescan()
+                return
+            _, old_size = self.index.get(path, (0, 0))
+            self.index[path] = (time.time(), size)
+            self.total += size - old_size
+
+    def size(self):
+        with self.lock:
+            if self.index is None:
+                self.rescan()
+            return self.total
+
+    def evict(self):
+        # I remove the least recently used entries once the cache is over max_bytes, down to
+        # EVICT_TARGET of it, so the next inserts don't each trigger another eviction.
+        if not self.max_bytes:
+            return 0
+        with self.lock:
+            if self.index is not None and self.total <= self.max_bytes:
+                return 0
+            self.rescan()
+            if self.total <= self.max_bytes:
+                return 0
+            removed = 0
+            for path, (_, size) in sorted(self.index.items(), key=lambda item: item[1][0]):
+                if self.total <= self.max_bytes * EVICT_TARGET:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                else:
+                    removed += 1
+                del self.index[path]
+                self.total -= size
+            return removed
+
+
+def fetch_structure(model_id, dest, cache=None, session=None, url=None):
+    # Convenience wrapper: make sure model_id is cached, then put a plain copy at dest.
+    # Returns True if the structure had to be downloaded, False if it came from the cache.
+    cache = cache or StructureCache()
+    _, downloaded = cache.fetch(model_id, url=url, session=session)
+    cache.materialize(model_id, dest)
+    return downloaded
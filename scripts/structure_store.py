@@ -0,0 +1,203 @@
+# Script: structure_store.py
+# Purpose: Parse downloaded PDB models once into compact NumPy arrays that can be memory-mapped later.
+
+# ======================= OVERVIEW ==========================
+# top_hit_structures/ (and the WIP prostt5_results/top_hit_structures/) hold hundreds of AlphaFold
+# PDB files of 6k-17k lines each. Anything downstream (ActSeek, pLDDT triage, re-ranking) would have to
+# parse that text again every time. The store here does it once per model:
+# - each model becomes one .npy structured array (one row per atom: float32 coordinates, residue number,
+#   atom / residue / chain names, element and B-factor, which is the pLDDT for AlphaFold models),
+# - the fixed-width PDB columns are cut out of the whole file at once with NumPy, no per-line Python,
+# - models are loaded lazily and memory-mapped, so opening one only touches the bytes that are read,
+# - an index.tsv next to the arrays keeps per-model summaries (atoms, residues, mean / min pLDDT,
+#   fraction of residues with pLDDT >= 70) and the size and mtime of the source PDB, so changed files are
+#   re-parsed automatically and scanning hundreds of models never opens a PDB,
+# - folders are converted in a process pool.
+
+import gzip   # I use this to read .pdb.gz files from the structure cache.
+import os     # I use this for paths, file stats and atomic renames.
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+from results_store import structure_model_id
+
+DEFAULT_STORE_DIR = "structure_store"
+INDEX_NAME = "index.tsv"
+CONFIDENT_PLDDT = 70.0
+
+ATOM_DTYPE = np.dtype([
+    ("coord", np.float32, (3,)),
+    ("res_seq", np.int32),
+    ("atom", "S4"),
+    ("res_name", "S3"),
+    ("chain", "S1"),
+    ("element", "S2"),
+    ("b_factor", np.float32),
+    ("hetero", np.bool_),
+])
+SUMMARY_COLUMNS = ["model_id", "atoms", "residues", "mean_plddt", "min_plddt", "confident_fraction",
+                   "source", "source_size", "source_mtime_ns"]
+
+
+# === Parsing ===
+def read_pdb_bytes(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rb') as f:
+        return f.read()
+
+
+def parse_pdb(data):
+    # I turn the ATOM/HETATM records of the first model into an ATOM_DTYPE array.
+    end = data.find(b"\nENDMDL")
+    if end != -1:
+        data = data[:end]
+    lines = [line for line in data.splitlines() if line.startswith((b"ATOM  ", b"HETATM"))]
+    atoms = np.zeros(len(lines), dtype=ATOM_DTYPE)
+    if not lines:
+        return atoms
+
+    # All lines are padded to 80 columns, so the file becomes an (atoms, 80) byte matrix and
+    # every PDB field is a column slice of it.
+    table = np.frombuffer(b"".join(line[:80].ljust(80) for line in lines), dtype="S1").reshape(-1, 80)
+
+    def field(start, stop):
+        return np.ascontiguousarray(table[:, start:stop]).view(f"S{stop - start}").ravel()
+
+    atoms["coord"][:, 0] = field(30, 38).astype(np.float32)
+    atoms["coord"][:, 1] = field(38, 46).astype(np.float32)
+    atoms["coord"][:, 2] = field(46, 54).astype(np.float32)
+    atoms["res_seq"] = field(22, 26).astype(np.int32)
+    atoms["atom"] = np.char.strip(field(12, 16))
+    atoms["res_name"] = np.char.strip(field(17, 20))
+    atoms["chain"] = field(21, 22)
+    atoms["element"] = np.char.strip(field(76, 78))
+    b_factor = np.char.strip(field(60, 66))
+    atoms["b_factor"] = np.where(b_factor == b"", b"0", b_factor).astype(np.float32)
+    atoms["hetero"] = field(0, 6) == b"HETATM"
+    return atoms
+
+
+def summarize_atoms(atoms):
+    # Per-model numbers computed from the CA atoms (one per residue, carrying the residue's pLDDT).
+    ca = atoms[(atoms["atom"] == b"CA") & ~atoms["hetero"]]
+    plddt = ca["b_factor"]
+    return {
+        "atoms": len(atoms),
+        "residues": len(ca),
+        "mean_plddt": round(float(plddt.mean()), 3) if len(ca) else float("nan"),
+        "min_plddt": round(float(plddt.min()), 3) if len(ca) else float("nan"),
+        "confident_fraction": round(float((plddt >= CONFIDENT_PLDDT).mean()), 4) if len(ca) else float("nan"),
+    }
+
+
+def convert_model(pdb_path, array_path):
+    # I parse one PDB and save its array atomically. Returns the summary row for the index.
+    atoms = parse_pdb(read_pdb_bytes(pdb_path))
+    tmp_path = array_path + ".tmp.npy"
+    np.save(tmp_path, atoms)
+    os.replace(tmp_path, array_path)
+    st = os.stat(pdb_path)
+    return {"model_id": structure_model_id(pdb_path), **summarize_atoms(atoms),
+            "source": os.path.abspath(pdb_path), "source_size": st.st_size, "source_mtime_ns": st.st_mtime_ns}
+
+
+# === Store ===
+class StructureStore:
+    def __init__(self, root=DEFAULT_STORE_DIR):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_NAME)
+        os.makedirs(root, exist_ok=True)
+        self.index = {}  # model_id -> summary row
+        if os.path.exists(self.index_path):
+            for row in pd.read_csv(self.index_path, sep='\t').to_dict("records"):
+                self.index[row["model_id"]] = row
+        self.loaded = {}  # model_id -> memory-mapped array, opened on first use
+
+    def array_path(self, model_id):
+        return os.path.join(self.root, f"{model_id}.npy")
+
+    def __contains__(self, model_id):
+        return model_id in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def model_ids(self):
+        return list(self.index)
+
+    def is_fresh(self, pdb_path):
+        row = self.index.get(structure_model_id(pdb_path))
+        if row is None or not os.path.exists(self.array_path(row["model_id"])):
+            return False
+        st = os.stat(pdb_path)
+        return (row["source_size"], row["source_mtime_ns"]) == (st.st_size, st.st_mtime_ns)
+
+    def save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        pd.DataFrame(list(self.index.values()), columns=SUMMARY_COLUMNS).to_csv(tmp_path, sep='\t', index=False)
+        os.replace(tmp_path, self.index_path)
+
+    def add(self, pdb_path, save_index=True):
+        # I convert one PDB (skipped when the stored copy is up to date) and return its model ID.
+        model_id = structure_model_id(pdb_path)
+        if not self.is_fresh(pdb_path):
+            self.loaded.pop(model_id, None)
+            self.index[model_id] = convert_model(pdb_path, self.array_path(model_id))
+            if save_index:
+                self.save_index()
+        return model_id
+
+    @timed("structure_store.add_folder")
+    def add_folder(self, folder, workers=None):
+        # I convert every .pdb / .pdb.gz in folder in a process pool. Rank-prefixed links to the same
+        # model (01_AF-...pdb next to AF-...pdb) are converted only once.
+        todo = {}
+        for name in sorted(os.listdir(folder)):
+            if name.endswith((".pdb", ".pdb.gz")):
+                path = os.path.join(folder, name)
+                model_id = structure_model_id(name)
+                if model_id not in todo and not self.is_fresh(path):
+                    todo[model_id] = path
+        if todo:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(convert_model, path, self.array_path(model_id))
+                           for model_id, path in todo.items()]
+                for future in futures:
+                    row = future.result()
+                    self.loaded.pop(row["model_id"], None)
+                    self.index[row["model_id"]] = row
+            self.save_index()
+        print(f"🧱 {len(todo)} models converted, {len(self.index)} in store {self.root}")
+        return list(todo)
+
+    # === Access ===
+    def load(self, model_id):
+        # The full atom array, memory-mapped: nothing is read from disk until a field is used.
+        if model_id not in self.loaded:
+            if model_id not in self.index:
+                raise KeyError(model_id)
+            self.loaded[model_id] = np.load(self.array_path(model_id), mmap_mode='r')
+        return self.loaded[model_id]
+
+    def ca(self, model_id):
+        atoms = self.load(model_id)
+        return atoms[(atoms["atom"] == b"CA") & ~atoms["hetero"]]
+
+    def ca_coords(self, model_id):
+        # (residues, 3) float32 CA trace and the matching residue numbers.
+        ca = self.ca(model_id)
+        return np.ascontiguousarray(ca["coord"]), np.asarray(ca["res_seq"])
+
+    def plddt(self, model_id):
+        # Per-residue pLDDT (the CA B-factor in AlphaFold models).
+        return np.asarray(self.ca(model_id)["b_factor"])
+
+    def summaries(self, model_ids=None):
+        # Per-model summary table straight from the index.
+        df = pd.DataFrame(list(self.index.values()), columns=SUMMARY_COLUMNS)
+        if model_ids is not None:
+            df = df[df["model_id"].isin(model_ids)]
+        return df.reset_index(drop=True)
@@ -1,64 +1,49 @@
 # summarize.py
 
 import os
-import pandas as pd
+import instrumentation
+from m8_reader import query_accession
+from results_store import ResultsStore
+
+
+def hit_queries(path):
+    # Query accessions of a hits_<category>_uncharacterized.txt file (the first column of its m8 lines).
+    # A missing file simply means an empty category.
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return set(query_accession(line.split('\t')[0]) for line in f if line.strip())
+
+
+instrumentation.start_run("summarize")
 
 # Define paths
 structure_folder = "top_hit_structures"
 results_folder = "prostt5_uncharacterized_results"
 summary_output = os.path.join(results_folder, "top_hits_summary_final.csv")
+database_path = os.path.join(results_folder, "results.sqlite")
+# The categories come from the routed hit files of the uncharacterized run, next to the .m8 files.
+category_files = {name: os.path.join(results_folder, f"hits_{name}_uncharacterized.txt")
+                  for name in ("upregulated", "downregulated", "significant")}
 
-# Load categorized hits
-with open(os.path.join(results_folder, "hits_upregulated_uncharacterized.txt")) as f:
-    upregulated = set(line.split('\t')[0] for line in f if line.strip())
-
-with open(os.path.join(results_folder, "hits_downregulated_uncharacterized.txt")) as f:
-    downregulated = set(line.split('\t')[0] for line in f if line.strip())
-
-with open(os.path.join(results_folder, "hits_significant_uncharacterized.txt")) as f:
-    significant = set(line.split('\t')[0] for line in f if line.strip())
-
-# Detect actual downloaded structures
-downloaded_targets = set()
-for file in os.listdir(structure_folder):
-    if file.endswith(".pdb"):
-        parts = file.split("_", 1)
-        if len(parts) == 2:
-            target_id = parts[1].replace(".pdb", "")
-            downloaded_targets.add(target_id)
+# Load everything into the local results database. Unchanged .m8 files are skipped,
+# so a rerun only pays for what changed.
+store = ResultsStore(database_path)
+store.load_categories({name: hit_queries(path) for name, path in category_files.items()})
 
-print(f"🔎 Detected {len(downloaded_targets)} downloaded AlphaFold structures.")
+m8_files = sorted(os.path.join(results_folder, file) for file in os.listdir(results_folder) if file.endswith(".m8"))
+for path, count in store.load_m8_files(m8_files).items():
+    print(f"📂 {path}: " + (f"loaded {count} hits" if count else "unchanged"))
 
-# Read and parse each .m8 file to find matching hits
-hits = []
-for file in os.listdir(results_folder):
-    if file.endswith(".m8"):
-        path = os.path.join(results_folder, file)
-        with open(path) as f:
-            for line in f:
-                parts = line.strip().split('\t')
-                if len(parts) >= 12:
-                    query, target, bitscore = parts[0], parts[1], float(parts[11])
-                    if target in downloaded_targets:
-                        category = (
-                            "Upregulated" if query in upregulated else
-                            "Downregulated" if query in downregulated else
-                            "Significant" if query in significant else
-                            "Uncategorized"
-                        )
-                        hits.append({
-                            "query_id": query,
-                            "target_id": target,
-                            "bitscore": bitscore,
-                            "category": category
-                        })
+downloaded = store.load_structures(structure_folder)
+print(f"🔎 Detected {downloaded} downloaded AlphaFold structures.")
 
-# Create and save DataFrame
-df_hits = pd.DataFrame(hits)
+# Hits to downloaded structures with their DE category, best bitscore first (one indexed query)
+df_hits = store.top_hits_summary()
+store.close()
 
 if df_hits.empty:
     print("⚠️ No matches found between Foldseek results and downloaded structures.")
 else:
-    df_hits_sorted = df_hits.sort_values(by="bitscore", ascending=False)
-    df_hits_sorted.to_csv(summary_output, index=False)
+    df_hits.to_csv(summary_output, index=False)
     print("✅ Final summary written to:", summary_output)
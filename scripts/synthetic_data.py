@@ -0,0 +1,212 @@
+# Script: synthetic_data.py
+# Purpose: Deterministic fake inputs (m8 tables, FASTA files, Foldseek result archives, AlphaFold-like PDBs)
+#          at any scale, for benchmarks and dry runs of the pipeline.
+
+# ======================= OVERVIEW ==========================
+# The real inputs are a few hundred S. mutans proteins, which says nothing about what happens with a
+# whole proteome or a metagenome. The generators here make inputs that look like the real ones:
+# - accessions follow the UniProt format and queries use the "sp|ACC|NAME_STRMU" headers of the DE FASTA,
+# - m8 tables have the 12 default Foldseek columns with AlphaFold ("AF-...-F1-model_v4"), PDB and ESM
+#   targets, and are written in vectorized chunks so 10^7 hits stay cheap to produce,
+# - FASTA records carry "Uncharacterized protein" in a configurable fraction of headers,
+# - Foldseek web-server archives contain one alis_<db>.m8 member per database, like the real .tar.gz,
+# - PDB models have N/CA/C/O backbone atoms along a smooth 3D path, pLDDT in the B-factor column and END records.
+# Everything is driven by a seed, so the same call always writes the same bytes.
+
+import io        # I use this to build tar members in memory.
+import os        # I use this for paths.
+import tarfile   # I use this to write Foldseek-style result archives.
+import zlib      # I use crc32 to turn model IDs into seeds.
+
+import numpy as np
+import pandas as pd
+
+from m8_reader import M8_COLUMNS
+
+AMINO_ACIDS = np.array(list("ACDEFGHIKLMNPQRSTVWY"))
+THREE_LETTER = {
+    "A": "ALA", "C": "CYS", "D": "ASP", "E": "GLU", "F": "PHE", "G": "GLY", "H": "HIS", "I": "ILE",
+    "K": "LYS", "L": "LEU", "M": "MET", "N": "ASN", "P": "PRO", "Q": "GLN", "R": "ARG", "S": "SER",
+    "T": "THR", "V": "VAL", "W": "TRP", "Y": "TYR",
+}
+DIGITS = np.array(list("0123456789"))
+ALNUM = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"))
+WEB_DATABASES = ["afdb50", "afdb-swissprot", "afdb-proteome", "pdb100", "mgnify_esm30"]
+
+
+# === Identifiers ===
+def make_accessions(n, seed=0):
+    # n distinct UniProt-style accessions ([OPQ][0-9][A-Z0-9]{3}[0-9]) in a fixed order.
+    rng = np.random.default_rng(seed)
+    found = {}
+    while len(found) < n:
+        k = (n - len(found)) * 2
+        parts = [rng.choice(np.array(list("OPQ")), k), rng.choice(DIGITS, k),
+                 rng.choice(ALNUM, k), rng.choice(ALNUM, k), rng.choice(ALNUM, k), rng.choice(DIGITS, k)]
+        for accession in map("".join, zip(*parts)):
+            found.setdefault(accession, None)
+    return list(found)[:n]
+
+
+def query_header(accession):
+    return f"sp|{accession}|{accession}_STRMU"
+
+
+def alphafold_model(accession):
+    return f"AF-{accession}-F1-model_v4"
+
+
+# === m8 tables ===
+def m8_vocabulary(n_queries, n_targets, seed=0, af_fraction=0.8):
+    # Query headers and target IDs: mostly AlphaFold models, the rest split between PDB chains and ESM models.
+    rng = np.random.default_rng(seed)
+    queries = np.array([query_header(acc) for acc in make_accessions(n_queries, seed)])
+    kinds = rng.random(n_targets)
+    targets = np.array([
+        alphafold_model(acc) if kind < af_fraction else
+        (f"{acc[1:5].lower()}-assembly1.cif.gz_A" if kind < (1 + af_fraction) / 2 else f"MGYP{int(kind * 1e12):012d}.pdb.gz")
+        for acc, kind in zip(make_accessions(n_targets, seed + 1), kinds)
+    ])
+    return queries, targets
+
+
+def m8_frame(n_hits, queries, targets, seed=0):
+    # n_hits rows of Foldseek output drawn from the given queries and targets, grouped by query.
+    rng = np.random.default_rng(seed)
+    q_index = np.sort(rng.integers(0, len(queries), n_hits))
+    alnlen = rng.integers(30, 600, n_hits).astype(np.int32)
+    q_start = rng.integers(1, 50, n_hits).astype(np.int32)
+    t_start = rng.integers(1, 50, n_hits).astype(np.int32)
+    bitscore = np.round(rng.gamma(2.0, 150.0, n_hits)).astype(np.float32) + 20
+    return pd.DataFrame({
+        "query": queries[q_index],
+        "target": targets[rng.integers(0, len(targets), n_hits)],
+        "fident": np.round(rng.uniform(0.05, 0.6, n_hits), 3).astype(np.float32),
+        "alnlen": alnlen,
+        "mismatch": (alnlen * rng.uniform(0.4, 0.9, n_hits)).astype(np.int32),
+        "gap_open": rng.integers(0, 15, n_hits).astype(np.int32),
+        "q_start": q_start,
+        "q_end": q_start + alnlen - 1,
+        "t_start": t_start,
+        "t_end": t_start + alnlen - 1,
+        "evalue": np.exp(-bitscore / 25.0) * rng.uniform(0.5, 2.0, n_hits) * 10,
+        "bitscore": bitscore,
+    }, columns=M8_COLUMNS)
+
+
+def write_m8(path, n_hits, n_queries=None, n_targets=None, seed=0, af_fraction=0.8, chunk_hits=1_000_000):
+    # I write the table in chunks so the memory needed does not grow with n_hits.
+    # By default there are ~100 hits per query and each target is hit ~4 times.
+    queries, targets = m8_vocabulary(n_queries or max(1, n_hits // 100), n_targets or max(1, n_hits // 4),
+                                     seed, af_fraction)
+    with open(path, 'w') as out:
+        for i, start in enumerate(range(0, n_hits, chunk_hits)):
+            frame = m8_frame(min(chunk_hits, n_hits - start), queries, targets, seed + i)
+            frame.to_csv(out, sep='\t', header=False, index=False, float_format="%.6g")
+    return path
+
+
+# === FASTA ===
+def write_fasta(path, n_records, seed=0, mean_length=300, uncharacterized_fraction=0.3, accessions=None,
+                line_width=60):
+    # UniProt-style records; about uncharacterized_fraction of them are "Uncharacterized protein".
+    rng = np.random.default_rng(seed)
+    accessions = accessions if accessions is not None else make_accessions(n_records, seed)
+    lengths = np.clip(rng.gamma(4.0, mean_length / 4.0, len(accessions)).astype(int), 30, 5000)
+    names = rng.random(len(accessions))
+    residues = rng.choice(AMINO_ACIDS, int(lengths.sum()))
+    offset = 0
+    with open(path, 'w') as out:
+        for accession, length, name in zip(accessions, lengths, names):
+            description = "Uncharacterized protein" if name < uncharacterized_fraction else f"Putative enzyme {int(name * 1000)}"
+            out.write(f">{query_header(accession)} {description} OS=Streptococcus mutans OX=210007 PE=4 SV=1\n")
+            sequence = "".join(residues[offset:offset + length])
+            offset += length
+            for i in range(0, length, line_width):
+                out.write(sequence[i:i + line_width] + "\n")
+    return accessions
+
+
+def write_accession_lists(folder, accessions, seed=0, fractions=(0.3, 0.3)):
+    # upregulated / downregulated / all_significant lists, as preprocessing_FoldSeek_input.py writes them.
+    rng = np.random.default_rng(seed)
+    draw = rng.random(len(accessions))
+    up = [acc for acc, x in zip(accessions, draw) if x < fractions[0]]
+    down = [acc for acc, x in zip(accessions, draw) if fractions[0] <= x < fractions[0] + fractions[1]]
+    paths = {}
+    for name, values in (("upregulated", up), ("downregulated", down), ("significant", up + down)):
+        filename = "all_significant_accessions.txt" if name == "significant" else f"{name}_accessions.txt"
+        paths[name] = os.path.join(folder, filename)
+        with open(paths[name], 'w') as f:
+            f.writelines(acc + "\n" for acc in values)
+    return paths
+
+
+# === Foldseek web-server archives ===
+def write_foldseek_archive(path, n_hits_per_database, query="query", databases=WEB_DATABASES, seed=0,
+                           uncharacterized_fraction=0.2):
+    # A .tar.gz like the web server returns: one alis_<db>.m8 member per database, with the target
+    # description after the model ID in the second column.
+    rng = np.random.default_rng(seed)
+    with tarfile.open(path, 'w:gz') as tar:
+        for d, database in enumerate(databases):
+            queries, targets = m8_vocabulary(1, max(1, n_hits_per_database // 2), seed + d)
+            frame = m8_frame(n_hits_per_database, np.array([query]), targets, seed + d)
+            labels = np.where(rng.random(len(frame)) < uncharacterized_fraction,
+                              " Uncharacterized protein", " Putative enzyme")
+            frame["target"] = frame["target"].astype(str) + labels
+            data = frame.to_csv(sep='\t', header=False, index=False, float_format="%.6g").encode()
+            info = tarfile.TarInfo(f"alis_{database}.m8")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return path
+
+
+# === PDB models ===
+def model_seed(model_id):
+    return zlib.crc32(model_id.encode())
+
+
+def pdb_text(n_residues, seed=0, model_id="AF-SYNTH-F1-model_v4"):
+    # An AlphaFold-like PDB: backbone atoms along a smooth random 3D path, pLDDT in the B-factor column.
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(size=(n_residues, 3))
+    for _ in range(3):  # smoothing makes the trace look more like a folded chain than pure noise
+        steps[1:] = 0.6 * steps[1:] + 0.4 * steps[:-1]
+    steps = steps / np.linalg.norm(steps, axis=1, keepdims=True) * 3.8
+    ca = np.cumsum(steps, axis=0)
+    plddt = np.clip(rng.normal(85, 12, n_residues), 20, 99)
+    sequence = rng.choice(AMINO_ACIDS, n_residues)
+    offsets = {"N": (-1.2, 0.5, 0.0), "CA": (0.0, 0.0, 0.0), "C": (1.3, 0.4, 0.2), "O": (1.9, 1.3, 0.6)}
+    elements = {"N": "N", "CA": "C", "C": "C", "O": "O"}
+
+    lines = ["HEADER    SYNTHETIC MODEL", f"TITLE     {model_id}"]
+    serial = 1
+    for i in range(n_residues):
+        residue = THREE_LETTER[sequence[i]]
+        for atom, (dx, dy, dz) in offsets.items():
+            x, y, z = ca[i] + (dx, dy, dz)
+            lines.append(f"ATOM  {serial:5d}  {atom:<3s} {residue} A{i + 1:4d}    "
+                         f"{x:8.3f}{y:8.3f}{z:8.3f}  1.00{plddt[i]:6.2f}           {elements[atom]}  ")
+            serial += 1
+    lines.append(f"TER   {serial:5d}      {THREE_LETTER[sequence[-1]]} A{n_residues:4d}")
+    lines.append("END")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def model_pdb(model_id, min_residues=80, max_residues=600):
+    # The same model ID always gives the same structure, which the mock AlphaFold server relies on.
+    seed = model_seed(model_id)
+    length = min_residues + seed % (max_residues - min_residues + 1)
+    return pdb_text(length, seed, model_id)
+
+
+def write_pdb_models(folder, model_ids, min_residues=80, max_residues=600):
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for model_id in model_ids:
+        path = os.path.join(folder, f"{model_id}.pdb")
+        with open(path, 'wb') as f:
+            f.write(model_pdb(model_id, min_residues, max_residues))
+        paths.append(path)
+    return paths
@@ -0,0 +1,97 @@
+# Script: top_hits.py
+# Purpose: Pick the best Foldseek hits per query in one streaming pass over any number of .m8 files.
+
+# ======================= OVERVIEW ==========================
+# download.py used to load every hit, sort the whole table by bitscore and drop duplicates, and the
+# WIP download.py sorted a list of every line just to take the first top_n. That needs memory for
+# all hits, which is fine for afdb_swissprot but not for afdb50 or mgnify hit sets.
+# Here I read each line once and keep only what can still end up in the answer:
+# - a small min-heap of the k best hits for every query, and optionally
+# - one min-heap of the best N hits overall.
+# E-value cutoffs, target prefixes (like "AF-") and AnnotationFilters on the target column
+# (annotation_filter.py) are applied while streaming, so filtered lines are never stored. Memory is O(queries × k), no matter how many hits the files contain.
+# When two hits have the same score, the one that appeared first in the input wins.
+
+import gzip     # I use this so compressed .m8.gz files can be scanned too.
+import heapq    # I use heaps to keep only the k best hits.
+import os       # I use this to name the source file of each hit.
+
+from m8_reader import M8_COLUMNS
+
+QUERY, TARGET, EVALUE, BITSCORE = 0, 1, 10, 11  # Column positions in Foldseek's default .m8 output.
+
+
+def open_text(path):
+    return gzip.open(path, 'rt') if path.endswith(".gz") else open(path, 'r')
+
+
+def iter_hits(paths, evalue_cutoff=None, target_prefix=None, target_filter=None):
+    # I yield (source_db, fields) for every line that passes the inline filters.
+    # target_prefix can be a string or a tuple of strings, just like str.startswith.
+    # target_filter is an AnnotationFilter screening the target column (IDs plus descriptions on the web server).
+    for path in paths:
+        source = os.path.basename(path)
+        with open_text(path) as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) <= BITSCORE:
+                    continue
+                if target_prefix and not fields[TARGET].startswith(target_prefix):
+                    continue
+                if target_filter is not None and target_filter.match(fields[TARGET]) is None:
+                    continue
+                if evalue_cutoff is not None and not float(fields[EVALUE]) < evalue_cutoff:
+                    continue
+                yield source, fields
+
+
+def select_top_hits(paths, k=1, global_top_n=None, evalue_cutoff=None, target_prefix=None, target_filter=None):
+    # I return (per_query, overall):
+    # - per_query maps each query to its k best hits, best first (None if k is 0/None),
+    # - overall is the global_top_n best hits across everything, best first (None if not requested).
+    # Each hit is (bitscore, source_db, fields).
+    per_query = {} if k else None
+    overall = [] if global_top_n else None
+
+    for order, (source, fields) in enumerate(iter_hits(paths, evalue_cutoff, target_prefix, target_filter)):
+        score = float(fields[BITSCORE])
+        # The negative order makes earlier lines rank higher on ties, and heappushpop then drops the latest.
+        item = (score, -order, source, fields)
+        if per_query is not None:
+            heap = per_query.setdefault(fields[QUERY], [])
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+        if overall is not None:
+            if len(overall) < global_top_n:
+                heapq.heappush(overall, item)
+            elif item > overall[0]:
+                heapq.heapreplace(overall, item)
+
+    def ranked(heap):
+        return [(score, source, fields) for score, _, source, fields in sorted(heap, reverse=True)]
+
+    if per_query is not None:
+        per_query = {query: ranked(heap) for query, heap in per_query.items()}
+    if overall is not None:
+        overall = ranked(overall)
+    return per_query, overall
+
+
+def hits_to_frame(hits, source_column="source_db"):
+    # I turn selected hits into a typed DataFrame with the same columns m8_reader uses.
+    import pandas as pd
+    from m8_reader import M8_DTYPES
+    rows = [fields[:len(M8_COLUMNS)] + [source] for _, source, fields in hits]
+    df = pd.DataFrame(rows, columns=M8_COLUMNS + [source_column])
+    return df.astype({**M8_DTYPES, source_column: "category"})
+
+
+def top_hits_per_query(paths, k=1, evalue_cutoff=None, target_prefix=None, target_filter=None):
+    # Convenience wrapper: the k best hits of every query as one DataFrame, best hits first.
+    per_query, _ = select_top_hits(paths, k=k, evalue_cutoff=evalue_cutoff, target_prefix=target_prefix,
+                                   target_filter=target_filter)
+    hits = [hit for query_hits in per_query.values() for hit in query_hits]
+    hits.sort(key=lambda hit: hit[0], reverse=True)
+    return hits_to_frame(hits)
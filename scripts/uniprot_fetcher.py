@@ -0,0 +1,209 @@
+# Script: uniprot_fetcher.py
+# Purpose: Fetch FASTA sequences for many UniProt accessions at once.
+
+# ======================= OVERVIEW ==========================
+# download_fasta_from_uniprot.py used to send one request per accession and then sleep
+# for half a second, which meant minutes for my 339 DE proteins and hours for a whole proteome.
+# Here I group accessions into batches and ask UniProt's stream endpoint for each batch with a
+# single "accession:A OR accession:B ..." query. The batches run on a small thread pool that shares
+# one keep-alive session, and an adaptive rate limiter slows everything down only when UniProt
+# actually tells me to (HTTP 429 / Retry-After) instead of sleeping blindly between requests.
+# The fetch is resumable: accessions already present in the output FASTA are skipped.
+# A batch that UniProt rejects (4xx) is split in halves down to single accessions, so one malformed
+# accession only costs itself, and a batch that still fails after the retries is reported as missing.
+# The base URL is a parameter so the whole thing can be pointed at a local stand-in server.
+
+import os         # I use this to check whether the output FASTA already exists.
+import threading  # I use a lock so the worker threads share one rate limiter safely.
+import time       # I use this to pace requests and to honor Retry-After.
+from concurrent.futures import ThreadPoolExecutor  # I use this to keep a few batches in flight.
+from email.utils import parsedate_to_datetime      # Retry-After may be given as an HTTP date.
+
+import requests   # I use this to talk to the UniProt REST API.
+from requests.adapters import HTTPAdapter
+
+from fasta_index import header_accession  # Same accession parsing as the local FASTA index.
+from instrumentation import count, instrument_session, timer  # Request, retry and timing records.
+
+UNIPROT_BASE_URL = "https://rest.uniprot.org"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# === Rate limiting ===
+class AdaptiveRateLimiter:
+    # I keep a minimum spacing between requests. It starts at min_interval, grows whenever the
+    # server pushes back, and shrinks slowly again after successful responses.
+    def __init__(self, min_interval=0.0, max_interval=60.0, backoff=2.0, recovery=0.9):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.recovery = recovery
+        self.interval = min_interval
+        self.next_allowed = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        # I reserve the next request slot under the lock and sleep outside of it.
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_allowed)
+            self.next_allowed = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def success(self):
+        with self.lock:
+            self.interval = max(self.min_interval, self.interval * self.recovery)
+
+    def throttled(self, retry_after=None):
+        # I widen the spacing and, if the server said how long to wait, I block every worker
+        # until that moment has passed.
+        with self.lock:
+            self.interval = min(self.max_interval, max(self.interval * self.backoff, 0.5))
+            pause = retry_after if retry_after is not None else self.interval
+            self.next_allowed = max(self.next_allowed, time.monotonic() + pause)
+
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date.
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# === FASTA helpers ===
+def existing_accessions(fasta_path):
+    # I collect the accessions that are already in the output file so a rerun can skip them.
+    done = set()
+    if os.path.exists(fasta_path):
+        with open(fasta_path, 'r') as f:
+            for line in f:
+                if line.startswith('>'):
+                    done.add(header_accession(line.strip()))
+    return done
+
+
+def split_fasta_records(text):
+    # I split a FASTA response into (accession, record_text) pairs.
+    records = []
+    for chunk in text.split('\n>'):
+        chunk = chunk.strip()
+        if not chunk:
+            continue
+        if not chunk.startswith('>'):
+            chunk = '>' + chunk
+        records.append((header_accession(chunk.split('\n', 1)[0]), chunk + '\n'))
+    return records
+
+
+def make_session(pool_size=8):
+    # One pooled keep-alive session is shared by all worker threads.
+    session = instrument_session(requests.Session())
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# === Fetching ===
+def fetch_batch(session, accessions, limiter, base_url=UNIPROT_BASE_URL, max_retries=5, timeout=60):
+    # I request a whole batch through the stream endpoint, which returns every match without paging.
+    query = " OR ".join(f"accession:{acc}" for acc in accessions)
+    url = f"{base_url}/uniprotkb/stream"
+    params = {"format": "fasta", "query": query}
+
+    for attempt in range(max_retries + 1):
+        limiter.wait()
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+        except requests.RequestException as e:
+            if attempt == max_retries:
+                raise
+            print(f"⚠️ Network error for a batch of {len(accessions)} ({e}), retrying...")
+            count("uniprot.retries")
+            limiter.throttled()
+            continue
+
+        if response.status_code == 200:
+            limiter.success()
+            return response.text
+        if response.status_code in RETRY_STATUSES and attempt < max_retries:
+            count("uniprot.retries")
+            limiter.throttled(parse_retry_after(response.headers.get("Retry-After")))
+            continue
+        if 400 <= response.status_code < 500 and response.status_code not in RETRY_STATUSES:
+            # A client error (e.g. 400 for one malformed accession) rejects the whole OR query, so I split the
+            # batch and ask for the halves until the bad accession is on its own; that one is then just missing.
+            if len(accessions) == 1:
+                print(f"⚠️ UniProt rejected {accessions[0]} (HTTP {response.status_code})")
+                count("uniprot.rejected")
+                return ""
+            count("uniprot.splits")
+            half = len(accessions) // 2
+            return "".join(fetch_batch(session, part, limiter, base_url, max_retries, timeout)
+                           for part in (accessions[:half], accessions[half:]))
+        response.raise_for_status()
+        return ""
+    return ""
+
+
+def fetch_fasta(accessions, output_fasta, batch_size=100, workers=4, base_url=UNIPROT_BASE_URL,
+                min_interval=0.0, max_retries=5, resume=True, session=None):
+    # I fetch every accession that is not yet in output_fasta and append the records as batches finish.
+    # The return value maps "written" and "missing" to the accessions in each group.
+    wanted = list(dict.fromkeys(acc.strip() for acc in accessions if acc.strip()))
+    done = existing_accessions(output_fasta) if resume else set()
+    todo = [acc for acc in wanted if acc not in done]
+    print(f"Loaded {len(wanted)} accessions, {len(wanted) - len(todo)} already in {output_fasta}, "
+          f"{len(todo)} to fetch")
+
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    limiter = AdaptiveRateLimiter(min_interval=min_interval)
+    owns_session = session is None
+    if owns_session:
+        session = make_session(pool_size=workers)
+
+    written, missing = [], []
+    mode = 'a' if resume else 'w'
+    try:
+        with timer("uniprot.fetch_fasta", accessions=len(todo), batches=len(batches)), \
+                open(output_fasta, mode) as outfile, ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(fetch_batch, session, batch, limiter, base_url, max_retries)
+                       for batch in batches]
+            # I consume the batches in submission order so the output keeps the input order,
+            # and I flush after every batch so an interrupted run can resume where it stopped.
+            for i, (batch, future) in enumerate(zip(batches, futures)):
+                requested = set(batch)
+                got = set()
+                try:
+                    text = future.result()
+                except requests.RequestException as e:
+                    # Retries ran out (server errors or the network): I count the batch as missing and carry on.
+                    print(f"❌ Batch {i+1} failed after {max_retries} retries ({e})")
+                    text = ""
+                for acc, record in split_fasta_records(text):
+                    if acc in requested and acc not in got:
+                        outfile.write(record)
+                        got.add(acc)
+                outfile.flush()
+                written.extend(acc for acc in batch if acc in got)
+                missing.extend(acc for acc in batch if acc not in got)
+                print(f"[{i+1}/{len(batches)}] Downloaded {len(got)}/{len(batch)} sequences")
+    finally:
+        if owns_session:
+            session.close()
+
+    count("uniprot.written", len(written))
+    count("uniprot.missing", len(missing))
+    if missing:
+        print(f"⚠️ {len(missing)} accessions were not returned by UniProt: {', '.join(missing[:10])}"
+              + (" ..." if len(missing) > 10 else ""))
+    return {"written": written, "missing": missing}
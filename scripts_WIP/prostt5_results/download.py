@@ -1,5 +1,11 @@
 import os
+import sys
 import requests
+
+# I share the structure cache that lives next to the main scripts.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+from structure_cache import StructureCache, link_or_copy
+from top_hits import select_top_hits
 ### This is an intermediate script that I made to download the top hits from the result.m8 files of the databases  I ran. It then downloads the AlphaFold structures.
 # === CONFIGURABLE PARAMETERS ===
 m8_file = "results.m8"  # <-- I will change this for each result file
@@ -9,18 +15,19 @@ top_n = 10  # <-- How many top hits to process
 # === Ensure output directory exists ===
 os.makedirs(output_folder, exist_ok=True)
 
-# === Read and sort the .m8 file by bit score (column 12) ===
-print(f"Reading and sorting {m8_file}...")
-with open(m8_file) as f:
-    lines = [line.strip().split('\t') for line in f]
-
-# Sort by bit score (column 12) in descending order
-sorted_lines = sorted(lines, key=lambda x: float(x[11]), reverse=True)
-top_hits = sorted_lines[:top_n]
+# === Stream the .m8 file and keep the best hits by bit score (column 12) ===
+# Only top_n hits are ever held in memory, no matter how large the result file is.
+print(f"Scanning {m8_file}...")
+_, best = select_top_hits([m8_file], k=None, global_top_n=top_n)
+top_hits = [fields for _, _, fields in best]
 
 print(f"Found {len(top_hits)} top hits.")
 
 # === Download each target structure ===
+# Each structure is stored once in the shared cache and once as a plain file named after the target.
+# The rank-prefixed name is just a link to that file, so no PDB is duplicated on disk.
+structure_cache = StructureCache()
+
 for i, hit in enumerate(top_hits):
     query_id, target_id = hit[0], hit[1]
     structure_file = os.path.join(output_folder, f"{i+1:02d}_{target_id}.pdb")
@@ -29,22 +36,25 @@ for i, hit in enumerate(top_hits):
     if target_id.upper().startswith("AF-"):
         # Likely AlphaFold ID
         uniprot_id = target_id.split("-")[1]
-        url = f"https://alphafold.ebi.ac.uk/files/AF-{uniprot_id}-F1-model_v4.pdb"
+        model_id = f"AF-{uniprot_id}-F1-model_v4"
+        url = f"https://alphafold.ebi.ac.uk/files/{model_id}.pdb"
     elif len(target_id) == 4 and target_id.isalnum():
         # Likely PDB ID
+        model_id = target_id.lower()
         url = f"https://files.rcsb.org/download/{target_id.upper()}.pdb"
     else:
         print(f"[{i+1}] Skipping unknown format: {target_id}")
         continue
 
-    # Download structure
-    print(f"[{i+1}] Downloading {target_id} from: {url}")
-    response = requests.get(url)
-    if response.status_code == 200:
-        with open(structure_file, 'w') as out:
-            out.write(response.text)
-        print(f"✅ Saved to {structure_file}")
-    else:
-        print(f"❌ Failed to download {target_id} (status {response.status_code})")
+    # Download structure (or reuse the cached copy)
+    print(f"[{i+1}] Fetching {target_id} from: {url}")
+    try:
+        _, downloaded = structure_cache.fetch(model_id, url=url)
+    except requests.HTTPError as e:
+        print(f"❌ Failed to download {target_id} (status {e.response.status_code})")
+        continue
+    canonical_file = structure_cache.materialize(model_id, os.path.join(output_folder, f"{model_id}.pdb"))
+    how = link_or_copy(canonical_file, structure_file)
+    print(f"✅ Saved to {structure_file} ({'downloaded' if downloaded else 'cached'}, {how})")
 
 print("🎉 Done downloading top hit structures!")